@@ -0,0 +1,111 @@
+import argparse
+import logging
+import os
+import random
+import tempfile
+import time
+
+from textbook_assembler.utils.references import (
+    BibtexCache,
+    get_referenced_bibtex_data,
+    load_bibtex_data,
+    load_bibtex_entries,
+)
+
+ENTRY = """@article{{{key},
+  title = {{{title}}},
+  author = {{{author} and Sims, Eric}},
+  journal = aer,
+  volume = {{{volume}}},
+  pages = {{{start}--{end}}},
+  year = {{{year}}},
+  month = jan,
+  url = {{https://example.com/{key}.pdf}},
+}}
+
+"""
+
+
+def write_bibliography(path, n_entries, seed=0):
+    rng = random.Random(seed)
+    words = ["Real", "Business", "Cycles", "{RBC}", "Open", "Economy", "Models", "Growth"]
+    with open(path, "w") as file:
+        file.write('@string{aer = "American Economic Review"}\n\n')
+        for i in range(n_entries):
+            start = rng.randint(1, 900)
+            file.write(
+                ENTRY.format(
+                    key=f"ref{i}",
+                    title=" ".join(rng.choices(words, k=6)),
+                    author=f"Author{i}, First",
+                    volume=rng.randint(1, 110),
+                    start=start,
+                    end=start + rng.randint(5, 40),
+                    year=rng.randint(1950, 2024),
+                )
+            )
+
+    return [f"ref{i}" for i in rng.sample(range(n_entries), 30)]
+
+
+def full_parse(path, ref_dict):
+    return get_referenced_bibtex_data(load_bibtex_data(path), ref_dict)
+
+
+def scanned(path, ref_dict):
+    return get_referenced_bibtex_data(load_bibtex_entries(path, ref_dict), ref_dict)
+
+
+def cached(cache, path, ref_dict):
+    return get_referenced_bibtex_data(cache.load(path, ref_dict), ref_dict)
+
+
+def timed(f, *args):
+    start = time.perf_counter()
+    result = f(*args)
+    return time.perf_counter() - start, result
+
+
+def run(n_entries):
+    with tempfile.TemporaryDirectory() as tempdir:
+        path = os.path.join(tempdir, "shared.bib")
+        ref_dict = dict.fromkeys(write_bibliography(path, n_entries))
+        cache_dir = os.path.join(tempdir, "cache")
+
+        full_time, expected = timed(full_parse, path, ref_dict)
+        scan_time, result = timed(scanned, path, ref_dict)
+        assert result == expected
+        cold_time, _ = timed(cached, BibtexCache(cache_dir), path, ref_dict)
+        # A new process finds the parsed entries on disk
+        warm_time, result = timed(cached, BibtexCache(cache_dir), path, ref_dict)
+        assert result == expected
+
+    return {
+        "entries": n_entries,
+        "full_seconds": full_time,
+        "scan_seconds": scan_time,
+        "cold_cache_seconds": cold_time,
+        "warm_cache_seconds": warm_time,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark loading 30 entries of a bibliography")
+    parser.add_argument("--entries", type=int, nargs="+", default=[1_000, 5_000, 20_000])
+    args = parser.parse_args()
+
+    # The extra entries warning lists every unused ID
+    logging.getLogger("textbook_assembler").setLevel(logging.ERROR)
+    for n_entries in args.entries:
+        result = run(n_entries)
+        print(
+            f"{result['entries']:>6} entries: "
+            f"full parse {result['full_seconds'] * 1000:9.1f} ms, "
+            f"scanned {result['scan_seconds'] * 1000:7.1f} ms, "
+            f"cache cold {result['cold_cache_seconds'] * 1000:7.1f} ms, "
+            f"warm {result['warm_cache_seconds'] * 1000:6.1f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
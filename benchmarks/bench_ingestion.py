@@ -0,0 +1,118 @@
+import argparse
+import os
+import random
+import tempfile
+import time
+import warnings
+
+import dateutil
+import pandas as pd
+from unidecode import unidecode_expect_ascii
+
+from textbook_assembler.utils.constants import EXPECTED_DTYPES
+from textbook_assembler.utils.data import (
+    clean_string_data,
+    drop_empty_rows,
+    load_input_data,
+    lowercase_columns,
+    validate_column_names,
+    validate_datatypes,
+)
+
+TOPICS = ["Consumption, Savings", "Permanent Income Hypothesis", "Économie ouverte", "RBC Models"]
+
+
+def write_lesson_plan(path, n_rows, date_format, seed=0):
+    rng = random.Random(seed)
+    rows_per_week = 5
+    # Dates stay within one academic year so that formats without a year still parse
+    dates = pd.date_range("2023-09-04", periods=40, freq="7D")
+
+    rows = []
+    for i in range(n_rows):
+        week = i // rows_per_week
+        page_start = rng.randint(1, 400)
+        rows.append(
+            {
+                "Week": week + 1,
+                "Date": dates[week % len(dates)].strftime(date_format),
+                "Topic": rng.choice(TOPICS),
+                "Reference": f"ref{rng.randint(0, 200)}",
+                "Chapter": rng.choice([None, rng.randint(1, 20)]),
+                "page_start": page_start,
+                "page_end": page_start + rng.randint(1, 30),
+            }
+        )
+    pd.DataFrame(rows).to_csv(path, index=False)
+
+
+def legacy_ingest(path):
+    data = pd.read_csv(path)
+    data = lowercase_columns(data)
+    data["date"] = data["date"].map(dateutil.parser.parse)
+    data = drop_empty_rows(data)
+    validate_column_names(data)
+    for column in data.columns:
+        if data[column].dtype != EXPECTED_DTYPES[column]:
+            data[column].astype(EXPECTED_DTYPES[column])
+    cols = ["topic", "reference"]
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", FutureWarning)
+        data[cols] = data[cols].applymap(unidecode_expect_ascii)
+    return data
+
+
+def current_ingest(path):
+    data = load_input_data(path)
+    validate_column_names(data)
+    validate_datatypes(data)
+    return clean_string_data(data)
+
+
+def time_call(f, *args, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = f(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def run(n_rows, date_format, repeat=3):
+    with tempfile.TemporaryDirectory() as tempdir:
+        path = os.path.join(tempdir, "lesson_plan.csv")
+        write_lesson_plan(path, n_rows, date_format)
+
+        legacy_time, legacy = time_call(legacy_ingest, path, repeat=repeat)
+        current_time, current = time_call(current_ingest, path, repeat=repeat)
+
+    pd.testing.assert_frame_equal(legacy, current, check_dtype=False)
+
+    return {
+        "rows": n_rows,
+        "date_format": date_format,
+        "legacy_seconds": legacy_time,
+        "current_seconds": current_time,
+        "speedup": legacy_time / current_time,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark lesson plan ingestion")
+    parser.add_argument("--rows", type=int, nargs="+", default=[1_000, 10_000, 50_000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    for date_format in ["%Y-%m-%d", "%d-%b"]:
+        for n_rows in args.rows:
+            result = run(n_rows, date_format, repeat=args.repeat)
+            print(
+                f"{result['rows']:>7} rows, dates {date_format:<9}: "
+                f"legacy {result['legacy_seconds'] * 1000:8.1f} ms, "
+                f"current {result['current_seconds'] * 1000:7.1f} ms, "
+                f"{result['speedup']:5.1f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+import argparse
+import os
+import tempfile
+import time
+from io import BytesIO
+
+from pypdf import PdfReader, PdfWriter
+
+from benchmarks.synthetic import write_source_pdf
+from textbook_assembler.utils.page_import import import_pages
+
+VARIANTS = {
+    "append": None,
+    "lean": {},
+    "lean_no_outline": {"outline": False},
+    "lean_no_links": {"outline": False, "links": False},
+}
+
+
+def slices(n_pages, n_slices, pages_per_slice):
+    step = n_pages // n_slices
+    return [(i * step, i * step + pages_per_slice) for i in range(n_slices)]
+
+
+def assemble(path, page_slices, settings):
+    # A fresh reader each time, so every variant pays for parsing the same objects
+    reader = PdfReader(path)
+    writer = PdfWriter()
+    start = time.perf_counter()
+    for page_slice in page_slices:
+        if settings is None:
+            writer.append(reader, pages=page_slice)
+        else:
+            import_pages(writer, reader, page_slice, **settings)
+    seconds = time.perf_counter() - start
+
+    buffer = BytesIO()
+    writer.write(buffer)
+    return {
+        "seconds": seconds,
+        "objects": sum(obj is not None for obj in writer._objects),
+        "bytes": len(buffer.getvalue()),
+        "pages": len(writer.pages),
+    }
+
+
+def run(n_pages, n_slices, pages_per_slice):
+    with tempfile.TemporaryDirectory() as tempdir:
+        path = os.path.join(tempdir, "textbook.pdf")
+        write_source_pdf(path, n_pages, "Textbook", bookmarks=True, links=True)
+        page_slices = slices(n_pages, n_slices, pages_per_slice)
+
+        return {name: assemble(path, page_slices, settings) for name, settings in VARIANTS.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark importing slices of a bookmarked PDF")
+    parser.add_argument("--pages", type=int, nargs="+", default=[500, 2000])
+    parser.add_argument("--slices", type=int, default=20)
+    parser.add_argument("--pages_per_slice", type=int, default=10)
+    args = parser.parse_args()
+
+    for n_pages in args.pages:
+        results = run(n_pages, args.slices, args.pages_per_slice)
+        print(f"{n_pages} page source, {args.slices} slices of {args.pages_per_slice} pages:")
+        for name, result in results.items():
+            print(
+                f"  {name:<16} {result['seconds'] * 1000:9.1f} ms, "
+                f"{result['objects']:>6} objects, {result['bytes'] / 1024:8.1f} KiB"
+            )
+
+
+if __name__ == "__main__":
+    main()
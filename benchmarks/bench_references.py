@@ -0,0 +1,90 @@
+import argparse
+import random
+import string
+import time
+
+from textbook_assembler.utils.references import (
+    FilenameIndex,
+    find_by_full_name,
+    find_by_partial_name,
+)
+
+
+def make_file_names(n_files, seed=0):
+    rng = random.Random(seed)
+    names = set()
+    while len(names) < n_files:
+        stem = "".join(rng.choices(string.ascii_letters + "_-", k=rng.randint(12, 40)))
+        names.add(f"{stem}.pdf")
+
+    return sorted(names, key=lambda _: rng.random())
+
+
+def make_references(file_names, n_refs, seed=0):
+    rng = random.Random(seed)
+    refs = {}
+    for i, fname in enumerate(rng.sample(file_names, n_refs)):
+        # Half of the references use the "..." shorthand with a prefix long enough to be unique
+        refs[f"ref{i}"] = fname.upper() if i % 2 else fname[:12] + "..."
+
+    return refs
+
+
+def linear_match(refs, all_files):
+    out = {}
+    for ref, maybe_path in refs.items():
+        f = find_by_partial_name if maybe_path.endswith("...") else find_by_full_name
+        out[ref] = f(maybe_path, all_files)
+    return out
+
+
+def indexed_match(refs, all_files):
+    index = FilenameIndex(all_files)
+    return {ref: index.find(maybe_path) for ref, maybe_path in refs.items()}
+
+
+def time_call(f, *args, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = f(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def run(n_files, n_refs, repeat=3):
+    all_files = make_file_names(n_files)
+    refs = make_references(all_files, n_refs)
+
+    linear_time, linear = time_call(linear_match, refs, all_files, repeat=repeat)
+    indexed_time, indexed = time_call(indexed_match, refs, all_files, repeat=repeat)
+    assert linear == indexed
+
+    return {
+        "files": n_files,
+        "refs": n_refs,
+        "linear_seconds": linear_time,
+        "indexed_seconds": indexed_time,
+        "speedup": linear_time / indexed_time,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark reference to filename matching")
+    parser.add_argument("--files", type=int, nargs="+", default=[1_000, 10_000, 50_000])
+    parser.add_argument("--refs", type=int, default=300)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    for n_files in args.files:
+        result = run(n_files, min(args.refs, n_files), repeat=args.repeat)
+        print(
+            f"{result['files']:>7} files, {result['refs']:>4} refs: "
+            f"linear {result['linear_seconds'] * 1000:9.1f} ms, "
+            f"indexed {result['indexed_seconds'] * 1000:7.1f} ms, "
+            f"{result['speedup']:6.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
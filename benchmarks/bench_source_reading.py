@@ -0,0 +1,119 @@
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+
+from pypdf import PdfReader, PdfWriter
+
+from benchmarks.synthetic import write_source_pdf
+from textbook_assembler.utils.readers import SourceFile
+from textbook_assembler.utils.tracing import format_bytes, peak_rss_bytes
+
+# How a source is handed to PdfReader: its path, which pypdf reads into memory in full, an open
+# file, or a SourceFile, which maps it
+MODES = ["path", "file", "mmap"]
+
+# Reading page counts and sizes, like the PDF index does, and extracting page ranges, like a build
+OPERATIONS = ["index", "extract"]
+
+
+MEMORY_FIELDS = {"VmHWM": "peak_rss", "RssAnon": "anonymous", "RssFile": "file_backed"}
+
+
+def memory_status():
+    # Peak, anonymous and file-backed resident memory, where /proc reports them. ru_maxrss can't
+    # be used for the peak on Linux, as it carries over the parent's peak through exec.
+    try:
+        with open("/proc/self/status") as file:
+            status = file.read()
+    except OSError:
+        return {"peak_rss": peak_rss_bytes()}
+    return {
+        MEMORY_FIELDS[key]: int(value) * 1024
+        for key, value in re.findall(r"^(\w+):\s+(\d+) kB", status, re.MULTILINE)
+        if key in MEMORY_FIELDS
+    }
+
+
+def read_source(path, mode, operation, n_slices, pages_per_slice):
+    start = time.perf_counter()
+    with open(path, "rb") as file, SourceFile(path, use_mmap=mode == "mmap") as source:
+        reader = PdfReader({"path": path, "file": file, "mmap": source.stream}[mode])
+        if operation == "index":
+            sizes = [(page.mediabox.width, page.mediabox.height) for page in reader.pages]
+            pages = len(sizes)
+        else:
+            writer = PdfWriter()
+            step = len(reader.pages) // n_slices
+            for i in range(n_slices):
+                writer.append(reader, pages=(i * step, i * step + pages_per_slice))
+            pages = len(writer.pages)
+
+        return {
+            "seconds": time.perf_counter() - start,
+            "pages": pages,
+            **memory_status(),
+        }
+
+
+def run_isolated(path, mode, operation, n_slices, pages_per_slice):
+    # Each measurement runs in a fresh interpreter so peak RSS only covers that one read
+    args = [path, mode, operation, str(n_slices), str(pages_per_slice)]
+    result = subprocess.run(
+        [sys.executable, "-m", "benchmarks.bench_source_reading", "--worker", *args],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(result.stdout)
+
+
+def run(n_pages, scan_bytes, n_slices, pages_per_slice):
+    with tempfile.TemporaryDirectory() as tempdir:
+        path = os.path.join(tempdir, "scanned.pdf")
+        write_source_pdf(path, n_pages, "Scanned reader", scan_bytes=scan_bytes)
+        # Warm the page cache so every mode reads the same cached file
+        with open(path, "rb") as file:
+            while file.read(1 << 24):
+                pass
+
+        results = {
+            (operation, mode): run_isolated(path, mode, operation, n_slices, pages_per_slice)
+            for operation in OPERATIONS
+            for mode in MODES
+        }
+        return os.path.getsize(path), results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark memory use of reading source PDFs")
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--scan_kb", type=int, default=1024)
+    parser.add_argument("--slices", type=int, default=10)
+    parser.add_argument("--pages_per_slice", type=int, default=5)
+    parser.add_argument("--worker", nargs=5, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker is not None:
+        path, mode, operation, n_slices, pages_per_slice = args.worker
+        result = read_source(path, mode, operation, int(n_slices), int(pages_per_slice))
+        print(json.dumps(result))
+        return
+
+    size, results = run(args.pages, args.scan_kb * 1024, args.slices, args.pages_per_slice)
+    print(f"{args.pages} page source of {format_bytes(size)}:")
+    for (operation, mode), result in results.items():
+        print(
+            f"  {operation:<8} {mode:<5} {result['seconds'] * 1000:9.1f} ms, "
+            f"peak RSS {format_bytes(result['peak_rss']):>9}, "
+            f"anonymous {format_bytes(result.get('anonymous')):>9}, "
+            f"file-backed {format_bytes(result.get('file_backed')):>9}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from functools import partial
+from unittest import mock
+
+import pypdf
+
+from benchmarks.synthetic import generate_course
+from textbook_assembler import __version__
+from textbook_assembler.tests.cover_sheets import blank_cover_sheets
+from textbook_assembler.utils import make_text
+from textbook_assembler.utils.data import load_and_process_data
+from textbook_assembler.utils.latex import generate_cover_sheets
+
+ASSEMBLY_STAGES = {
+    "assemble_textbook": {},
+    "assemble_textbook_streaming": {"streaming": True},
+    "assemble_textbook_parallel_extract": {"parallel_extract": True, "max_workers": os.cpu_count()},
+}
+DEFAULT_RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+
+def latex_available():
+    return shutil.which("latexmk") is not None or shutil.which("pdflatex") is not None
+
+
+@contextmanager
+def cover_sheet_stage(use_latex):
+    # Without a TeX installation the assembly stages still run, with blank pages standing in for
+    # the cover sheets, so PDF parsing and writing can be measured on any machine
+    if use_latex:
+        yield
+    else:
+        with mock.patch.object(make_text, "generate_cover_sheets", blank_cover_sheets):
+            yield
+
+
+def time_stage(f, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        f()
+        timings.append(time.perf_counter() - start)
+
+    return {"best": min(timings), "mean": sum(timings) / len(timings), "runs": timings}
+
+
+def run_suite(config, repeat=3, skip_latex=False):
+    use_latex = latex_available() and not skip_latex
+    stages = {}
+
+    with tempfile.TemporaryDirectory() as tempdir:
+        inputs = generate_course(os.path.join(tempdir, "course"), **config)
+        out_dir = os.path.join(tempdir, "output")
+        os.makedirs(out_dir)
+
+        load = partial(load_and_process_data, **_data_kwargs(inputs))
+        stages["load_and_process_data"] = time_stage(load, repeat)
+        data = load()
+
+        if use_latex:
+
+            def cover_sheets():
+                with tempfile.TemporaryDirectory() as cover_dir:
+                    generate_cover_sheets(data, inputs["bibtex_path"], out_path=cover_dir)
+
+            stages["generate_cover_sheets"] = time_stage(cover_sheets, repeat)
+
+        with cover_sheet_stage(use_latex):
+            for name, kwargs in ASSEMBLY_STAGES.items():
+                out_path = os.path.join(out_dir, f"{name}.pdf")
+                assemble = partial(
+                    make_text.assemble_textbook, **inputs, out_path=out_path, **kwargs
+                )
+                stages[name] = time_stage(assemble, repeat)
+                stages[name]["output_bytes"] = os.path.getsize(out_path)
+                stages[name]["pages"] = len(pypdf.PdfReader(out_path).pages)
+
+    return {
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "version": __version__,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "pypdf": pypdf.__version__,
+        "latex": use_latex,
+        "config": config,
+        "repeat": repeat,
+        "stages": stages,
+    }
+
+
+def _data_kwargs(inputs):
+    return {
+        "path": inputs["data_path"],
+        "pdf_path": inputs["pdf_path"],
+        "reference_path": inputs["ref_path"],
+        "bibtex_path": inputs["bibtex_path"],
+    }
+
+
+def compare(result, baseline, threshold):
+    regressions = []
+    for name, stage in result["stages"].items():
+        if name not in baseline["stages"]:
+            continue
+        ratio = stage["best"] / baseline["stages"][name]["best"]
+        flag = "REGRESSION" if ratio > 1 + threshold else ""
+        print(f"{name:<30} {ratio:6.2f}x baseline {flag}")
+        if flag:
+            regressions.append(name)
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time each pipeline stage on a synthetic course")
+    parser.add_argument("--weeks", type=int, default=15)
+    parser.add_argument("--rows_per_week", type=int, default=3)
+    parser.add_argument("--pages_per_pdf", type=int, default=50)
+    parser.add_argument("--n_pdfs", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--skip_latex", action="store_true", help="Skip LaTeX dependent stages")
+    parser.add_argument("--output", type=str, default=None, help="Path of the JSON results file")
+    parser.add_argument("--compare", type=str, default=None, help="Baseline JSON results file")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="Relative slowdown against the baseline that counts as a regression",
+    )
+    args = parser.parse_args()
+
+    config = {
+        "weeks": args.weeks,
+        "rows_per_week": args.rows_per_week,
+        "pages_per_pdf": args.pages_per_pdf,
+        "n_pdfs": args.n_pdfs,
+    }
+    result = run_suite(config, repeat=args.repeat, skip_latex=args.skip_latex)
+
+    for name, stage in result["stages"].items():
+        print(
+            f"{name:<30} best {stage['best'] * 1000:9.1f} ms, mean {stage['mean'] * 1000:9.1f} ms"
+        )
+
+    output = args.output
+    if output is None:
+        os.makedirs(DEFAULT_RESULTS_DIR, exist_ok=True)
+        stamp = result["timestamp"].replace(":", "-")
+        output = os.path.join(DEFAULT_RESULTS_DIR, f"{stamp}.json")
+    with open(output, "w") as file:
+        json.dump(result, file, indent=2)
+    print(f"Results written to {output}")
+
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        if baseline["config"] != config:
+            print("Warning: baseline was run with a different configuration")
+        if compare(result, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
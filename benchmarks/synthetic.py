@@ -0,0 +1,159 @@
+import os
+import random
+
+import pandas as pd
+import yaml
+from pypdf import PdfWriter
+from pypdf.annotations import Link
+from pypdf.generic import (
+    DecodedStreamObject,
+    DictionaryObject,
+    NameObject,
+    NumberObject,
+)
+
+TOPICS = [
+    "Consumption and Savings",
+    "Permanent Income Hypothesis",
+    "Labor Supply",
+    "Real Business Cycles",
+    "Fiscal Policy",
+    "Économie ouverte",
+]
+
+
+def _font(writer):
+    font = DictionaryObject(
+        {
+            NameObject("/Type"): NameObject("/Font"),
+            NameObject("/Subtype"): NameObject("/Type1"),
+            NameObject("/BaseFont"): NameObject("/Helvetica"),
+        }
+    )
+    return writer._add_object(font)
+
+
+def _scan(writer, n_bytes):
+    # A grayscale image of incompressible noise, standing in for a scanned page
+    side = int(n_bytes**0.5)
+    image = DecodedStreamObject()
+    image.set_data(os.urandom(side * side))
+    image.update(
+        {
+            NameObject("/Type"): NameObject("/XObject"),
+            NameObject("/Subtype"): NameObject("/Image"),
+            NameObject("/Width"): NumberObject(side),
+            NameObject("/Height"): NumberObject(side),
+            NameObject("/ColorSpace"): NameObject("/DeviceGray"),
+            NameObject("/BitsPerComponent"): NumberObject(8),
+        }
+    )
+    return writer._add_object(image)
+
+
+def write_source_pdf(path, n_pages, title, bookmarks=False, links=False, scan_bytes=0):
+    writer = PdfWriter()
+    font = _font(writer)
+
+    for page_number in range(1, n_pages + 1):
+        page = writer.add_blank_page(width=612, height=792)
+        resources = DictionaryObject(
+            {NameObject("/Font"): DictionaryObject({NameObject("/F1"): font})}
+        )
+        page[NameObject("/Resources")] = resources
+        lines = [f"{title}, page {page_number}"] + [
+            f"Line {i} of synthetic reading material" for i in range(40)
+        ]
+        text = " ".join(f"({line}) Tj 0 -16 Td" for line in lines)
+        scan = ""
+        if scan_bytes > 0:
+            resources[NameObject("/XObject")] = DictionaryObject(
+                {NameObject("/Scan"): _scan(writer, scan_bytes)}
+            )
+            scan = "q 612 0 0 792 0 0 cm /Scan Do Q "
+        content = DecodedStreamObject()
+        content.set_data(f"{scan}BT /F1 11 Tf 72 720 Td {text} ET".encode())
+        page[NameObject("/Contents")] = writer._add_object(content)
+
+        if bookmarks:
+            writer.add_outline_item(f"Section {page_number}", page_number - 1)
+
+    if links:
+        # Like a textbook's cross references: a named destination per page, and links back to
+        # the contents and on to the next page
+        for page_number in range(n_pages):
+            writer.add_named_destination(f"page{page_number + 1}", page_number)
+            for target, rect in [
+                (0, (72, 40, 200, 60)),
+                ((page_number + 1) % n_pages, (400, 40, 540, 60)),
+            ]:
+                writer.add_annotation(page_number, Link(rect=rect, target_page_index=target))
+
+    with open(path, "wb") as file:
+        writer.write(file)
+
+
+def generate_course(
+    out_dir,
+    weeks=15,
+    rows_per_week=3,
+    pages_per_pdf=50,
+    n_pdfs=10,
+    bookmarks=False,
+    seed=0,
+):
+    rng = random.Random(seed)
+    pdf_dir = os.path.join(out_dir, "pdfs")
+    os.makedirs(pdf_dir, exist_ok=True)
+
+    refs = {}
+    bibtex = []
+    for i in range(n_pdfs):
+        ref = f"SRC{i}"
+        fname = f"source_{i:04d}_{rng.choice(TOPICS).split()[0].lower()}_notes.pdf"
+        write_source_pdf(os.path.join(pdf_dir, fname), pages_per_pdf, ref, bookmarks=bookmarks)
+
+        # Alternate between full names and the "..." shorthand so both lookups are exercised
+        refs[ref] = fname if i % 2 else f"source_{i:04d}..."
+        bibtex.append(
+            f"@misc{{{ref},\n"
+            f"    title = {{Synthetic Lecture Notes {i}}},\n"
+            f"    author = {{Author, Example}},\n"
+            f"    howpublished = {{Lecture Notes}},\n"
+            f"    year = {{{2000 + i % 25}}},\n"
+            f"    url = {{https://example.com/{fname}}}\n"
+            "}\n"
+        )
+
+    dates = pd.date_range("2023-09-04", periods=weeks, freq="7D")
+    rows = []
+    for week in range(weeks):
+        for _ in range(rows_per_week):
+            start = rng.randint(1, pages_per_pdf)
+            end = min(pages_per_pdf, start + rng.randint(0, 20))
+            whole_document = rng.random() < 0.1
+            rows.append(
+                {
+                    "Week": week + 1,
+                    "Date": dates[week].strftime("%Y-%m-%d"),
+                    "Topic": TOPICS[week % len(TOPICS)],
+                    "Reference": f"SRC{rng.randrange(n_pdfs)}",
+                    "Chapter": rng.choice([None, rng.randint(1, 20)]),
+                    "page_start": None if whole_document else start,
+                    "page_end": None if whole_document else end,
+                }
+            )
+
+    paths = {
+        "data_path": os.path.join(out_dir, "lesson_plan.csv"),
+        "pdf_path": pdf_dir,
+        "ref_path": os.path.join(out_dir, "ref_to_file.yaml"),
+        "bibtex_path": os.path.join(out_dir, "citations.bib"),
+    }
+    pd.DataFrame(rows).to_csv(paths["data_path"], index=False)
+    with open(paths["ref_path"], "w") as file:
+        yaml.safe_dump(refs, file)
+    with open(paths["bibtex_path"], "w") as file:
+        file.write("\n".join(bibtex))
+
+    return paths
@@ -1,18 +1,78 @@
 import argparse
+import copy
 import logging
+import os
 import sys
+from functools import partial
 from typing import Sequence
 
-from textbook_assembler.utils.make_text import assemble_textbook
+# Only modules that are cheap to import are loaded here. The build stages pull in pandas, pypdf
+# and pylatex, so run() imports them once it knows which stage is needed, and --help or validate
+# don't pay for the PDF and LaTeX stack.
+from textbook_assembler.utils.constants import (
+    COVER_SHEET_BACKENDS,
+    DEFAULT_HOST,
+    DEFAULT_PORT,
+)
+from textbook_assembler.utils.pdf_index import default_index_path
+from textbook_assembler.utils.tracing import tracing
+from textbook_assembler.utils.watch import DEFAULT_DEBOUNCE, DEFAULT_INTERVAL
+
+COMMANDS = ("build", "validate")
+TRACE_SUFFIX = ".trace.json"
+DEFAULT_SERVE_DIR = ".textbook_assembler_service"
+
+# Options that control how the program runs rather than what a single course build looks like
+SESSION_OPTIONS = {
+    "command",
+    "dry_run",
+    "batch",
+    "batch_jobs",
+    "watch",
+    "watch_interval",
+    "debounce",
+    "serve",
+    "host",
+    "port",
+    "serve_jobs",
+    "serve_dir",
+    "profile",
+    "profile_path",
+}
+
+# Options a build service client may set. Which files a build reads and where it writes, and how
+# many processes it uses, come from the command line the service was started with.
+SERVICE_OPTIONS = {
+    "cover_backend",
+    "streaming",
+    "parallel_extract",
+    "dedupe",
+    "image_dpi",
+    "jpeg_quality",
+    "recompress_streams",
+    "compress_content",
+    "lean_import",
+    "drop_outline",
+    "drop_links",
+    "drop_forms",
+}
 
 _log = logging.getLogger("textbook_assembler")
 
 
-def parse_args(args: Sequence[str] = None):
+def parse_args(args: Sequence[str] = None, namespace=None):
     if args is None:
         args = []
 
     parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "command",
+        nargs="?",
+        default="build",
+        choices=COMMANDS,
+        help="build assembles the textbook. validate checks the lesson plan columns, references, "
+        "source file matches and page ranges without building anything",
+    )
     parser.add_argument(
         "--lesson_path",
         "-l",
@@ -53,8 +113,254 @@ def parse_args(args: Sequence[str] = None):
         default="materials/ref_to_file.yaml",
         help="Path to YAML with mapping between bibtex references and source files",
     )
+    parser.add_argument(
+        "--jobs",
+        "-j",
+        type=int,
+        required=False,
+        default=1,
+        help="Number of CPU-bound build tasks, like extracting weeks' source pages, to run in "
+        "parallel",
+    )
+    parser.add_argument(
+        "--latex_jobs",
+        type=int,
+        required=False,
+        default=None,
+        help="Number of weekly cover sheets to compile in parallel. Defaults to --jobs",
+    )
+    parser.add_argument(
+        "--dry_run",
+        "--dry-run",
+        action="store_true",
+        help="Load the lesson plan and print the tasks a build would run, without compiling "
+        "cover sheets or writing the textbook",
+    )
+    parser.add_argument(
+        "--cover_backend",
+        type=str,
+        required=False,
+        default="latex",
+        choices=COVER_SHEET_BACKENDS,
+        help="How cover sheets are built: one LaTeX document per week, a single LaTeX pass "
+        "split into weeks, or native, which writes the PDF pages directly without a TeX "
+        "installation",
+    )
+    parser.add_argument(
+        "--cache_dir",
+        type=str,
+        required=False,
+        default=None,
+        help="Directory for caching compiled cover sheets between builds. Caching is disabled if "
+        "not provided",
+    )
+    parser.add_argument(
+        "--cache_size",
+        type=int,
+        required=False,
+        default=256,
+        help="Maximum size of --cache_dir in megabytes, shared between the cached cover sheets, "
+        "optimized streams and parsed bibtex",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Only rebuild weeks whose inputs changed since the build recorded in the manifest "
+        "next to the output file",
+    )
+    parser.add_argument(
+        "--streaming",
+        action="store_true",
+        help="Write each week to the output file as soon as it is assembled, keeping memory "
+        "bounded by the largest week. Source bookmarks are not copied in this mode",
+    )
+    parser.add_argument(
+        "--parallel_extract",
+        action="store_true",
+        help="Extract each week's source pages into a separate PDF, --jobs at a time, and "
+        "concatenate them with the cover sheets. The output is the same for any number of jobs",
+    )
+    parser.add_argument(
+        "--dedupe",
+        action="store_true",
+        help="Share identical objects (fonts, images, repeated pages' content) across the "
+        "assembled textbook and report the bytes saved",
+    )
+    parser.add_argument(
+        "--image_dpi",
+        type=int,
+        required=False,
+        default=None,
+        help="Downsample images that are denser than this resolution on the page. Needs Pillow",
+    )
+    parser.add_argument(
+        "--jpeg_quality",
+        type=int,
+        required=False,
+        default=None,
+        help="Re-encode RGB and grayscale images as JPEG at this quality (1-95) when that makes "
+        "them smaller. Needs Pillow",
+    )
+    parser.add_argument(
+        "--recompress_streams",
+        action="store_true",
+        help="Recompress every stream in the output with the best zlib compression, losslessly",
+    )
+    parser.add_argument(
+        "--compress_content",
+        action="store_true",
+        help="Compress page content streams that were stored uncompressed",
+    )
+    parser.add_argument(
+        "--lean_import",
+        action="store_true",
+        help="Import source pages without their named destinations and article threads, cloning "
+        "only what the selected pages reference. Links into pages that aren't included are "
+        "dropped",
+    )
+    parser.add_argument(
+        "--drop_outline",
+        action="store_true",
+        help="Don't copy the bookmarks of the source PDFs. Needs --lean_import",
+    )
+    parser.add_argument(
+        "--drop_links",
+        action="store_true",
+        help="Don't copy link annotations from the source PDFs. Needs --lean_import",
+    )
+    parser.add_argument(
+        "--drop_forms",
+        action="store_true",
+        help="Don't copy form fields from the source PDFs. Needs --lean_import",
+    )
+    parser.add_argument(
+        "--split_weeks",
+        action="store_true",
+        help="Also write one PDF per week, sliced from the assembled textbook",
+    )
+    parser.add_argument(
+        "--split_dir",
+        type=str,
+        required=False,
+        default=None,
+        help="Directory for the weekly PDFs written by --split_weeks. Defaults to a directory "
+        "named after the output file with a _weeks suffix",
+    )
+    parser.add_argument(
+        "--pdf_index",
+        type=str,
+        required=False,
+        default=None,
+        help="Path of the persistent page count and metadata index for the source PDFs. Defaults "
+        "to a file in --cache_dir, or next to the output file without a cache directory",
+    )
+    parser.add_argument(
+        "--no_pdf_index",
+        action="store_true",
+        help="Don't read or write a persistent PDF index",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Time each stage of the build, print a summary table and write a Chrome trace file",
+    )
+    parser.add_argument(
+        "--profile_path",
+        type=str,
+        required=False,
+        default=None,
+        help="Path of the trace file written by --profile. Defaults to the output path with a "
+        f"{TRACE_SUFFIX} suffix",
+    )
+
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="Keep running and rebuild the textbook incrementally whenever the lesson plan, "
+        "reference YAML, bibtex file or a source PDF changes",
+    )
+    parser.add_argument(
+        "--watch_interval",
+        type=float,
+        required=False,
+        default=DEFAULT_INTERVAL,
+        help="Seconds between checks for changed inputs in watch mode",
+    )
+    parser.add_argument(
+        "--debounce",
+        type=float,
+        required=False,
+        default=DEFAULT_DEBOUNCE,
+        help="Seconds the inputs must be unchanged before a rebuild starts in watch mode",
+    )
+    parser.add_argument(
+        "--batch",
+        type=str,
+        required=False,
+        default=None,
+        help="Path to a YAML file listing several courses to build in one run. Each course sets "
+        "options by their long names, on top of the options given on the command line",
+    )
+    parser.add_argument(
+        "--batch_jobs",
+        type=int,
+        required=False,
+        default=1,
+        help="Number of courses to build in parallel in batch mode",
+    )
+
+    parser.add_argument(
+        "--serve",
+        action="store_true",
+        help="Run a local HTTP build service for the course given on the command line. POST a "
+        "JSON build config, with build options such as streaming or dedupe by their long names, "
+        "to /build and download the result from the returned URL",
+    )
+    parser.add_argument(
+        "--host",
+        type=str,
+        required=False,
+        default=DEFAULT_HOST,
+        help="Address the build service listens on",
+    )
+    parser.add_argument(
+        "--port",
+        type=int,
+        required=False,
+        default=DEFAULT_PORT,
+        help="Port the build service listens on",
+    )
+    parser.add_argument(
+        "--serve_jobs",
+        type=int,
+        required=False,
+        default=1,
+        help="Number of builds the build service runs in parallel",
+    )
+    parser.add_argument(
+        "--serve_dir",
+        type=str,
+        required=False,
+        default=DEFAULT_SERVE_DIR,
+        help="Directory where the build service keeps its builds and output cache",
+    )
+
+    return parser.parse_args(args, namespace=namespace)
+
+
+def resolve_index_path(parser_args):
+    if parser_args.no_pdf_index:
+        return None
+
+    index_dir = parser_args.cache_dir or os.path.dirname(parser_args.output_path)
+    return parser_args.pdf_index or default_index_path(parser_args.source_dir, index_dir)
 
-    return parser.parse_args(args)
+
+def resolve_profile_path(parser_args):
+    if not parser_args.profile:
+        return None
+
+    return parser_args.profile_path or parser_args.output_path + TRACE_SUFFIX
 
 
 def parsed_args_to_kwargs(parser_args):
@@ -64,10 +370,138 @@ def parsed_args_to_kwargs(parser_args):
         "ref_path": parser_args.ref_path,
         "bibtex_path": parser_args.bibtex_path,
         "out_path": parser_args.output_path,
+        "max_workers": parser_args.jobs,
+        "max_subprocesses": parser_args.latex_jobs,
+        "cover_backend": parser_args.cover_backend,
+        "cache_dir": parser_args.cache_dir,
+        "cache_size": parser_args.cache_size * 1024 * 1024,
+        "incremental": parser_args.incremental,
+        "streaming": parser_args.streaming,
+        "parallel_extract": parser_args.parallel_extract,
+        "index_path": resolve_index_path(parser_args),
+        "split_weeks": parser_args.split_weeks,
+        "dedupe": parser_args.dedupe,
+        "split_dir": parser_args.split_dir,
+        "image_dpi": parser_args.image_dpi,
+        "jpeg_quality": parser_args.jpeg_quality,
+        "recompress_streams": parser_args.recompress_streams,
+        "compress_content": parser_args.compress_content,
+        "lean_import": parser_args.lean_import,
+        "import_outline": not parser_args.drop_outline,
+        "import_links": not parser_args.drop_links,
+        "import_forms": not parser_args.drop_forms,
     }
 
 
+def course_to_args(course):
+    args = []
+    for key, value in course.items():
+        if value is True:
+            args.append(f"--{key}")
+        elif value is not False and value is not None:
+            args.extend([f"--{key}", str(value)])
+
+    return args
+
+
+def apply_course_options(parser_args, course, label):
+    unknown = set(course) - (set(vars(parser_args)) - SESSION_OPTIONS)
+    if len(unknown) > 0:
+        raise ValueError(f'{label} has unknown options: {", ".join(sorted(unknown))}')
+
+    # Options given on the command line are the defaults for every course
+    return parse_args(course_to_args(course), namespace=copy.copy(parser_args))
+
+
+def load_batch_courses(parser_args):
+    from textbook_assembler.utils.batch import load_batch_config
+
+    courses = []
+    for i, course in enumerate(load_batch_config(parser_args.batch)):
+        course = dict(course)
+        name = course.pop("name", None)
+        label = f"Course {name or i + 1} in {parser_args.batch}"
+
+        course_args = apply_course_options(parser_args, course, label)
+        courses.append((name or course_args.output_path, parsed_args_to_kwargs(course_args)))
+
+    return courses
+
+
+def course_to_kwargs(parser_args, course):
+    restricted = (set(course) & set(vars(parser_args))) - SERVICE_OPTIONS
+    if len(restricted) > 0:
+        raise ValueError(f'Build config can\'t set {", ".join(sorted(restricted))}')
+
+    return parsed_args_to_kwargs(apply_course_options(parser_args, course, "Build config"))
+
+
+def run(parser_args):
+    modes = [f"--{mode}" for mode in ["watch", "batch", "serve"] if getattr(parser_args, mode)]
+    if len(modes) > 1:
+        raise ValueError(f"{' and '.join(modes)} can't be combined")
+
+    if parser_args.dry_run and (parser_args.command == "validate" or len(modes) > 0):
+        raise ValueError(f"--dry_run can't be combined with {(modes or ['validate'])[0]}")
+
+    if parser_args.command == "validate":
+        from textbook_assembler.utils.validate import validate_courses
+
+        if parser_args.watch or parser_args.serve:
+            raise ValueError(f"validate can't be combined with {modes[0]}")
+        if parser_args.batch:
+            courses = load_batch_courses(parser_args)
+        else:
+            courses = [(parser_args.output_path, parsed_args_to_kwargs(parser_args))]
+        if len(validate_courses(courses)) > 0:
+            raise SystemExit(1)
+    elif parser_args.serve:
+        from textbook_assembler.utils.service import serve
+
+        serve(
+            partial(course_to_kwargs, parser_args),
+            parser_args.serve_dir,
+            host=parser_args.host,
+            port=parser_args.port,
+            max_workers=parser_args.serve_jobs,
+        )
+    elif parser_args.watch:
+        from textbook_assembler.utils.watch import watch
+
+        watch(
+            parsed_args_to_kwargs(parser_args),
+            interval=parser_args.watch_interval,
+            debounce=parser_args.debounce,
+        )
+    elif parser_args.batch:
+        from textbook_assembler.utils.batch import build_batch
+
+        build_batch(load_batch_courses(parser_args), max_workers=parser_args.batch_jobs)
+    elif parser_args.dry_run:
+        from textbook_assembler.utils.make_text import assemble_textbook
+        from textbook_assembler.utils.plan import format_plan
+
+        # An up to date build has no plan, assemble_textbook logs that there is nothing to do
+        report = assemble_textbook(**parsed_args_to_kwargs(parser_args), dry_run=True)
+        if not report["up_to_date"]:
+            print(format_plan(report["plan"]))
+    else:
+        from textbook_assembler.utils.make_text import assemble_textbook
+
+        assemble_textbook(**parsed_args_to_kwargs(parser_args))
+
+
 def main():
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
     args = parse_args(sys.argv[1:])
-    kwargs = parsed_args_to_kwargs(args)
-    assemble_textbook(**kwargs)
+
+    profile_path = resolve_profile_path(args)
+    if profile_path is None:
+        run(args)
+        return
+
+    with tracing() as tracer:
+        run(args)
+    tracer.write(profile_path)
+    _log.info(tracer.format_summary())
+    _log.info(f"Trace written to {profile_path}")
@@ -0,0 +1,20 @@
+import pytest
+
+from textbook_assembler.tests.cover_sheets import (
+    blank_cover_sheets as write_blank_cover_sheets,
+)
+from textbook_assembler.utils import make_text
+from textbook_assembler.utils.records import as_lesson_plan
+
+
+@pytest.fixture
+def blank_cover_sheets(monkeypatch):
+    # Stands in for LaTeX so the assembly stages can be tested without a TeX installation
+    compiled = []
+
+    def fake_generate_cover_sheets(data, bibtex_path, out_path=None, **kwargs):
+        compiled.extend(as_lesson_plan(data).weeks)
+        return write_blank_cover_sheets(data, bibtex_path, out_path)
+
+    monkeypatch.setattr(make_text, "generate_cover_sheets", fake_generate_cover_sheets)
+    return compiled
@@ -0,0 +1,133 @@
+import os
+import sys
+from unittest.mock import patch
+
+import pytest
+import yaml
+from pypdf import PdfReader
+
+from textbook_assembler.main import load_batch_courses, main, parse_args
+from textbook_assembler.utils.batch import (
+    BatchBuildError,
+    SharedResources,
+    build_batch,
+    load_batch_config,
+)
+
+LOCAL_INPUTS = {
+    "data_path": "textbook_assembler/tests/resources/csvs/test_local.csv",
+    "pdf_path": "textbook_assembler/tests/resources/pdfs",
+    "ref_path": "textbook_assembler/tests/resources/config/ref_to_file_local.yaml",
+    "bibtex_path": "textbook_assembler/tests/resources/bibtex/test2.bib",
+}
+
+
+def test_load_batch_config(tmpdir):
+    path = f"{tmpdir}/batch.yaml"
+    with open(path, "w") as file:
+        yaml.safe_dump(
+            {
+                "defaults": {"source_dir": "pdfs", "streaming": True},
+                "courses": [{"name": "a", "output_path": "a.pdf"}, {"streaming": False}],
+            },
+            file,
+        )
+
+    courses = load_batch_config(path)
+    assert courses == [
+        {"source_dir": "pdfs", "streaming": True, "name": "a", "output_path": "a.pdf"},
+        {"source_dir": "pdfs", "streaming": False},
+    ]
+
+    with open(path, "w") as file:
+        yaml.safe_dump({"defaults": {}}, file)
+    with pytest.raises(ValueError, match="does not list any courses"):
+        load_batch_config(path)
+
+
+def test_load_batch_courses(tmpdir):
+    path = f"{tmpdir}/batch.yaml"
+    with open(path, "w") as file:
+        yaml.safe_dump([{"name": "macro", "output_path": "macro.pdf", "streaming": True}, {}], file)
+
+    courses = load_batch_courses(parse_args(["--batch", path, "-s", "shared/pdfs", "-j", "2"]))
+    (name, kwargs), (default_name, default_kwargs) = courses
+
+    assert name == "macro"
+    assert kwargs["out_path"] == "macro.pdf"
+    assert kwargs["streaming"]
+    assert kwargs["pdf_path"] == "shared/pdfs"
+    assert kwargs["max_workers"] == 2
+    assert default_name == "materials/output/textbook.pdf"
+    assert not default_kwargs["streaming"]
+
+    with open(path, "w") as file:
+        yaml.safe_dump([{"output_path": "a.pdf", "typo_path": "x"}], file)
+    with pytest.raises(ValueError, match="Course 1 .* unknown options: typo_path"):
+        load_batch_courses(parse_args(["--batch", path]))
+
+
+def test_build_batch_shares_resources(tmpdir, blank_cover_sheets):
+    courses = [
+        (name, {**LOCAL_INPUTS, "out_path": f"{tmpdir}/{name}.pdf", "cache_dir": None})
+        for name in ["macro", "micro"]
+    ]
+
+    resources = SharedResources()
+    with patch("textbook_assembler.utils.batch.SharedResources", return_value=resources):
+        results = build_batch(courses)
+
+    assert [result["name"] for result in results] == ["macro", "micro"]
+    for result in results:
+        assert len(PdfReader(result["out_path"]).pages) == result["report"]["pages"]
+        assert result["seconds"] > 0
+
+    assert resources.bibtex.parse_count == 1
+    readers = resources.readers(LOCAL_INPUTS["pdf_path"])
+    assert readers.parse_count == len(readers._page_counts)
+
+
+def test_build_batch_rejects_shared_output(tmpdir):
+    courses = [(name, {**LOCAL_INPUTS, "out_path": f"{tmpdir}/book.pdf"}) for name in "ab"]
+    with pytest.raises(ValueError, match="Courses share output paths"):
+        build_batch(courses)
+
+
+def test_build_batch_reports_failures(tmpdir, blank_cover_sheets):
+    courses = [
+        ("good", {**LOCAL_INPUTS, "out_path": f"{tmpdir}/good.pdf"}),
+        ("bad", {**LOCAL_INPUTS, "data_path": f"{tmpdir}/missing.csv", "out_path": "bad.pdf"}),
+    ]
+    with pytest.raises(BatchBuildError, match="Failed to build 1 course") as e:
+        build_batch(courses)
+
+    assert list(e.value.errors) == ["bad"]
+    assert os.path.isfile(f"{tmpdir}/good.pdf")
+
+
+def test_main_batch(tmpdir, blank_cover_sheets):
+    path = f"{tmpdir}/batch.yaml"
+    with open(path, "w") as file:
+        yaml.safe_dump(
+            [{"output_path": f"{tmpdir}/{name}.pdf", "name": name} for name in ["a", "b"]], file
+        )
+
+    test_args = [
+        "script_name",
+        "-l",
+        LOCAL_INPUTS["data_path"],
+        "-s",
+        LOCAL_INPUTS["pdf_path"],
+        "-b",
+        LOCAL_INPUTS["bibtex_path"],
+        "-r",
+        LOCAL_INPUTS["ref_path"],
+        "--no_pdf_index",
+        "--batch",
+        path,
+    ]
+    with patch.object(sys, "argv", test_args):
+        main()
+
+    assert os.path.isfile(f"{tmpdir}/a.pdf")
+    assert os.path.isfile(f"{tmpdir}/b.pdf")
@@ -0,0 +1,123 @@
+import os
+
+import pypdf
+
+from textbook_assembler.utils import latex
+from textbook_assembler.utils.cache import CoverSheetCache, DiskCache
+from textbook_assembler.utils.data import load_and_process_data
+from textbook_assembler.utils.make_text import assemble_textbook
+from textbook_assembler.utils.records import as_lesson_plan
+
+
+def _write_blank_pdf(path):
+    writer = pypdf.PdfWriter()
+    writer.add_blank_page(width=612, height=792)
+    with open(path, "wb") as file:
+        writer.write(file)
+
+
+def _load_local_data():
+    bibtex_path = "textbook_assembler/tests/resources/bibtex/test2.bib"
+    ref_path = "textbook_assembler/tests/resources/config/ref_to_file_local.yaml"
+    data_path = "textbook_assembler/tests/resources/csvs/test_local.csv"
+    pdf_path = "textbook_assembler/tests/resources/pdfs"
+
+    return load_and_process_data(data_path, pdf_path, ref_path, bibtex_path)
+
+
+def test_make_key_depends_on_rows_and_template():
+    rows = [{"week": 1, "topic": "RBC", "page_start": 1.0}]
+    bibtex = [{"ID": "S1", "title": "Notes"}]
+    key = CoverSheetCache.make_key("latex", 1, rows, bibtex)
+
+    assert key == CoverSheetCache.make_key("latex", 1, rows, bibtex)
+    assert key != CoverSheetCache.make_key("single_pass", 1, rows, bibtex)
+    assert key != CoverSheetCache.make_key("latex", 1, [{**rows[0], "page_start": 2.0}], bibtex)
+    assert key != CoverSheetCache.make_key("latex", 1, rows, [{"ID": "S1", "title": "Note"}])
+
+
+def test_fetch_and_store(tmpdir):
+    cache = CoverSheetCache(os.path.join(tmpdir, "cache"))
+    source = os.path.join(tmpdir, "week_1_coversheet.pdf")
+    target = os.path.join(tmpdir, "fetched.pdf")
+    _write_blank_pdf(source)
+
+    assert not cache.fetch("abc", target)
+    cache.store("abc", source)
+    assert cache.fetch("abc", target)
+    assert len(pypdf.PdfReader(target).pages) == 1
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_evicts_least_recently_used(tmpdir):
+    source = os.path.join(tmpdir, "week_1_coversheet.pdf")
+    _write_blank_pdf(source)
+    size = os.path.getsize(source)
+
+    cache = CoverSheetCache(os.path.join(tmpdir, "cache"), max_bytes=2 * size)
+    for i, key in enumerate(["a", "b"]):
+        cache.store(key, source)
+        os.utime(cache.path_for(key), (i, i))
+
+    cache.fetch("a", os.path.join(tmpdir, "fetched.pdf"))
+    cache.store("c", source)
+
+    assert os.path.isfile(cache.path_for("a"))
+    assert not os.path.isfile(cache.path_for("b"))
+    assert os.path.isfile(cache.path_for("c"))
+
+
+def test_generate_cover_sheets_only_rebuilds_changed_weeks(tmpdir, monkeypatch):
+    data = _load_local_data()
+    cache = CoverSheetCache(os.path.join(tmpdir, "cache"))
+    compiled = []
+
+    def fake_backend(data, bibtex_path, out_path, backend, max_workers):
+        paths = []
+        for week_number in as_lesson_plan(data).weeks:
+            compiled.append(week_number)
+            paths.append(os.path.join(out_path, f"week_{week_number}_coversheet.pdf"))
+            _write_blank_pdf(paths[-1])
+        return paths
+
+    monkeypatch.setattr(latex, "_run_cover_sheet_backend", fake_backend)
+
+    first = latex.generate_cover_sheets(data, "test2.bib", out_path=str(tmpdir), cache=cache)
+    assert compiled == [1, 2, 3, 4]
+
+    compiled.clear()
+    data.loc[data.week == 3, "page_end"] = 18.0
+    second = latex.generate_cover_sheets(data, "test2.bib", out_path=str(tmpdir), cache=cache)
+
+    assert compiled == [3]
+    assert first == second
+    assert all(os.path.isfile(path) for path in second)
+
+
+def test_caches_of_a_build_share_the_cache_size(tmpdir, blank_cover_sheets, monkeypatch):
+    caches = {}
+    init = DiskCache.__init__
+
+    def record(self, cache_dir, max_bytes):
+        caches[os.path.relpath(cache_dir, tmpdir)] = max_bytes
+        init(self, cache_dir, max_bytes)
+
+    monkeypatch.setattr(DiskCache, "__init__", record)
+    cache_size = 10 * 1024 * 1024
+    assemble_textbook(
+        data_path="textbook_assembler/tests/resources/csvs/test_local.csv",
+        pdf_path="textbook_assembler/tests/resources/pdfs",
+        ref_path="textbook_assembler/tests/resources/config/ref_to_file_local.yaml",
+        bibtex_path="textbook_assembler/tests/resources/bibtex/test2.bib",
+        out_path=os.path.join(tmpdir, "textbook.pdf"),
+        cache_dir=os.path.join(tmpdir, "cache"),
+        cache_size=cache_size,
+        recompress_streams=True,
+    )
+
+    assert set(caches) == {
+        "cache",
+        os.path.join("cache", "streams"),
+        os.path.join("cache", "bibtex"),
+    }
+    assert sum(caches.values()) <= cache_size
@@ -7,9 +7,11 @@ from textbook_assembler.utils.constants import EXPECTED_DTYPES, EXPECTED_KEYS
 from textbook_assembler.utils.data import (
     add_bibtext_to_data,
     add_filename_to_data,
+    clean_string_data,
     convert_date_column,
     fill_page_numbers,
     load_and_process_data,
+    validate_datatypes,
 )
 from textbook_assembler.utils.references import (
     get_pdf_names,
@@ -124,3 +126,36 @@ def test_load_data(data_path):
         .any()
         .any()
     )
+
+
+@pytest.mark.parametrize(
+    "dates, expected",
+    [
+        (["2023-09-13", "2023-09-20", "2023-09-13"], ["2023-09-13", "2023-09-20", "2023-09-13"]),
+        (["9/13/2023", "Sept-20-2023"], ["2023-09-13", "2023-09-20"]),
+    ],
+    ids=["vectorized", "mixed_formats"],
+)
+def test_datetime_convert_with_year(dates, expected):
+    data = convert_date_column(pd.DataFrame({"date": dates}))
+
+    assert data["date"].dtype == EXPECTED_DTYPES["date"]
+    assert list(data["date"]) == list(pd.to_datetime(expected))
+
+
+def test_clean_string_data_transliterates():
+    data = pd.DataFrame(
+        {"topic": ["Économie", "Économie", "RBC"], "reference": ["Gal", "Gal", "U"]}
+    )
+    data = clean_string_data(data)
+
+    assert list(data["topic"]) == ["Economie", "Economie", "RBC"]
+    assert list(data["reference"]) == ["Gal", "Gal", "U"]
+
+
+def test_validate_datatypes_checks_distinct_values():
+    data = pd.DataFrame({"week": [1.0, 2.0, 2.0], "page_start": [1, 2, 3]})
+    validate_datatypes(data)
+
+    with pytest.raises(ValueError, match="week, found: float64, expected: int64"):
+        validate_datatypes(pd.DataFrame({"week": [1.0, None]}))
@@ -0,0 +1,102 @@
+import os
+
+import pandas as pd
+import pypdf
+from pypdf.generic import DecodedStreamObject, DictionaryObject, NameObject
+
+from textbook_assembler.utils import dedup
+from textbook_assembler.utils.dedup import deduplicate_objects
+from textbook_assembler.utils.make_text import assemble_textbook
+
+LOCAL_INPUTS = {
+    "data_path": "textbook_assembler/tests/resources/csvs/test_local.csv",
+    "pdf_path": "textbook_assembler/tests/resources/pdfs",
+    "ref_path": "textbook_assembler/tests/resources/config/ref_to_file_local.yaml",
+    "bibtex_path": "textbook_assembler/tests/resources/bibtex/test2.bib",
+}
+
+
+def _page_with_font(writer, text):
+    # Every page gets its own copy of the same font program and font dictionary, the way
+    # separately compiled cover sheets do
+    program = DecodedStreamObject()
+    program.set_data(b"%!FontType1 identical font program")
+    font = DictionaryObject(
+        {
+            NameObject("/Type"): NameObject("/Font"),
+            NameObject("/Subtype"): NameObject("/Type1"),
+            NameObject("/BaseFont"): NameObject("/CMR10"),
+            NameObject("/FontFile"): writer._add_object(program),
+        }
+    )
+    content = DecodedStreamObject()
+    content.set_data(f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET".encode())
+
+    page = writer.add_blank_page(width=612, height=792)
+    page[NameObject("/Resources")] = DictionaryObject(
+        {NameObject("/Font"): DictionaryObject({NameObject("/F1"): writer._add_object(font)})}
+    )
+    page[NameObject("/Contents")] = writer._add_object(content)
+
+
+def test_deduplicate_objects_merges_nested_copies(tmpdir):
+    writer = pypdf.PdfWriter()
+    for text in ["first", "second", "first"]:
+        _page_with_font(writer, text)
+
+    stats = deduplicate_objects(writer)
+
+    # Two copies of the font program, then the two font dictionaries that only differed by which
+    # program they pointed at, and the repeated content stream. Pages are never merged.
+    assert stats["objects"] == 5
+    assert stats["bytes_saved"] > 0
+
+    path = f"{tmpdir}/deduped.pdf"
+    with open(path, "wb") as file:
+        writer.write(file)
+    reader = pypdf.PdfReader(path, strict=True)
+
+    assert len(reader.pages) == 3
+    fonts = {page["/Resources"]["/Font"].raw_get("/F1").idnum for page in reader.pages}
+    assert len(fonts) == 1
+    assert [page.extract_text() for page in reader.pages] == ["first", "second", "first"]
+
+
+def test_stream_data_is_hashed_once(monkeypatch):
+    hashed = []
+    stream_digest = dedup._stream_digest
+    monkeypatch.setattr(
+        dedup, "_stream_digest", lambda obj: hashed.append(obj) or stream_digest(obj)
+    )
+    writer = pypdf.PdfWriter()
+    for text in ["first", "second", "first"]:
+        _page_with_font(writer, text)
+
+    # Merging the fonts takes a second pass, after their programs were merged in the first
+    assert deduplicate_objects(writer)["objects"] == 5
+    assert len(hashed) == len({id(obj) for obj in hashed}) == 6
+
+
+def test_assemble_textbook_dedupe(tmpdir, blank_cover_sheets):
+    # The same readings twice, the way a lesson plan reuses a chapter in a later week
+    data = pd.read_csv(LOCAL_INPUTS["data_path"])
+    repeated = data.assign(Week=data.Week + data.Week.max())
+    data_path = f"{tmpdir}/lesson_plan.csv"
+    pd.concat([data, repeated]).to_csv(data_path, index=False)
+    inputs = {**LOCAL_INPUTS, "data_path": data_path}
+
+    plain = assemble_textbook(**inputs, out_path=f"{tmpdir}/plain.pdf", streaming=True)
+    deduped = assemble_textbook(
+        **inputs, out_path=f"{tmpdir}/deduped.pdf", streaming=True, dedupe=True
+    )
+
+    plain_size = os.path.getsize(plain["out_path"])
+    deduped_size = os.path.getsize(deduped["out_path"])
+    assert deduped_size < plain_size * 0.6
+    assert abs(deduped["dedupe"]["bytes_saved"] - (plain_size - deduped_size)) < 0.05 * plain_size
+
+    expected = pypdf.PdfReader(plain["out_path"])
+    result = pypdf.PdfReader(deduped["out_path"], strict=True)
+    assert [page.extract_text() for page in result.pages] == [
+        page.extract_text() for page in expected.pages
+    ]
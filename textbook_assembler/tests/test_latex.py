@@ -1,11 +1,41 @@
 import os
+import shutil
 
+import pypdf
+import pytest
+
+from textbook_assembler.utils import latex
 from textbook_assembler.utils.data import load_and_process_data
 from textbook_assembler.utils.latex import (
+    CoverSheetError,
+    generate_cover_sheets,
     generate_weekly_cover_sheet,
     generate_weekly_cover_sheets,
+    split_pdf_by_outline,
+    template_fingerprint,
 )
 
+LOCAL_INPUTS = {
+    "data_path": "textbook_assembler/tests/resources/csvs/test_local.csv",
+    "pdf_path": "textbook_assembler/tests/resources/pdfs",
+    "ref_path": "textbook_assembler/tests/resources/config/ref_to_file_local.yaml",
+    "bibtex_path": "textbook_assembler/tests/resources/bibtex/test2.bib",
+}
+
+requires_latex = pytest.mark.skipif(shutil.which("pdflatex") is None, reason="needs pdflatex")
+
+
+def _blank_cover_sheet(week_number, date, data, bibtex_path, out_path):
+    # Writes a page into the week's working directory like pdflatex would, failing for week 3
+    if week_number == 3:
+        raise ValueError("bad bibtex")
+    writer = pypdf.PdfWriter()
+    writer.add_blank_page(width=612, height=792)
+    fpath = os.path.join(out_path, f"week_{week_number}_coversheet.pdf")
+    with open(fpath, "wb") as file:
+        writer.write(file)
+    return fpath
+
 
 def test_generate_cover_sheet(tmpdir):
     bibtex_path = "textbook_assembler/tests/resources/bibtex/test2.bib"
@@ -33,3 +63,95 @@ def test_generate_weekly_cover_sheets(tmpdir):
 
     for week in data.week.unique():
         assert os.path.isfile(os.path.join(tmpdir, f"week_{week}_coversheet.pdf"))
+
+
+@requires_latex
+def test_generate_weekly_cover_sheets_parallel(tmpdir):
+    bibtex_path = "textbook_assembler/tests/resources/bibtex/test2.bib"
+    ref_path = "textbook_assembler/tests/resources/config/ref_to_file_local.yaml"
+    data_path = "textbook_assembler/tests/resources/csvs/test_local.csv"
+    pdf_path = "textbook_assembler/tests/resources/pdfs"
+
+    data = load_and_process_data(data_path, pdf_path, ref_path, bibtex_path)
+    paths = generate_weekly_cover_sheets(data, bibtex_path, out_path=tmpdir, max_workers=2)
+
+    expected = [os.path.join(tmpdir, f"week_{week}_coversheet.pdf") for week in data.week.unique()]
+    assert paths == expected
+    assert all(os.path.isfile(path) for path in paths)
+    assert not any(os.path.isdir(os.path.join(tmpdir, f"week_{week}")) for week in data.week)
+
+
+def test_weekly_cover_sheets_pool_collects_errors(tmpdir, monkeypatch):
+    # Workers are forked, so they run the patched function too
+    monkeypatch.setattr(latex, "generate_weekly_cover_sheet", _blank_cover_sheet)
+    data = load_and_process_data(*LOCAL_INPUTS.values())
+    weeks = [week for week in data.week.unique() if week != 3]
+
+    paths = generate_weekly_cover_sheets(
+        data[data.week != 3], LOCAL_INPUTS["bibtex_path"], out_path=tmpdir, max_workers=2
+    )
+    assert paths == [os.path.join(tmpdir, f"week_{week}_coversheet.pdf") for week in weeks]
+    assert not any(os.path.isdir(os.path.join(tmpdir, f"week_{week}")) for week in weeks)
+
+    with pytest.raises(CoverSheetError) as excinfo:
+        generate_weekly_cover_sheets(
+            data, LOCAL_INPUTS["bibtex_path"], out_path=tmpdir, max_workers=2
+        )
+    assert list(excinfo.value.errors) == [3]
+
+
+def test_cover_sheet_error_reports_each_week():
+    error = CoverSheetError({3: ValueError("bad bibtex"), 1: OSError("no pdflatex")})
+
+    assert sorted(error.errors) == [1, 3]
+    assert "week 1: no pdflatex; week 3: bad bibtex" in str(error)
+
+
+def test_split_pdf_by_outline(tmpdir):
+    writer = pypdf.PdfWriter()
+    for _ in range(5):
+        writer.add_blank_page(width=612, height=792)
+    for week, page in zip([1, 2, 4], [0, 2, 3]):
+        parent = writer.add_outline_item(f"Week {week}", page)
+        writer.add_outline_item("Reading Materials", page, parent=parent)
+
+    combined_path = os.path.join(tmpdir, "combined.pdf")
+    with open(combined_path, "wb") as file:
+        writer.write(file)
+
+    out_paths = [os.path.join(tmpdir, f"week_{week}_coversheet.pdf") for week in [1, 2, 4]]
+    split_pdf_by_outline(combined_path, out_paths)
+
+    assert [len(pypdf.PdfReader(path).pages) for path in out_paths] == [2, 1, 2]
+
+    with pytest.raises(ValueError, match="Expected 2 week bookmarks"):
+        split_pdf_by_outline(combined_path, out_paths[:2])
+
+
+@requires_latex
+def test_generate_cover_sheets_single_pass(tmpdir):
+    bibtex_path = "textbook_assembler/tests/resources/bibtex/test2.bib"
+    ref_path = "textbook_assembler/tests/resources/config/ref_to_file_local.yaml"
+    data_path = "textbook_assembler/tests/resources/csvs/test_local.csv"
+    pdf_path = "textbook_assembler/tests/resources/pdfs"
+
+    data = load_and_process_data(data_path, pdf_path, ref_path, bibtex_path)
+    paths = generate_cover_sheets(data, bibtex_path, out_path=tmpdir, backend="single_pass")
+
+    assert paths == [
+        os.path.join(tmpdir, f"week_{week}_coversheet.pdf") for week in data.week.unique()
+    ]
+    assert all(len(pypdf.PdfReader(path).pages) >= 1 for path in paths)
+
+
+def test_template_fingerprint_covers_the_layout(monkeypatch):
+    fingerprints = {backend: template_fingerprint(backend) for backend in ["latex", "native"]}
+    monkeypatch.setattr(latex, "LATEX_LAYOUT_VERSION", latex.LATEX_LAYOUT_VERSION + 1)
+
+    assert template_fingerprint("latex") != fingerprints["latex"]
+    assert template_fingerprint("native") == fingerprints["native"]
+
+
+def test_generate_cover_sheets_unknown_backend():
+    with pytest.raises(ValueError, match="Unknown cover sheet backend"):
+        generate_cover_sheets(None, "test.bib", backend="pdftex")
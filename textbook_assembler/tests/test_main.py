@@ -1,8 +1,19 @@
+import json
 import os
+import subprocess
 import sys
 from unittest.mock import patch
 
-from textbook_assembler.main import main, parse_args
+import pytest
+
+from textbook_assembler.main import (
+    main,
+    parse_args,
+    parsed_args_to_kwargs,
+    resolve_index_path,
+    resolve_profile_path,
+    run,
+)
 
 
 def test_parse_args_with_defaults():
@@ -28,6 +39,79 @@ def test_parse_args():
         assert getattr(args, key) == value
 
 
+def test_parse_args_jobs():
+    assert parse_args().jobs == 1
+    assert parse_args(["-j", "4"]).jobs == 4
+    assert parsed_args_to_kwargs(parse_args(["--jobs", "4"]))["max_workers"] == 4
+
+
+def test_parse_args_latex_jobs():
+    assert parsed_args_to_kwargs(parse_args(["-j", "4"]))["max_subprocesses"] is None
+    assert parsed_args_to_kwargs(parse_args(["--latex_jobs", "2"]))["max_subprocesses"] == 2
+    assert parse_args(["--dry-run"]).dry_run
+
+
+def test_parse_args_lean_import():
+    kwargs = parsed_args_to_kwargs(parse_args(["--lean_import", "--drop_outline"]))
+    assert kwargs["lean_import"]
+    assert not kwargs["import_outline"]
+    assert kwargs["import_links"] and kwargs["import_forms"]
+
+
+def test_resolve_index_path():
+    index_path = resolve_index_path(parse_args(["-s", "pdfs", "-o", "out/book.pdf"]))
+    assert os.path.dirname(index_path) == "out"
+    index_path = resolve_index_path(parse_args(["--cache_dir", "cache", "-o", "out/book.pdf"]))
+    assert os.path.dirname(index_path) == "cache"
+    assert resolve_index_path(parse_args(["--pdf_index", "index.json"])) == "index.json"
+    assert resolve_index_path(parse_args(["--no_pdf_index"])) is None
+
+
+def test_resolve_profile_path():
+    assert resolve_profile_path(parse_args()) is None
+    assert resolve_profile_path(parse_args(["--profile", "-o", "out/book.pdf"])) == (
+        "out/book.pdf.trace.json"
+    )
+    assert resolve_profile_path(parse_args(["--profile", "--profile_path", "t.json"])) == "t.json"
+
+
+def test_modes_cannot_be_combined():
+    with pytest.raises(ValueError, match="--watch and --batch can.t be combined"):
+        run(parse_args(["--watch", "--batch", "courses.yaml"]))
+    with pytest.raises(ValueError, match="--dry_run can.t be combined with --watch"):
+        run(parse_args(["--dry_run", "--watch"]))
+
+
+def test_main_profile(tmpdir, blank_cover_sheets):
+    output_path = f"{tmpdir}/textbook.pdf"
+    test_args = [
+        "script_name",
+        "-l",
+        "textbook_assembler/tests/resources/csvs/test_local.csv",
+        "-s",
+        "textbook_assembler/tests/resources/pdfs",
+        "-o",
+        output_path,
+        "-b",
+        "textbook_assembler/tests/resources/bibtex/test2.bib",
+        "-r",
+        "textbook_assembler/tests/resources/config/ref_to_file_local.yaml",
+        "--no_pdf_index",
+        "--profile",
+    ]
+
+    with patch.object(sys, "argv", test_args):
+        main()
+
+    with open(output_path + ".trace.json") as file:
+        events = json.load(file)["traceEvents"]
+
+    names = {event["name"] for event in events}
+    assert {"assemble_textbook", "load_and_process_data", "week", "read_pages", "write"} <= names
+    write = [event for event in events if event["name"] == "write"][0]
+    assert write["args"]["bytes_written"] == os.path.getsize(output_path)
+
+
 def test_main(tmpdir):
     bibtex_path = "textbook_assembler/tests/resources/bibtex/test2.bib"
     ref_path = "textbook_assembler/tests/resources/config/ref_to_file.yaml"
@@ -53,3 +137,23 @@ def test_main(tmpdir):
         main()
 
     assert os.path.isfile(output_path)
+
+
+def test_parse_args_command():
+    assert parse_args([]).command == "build"
+    assert parse_args(["validate", "-l", "plan.csv"]).command == "validate"
+    with pytest.raises(ValueError, match="validate can't be combined with --watch"):
+        run(parse_args(["validate", "--watch"]))
+
+
+def test_cli_starts_without_build_dependencies():
+    script = (
+        "import sys; import textbook_assembler.main; "
+        "print(sorted(name for name in ('pandas', 'pypdf', 'pylatex', 'bibtexparser', 'numpy') "
+        "if name in sys.modules))"
+    )
+
+    result = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True)
+
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == "[]"
@@ -1,9 +1,26 @@
+import gc
+import io
+import mmap
 import os
+import weakref
 
 import pypdf
+import pytest
 
+from textbook_assembler.utils import make_text
+from textbook_assembler.utils.cache import CoverSheetCache
 from textbook_assembler.utils.data import load_and_process_data
 from textbook_assembler.utils.make_text import assemble_textbook
+from textbook_assembler.utils.plan import TaskError
+from textbook_assembler.utils.readers import ReaderPool, SourceFile
+from textbook_assembler.utils.streaming import StreamingPdfWriter
+
+LOCAL_INPUTS = {
+    "data_path": "textbook_assembler/tests/resources/csvs/test_local.csv",
+    "pdf_path": "textbook_assembler/tests/resources/pdfs",
+    "ref_path": "textbook_assembler/tests/resources/config/ref_to_file_local.yaml",
+    "bibtex_path": "textbook_assembler/tests/resources/bibtex/test2.bib",
+}
 
 
 def _get_expected_pages(data_path, pdf_path, ref_path, bibtex_path):
@@ -28,3 +45,265 @@ def test_assemble_textbook(tmpdir):
     n_expected_pages = _get_expected_pages(data_path, pdf_path, ref_path, bibtex_path)
 
     assert n_pages_out == n_expected_pages
+
+
+def test_assemble_textbook_local(tmpdir, blank_cover_sheets):
+    out_path = f"{tmpdir}/textbook.pdf"
+    assemble_textbook(**LOCAL_INPUTS, out_path=out_path)
+
+    n_expected_pages = _get_expected_pages(*LOCAL_INPUTS.values())
+    assert len(pypdf.PdfReader(out_path).pages) == n_expected_pages
+
+
+def test_reader_pool_parses_each_source_once():
+    data = load_and_process_data(
+        "textbook_assembler/tests/resources/csvs/test_local.csv",
+        "textbook_assembler/tests/resources/pdfs",
+        "textbook_assembler/tests/resources/config/ref_to_file_local.yaml",
+    )
+
+    with ReaderPool("textbook_assembler/tests/resources/pdfs") as readers:
+        writer = pypdf.PdfWriter()
+        for _, row in data.iterrows():
+            make_text.read_pages_from_pdf(writer, row, readers.pdf_path, readers=readers)
+
+        assert readers.parse_count == data.filename.nunique()
+        assert len(writer.pages) == (data.page_end - data.page_start.clip(lower=1) + 1).sum()
+
+
+def test_reader_pool_bounds_open_readers():
+    with ReaderPool("textbook_assembler/tests/resources/pdfs", max_open=1) as readers:
+        assert readers.page_count("rbc_notes_2017.pdf") == 25
+        readers.get("uribe-notes.pdf")
+        assert list(readers._readers) == ["uribe-notes.pdf"]
+        assert readers.page_count("rbc_notes_2017.pdf") == 25
+        assert readers.parse_count == 2
+
+
+@pytest.mark.parametrize("streaming", [False, True])
+def test_reader_pool_releases_evicted_readers(streaming):
+    out_file = io.BytesIO()
+    writer = StreamingPdfWriter(out_file) if streaming else pypdf.PdfWriter()
+    with ReaderPool("textbook_assembler/tests/resources/pdfs", max_open=1) as readers:
+        reader = weakref.ref(readers.get("rbc_notes_2017.pdf"))
+        writer.append(reader(), pages=(0, 2), import_outline=False)
+        if streaming:
+            writer.flush()
+        readers.get("uribe-notes.pdf")
+        gc.collect()
+
+        # The in-memory writer keeps the readers it cloned from until it is written
+        assert (reader() is None) == streaming
+
+
+def test_source_file_maps_the_pdf():
+    path = "textbook_assembler/tests/resources/pdfs/rbc_notes_2017.pdf"
+
+    with SourceFile(path) as source:
+        assert isinstance(source.stream, mmap.mmap)
+        assert source.size == os.path.getsize(path)
+        assert len(pypdf.PdfReader(source.stream).pages) == 25
+
+    assert source.mapped.closed and source.file.closed
+
+
+def test_source_file_falls_back_to_the_file(tmpdir, monkeypatch):
+    path = "textbook_assembler/tests/resources/pdfs/rbc_notes_2017.pdf"
+    empty_path = os.path.join(tmpdir, "empty.pdf")
+    open(empty_path, "wb").close()
+
+    with SourceFile(path, use_mmap=False) as source:
+        assert source.stream is source.file
+    with SourceFile(empty_path) as source:
+        # Empty files can't be mapped
+        assert source.stream is source.file
+
+    monkeypatch.setattr("textbook_assembler.utils.readers.mmap", None)
+    with ReaderPool("textbook_assembler/tests/resources/pdfs") as pool:
+        assert pool.page_count("rbc_notes_2017.pdf") == 25
+        source, _ = pool._readers["rbc_notes_2017.pdf"]
+        assert source.stream is source.file
+
+
+def test_streaming_assembly_matches_in_memory(tmpdir, blank_cover_sheets):
+    in_memory_path = f"{tmpdir}/in_memory.pdf"
+    streaming_path = f"{tmpdir}/streaming.pdf"
+
+    assemble_textbook(**LOCAL_INPUTS, out_path=in_memory_path)
+    report = assemble_textbook(**LOCAL_INPUTS, out_path=streaming_path, streaming=True)
+
+    expected = pypdf.PdfReader(in_memory_path, strict=True)
+    result = pypdf.PdfReader(streaming_path, strict=True)
+
+    assert report["pages"] == len(result.pages) == len(expected.pages)
+    assert report["process_peak_rss"] > 0
+    assert [page.extract_text() for page in result.pages] == [
+        page.extract_text() for page in expected.pages
+    ]
+
+
+@pytest.mark.parametrize("streaming", [False, True])
+def test_lean_import_matches_append(tmpdir, blank_cover_sheets, streaming):
+    expected_path = f"{tmpdir}/append.pdf"
+    lean_path = f"{tmpdir}/lean.pdf"
+
+    assemble_textbook(**LOCAL_INPUTS, out_path=expected_path, streaming=streaming)
+    report = assemble_textbook(
+        **LOCAL_INPUTS, out_path=lean_path, streaming=streaming, lean_import=True
+    )
+
+    expected = pypdf.PdfReader(expected_path, strict=True)
+    result = pypdf.PdfReader(lean_path, strict=True)
+    assert report["pages"] == len(result.pages) == len(expected.pages)
+    assert [page.extract_text() for page in result.pages] == [
+        page.extract_text() for page in expected.pages
+    ]
+
+
+@pytest.mark.parametrize("streaming", [False, True])
+def test_parallel_extract_is_deterministic(tmpdir, blank_cover_sheets, streaming):
+    expected_path = f"{tmpdir}/serial.pdf"
+    assemble_textbook(**LOCAL_INPUTS, out_path=expected_path, streaming=streaming)
+
+    outputs = []
+    for max_workers in [1, 2]:
+        out_path = f"{tmpdir}/parallel_{max_workers}.pdf"
+        assemble_textbook(
+            **LOCAL_INPUTS,
+            out_path=out_path,
+            streaming=streaming,
+            parallel_extract=True,
+            max_workers=max_workers,
+        )
+        with open(out_path, "rb") as file:
+            outputs.append(file.read())
+
+    assert outputs[0] == outputs[1]
+    expected = pypdf.PdfReader(expected_path, strict=True)
+    result = pypdf.PdfReader(out_path, strict=True)
+    assert [page.extract_text() for page in result.pages] == [
+        page.extract_text() for page in expected.pages
+    ]
+    assert len(result.outline) == len(expected.outline)
+
+
+def test_dry_run_returns_the_plan(tmpdir, blank_cover_sheets):
+    out_path = f"{tmpdir}/textbook.pdf"
+    report = assemble_textbook(
+        **LOCAL_INPUTS, out_path=out_path, parallel_extract=True, split_weeks=True, dry_run=True
+    )
+    assert not os.path.exists(out_path)
+    assert blank_cover_sheets == []
+
+    weeks = load_and_process_data(*LOCAL_INPUTS.values()).week.unique()
+    plan = report["plan"]
+    names = [task.name for task in plan]
+    assert names[:2] == ["lessons", "open"]
+    assert names[-2:] == ["write", "split"]
+    for week in weeks:
+        assert plan[f"cover[{week}]"].kind == "subprocess"
+        assert f"cover[{week}]" in plan[f"merge[{week}]"].deps
+    assert plan[f"merge[{weeks[1]}]"].deps[0] == f"merge[{weeks[0]}]"
+    assert all(task.kind == "cpu" for task in plan if task.name.startswith("extract"))
+
+
+def test_cover_sheet_cache_is_only_used_by_main_tasks(tmpdir, blank_cover_sheets):
+    inputs = dict(LOCAL_INPUTS, cache_dir=f"{tmpdir}/cache", max_subprocesses=3)
+    assemble_textbook(**inputs, out_path=f"{tmpdir}/first.pdf")
+    n_weeks = len(blank_cover_sheets)
+    assert n_weeks > 1
+
+    report = assemble_textbook(**inputs, out_path=f"{tmpdir}/second.pdf", dry_run=True)
+    plan = report["plan"]
+    cache_tasks = [
+        task for task in plan if any(isinstance(arg, CoverSheetCache) for arg in task.args)
+    ]
+    assert len(cache_tasks) == n_weeks + 1
+    assert all(task.kind == "main" for task in cache_tasks)
+    cover_tasks = [task for task in plan if task.name.startswith("cover[")]
+    assert all("cached_cover_sheets" in task.deps for task in cover_tasks)
+
+    # Every week is found in the cache, so nothing is sent to LaTeX
+    assemble_textbook(**inputs, out_path=f"{tmpdir}/second.pdf")
+    assert len(blank_cover_sheets) == n_weeks
+
+
+def test_cover_sheet_errors_of_every_week_are_reported(tmpdir, monkeypatch):
+    def broken_cover_sheets(data, bibtex_path, out_path=None, **kwargs):
+        raise ValueError("bad bibtex")
+
+    monkeypatch.setattr(make_text, "generate_cover_sheets", broken_cover_sheets)
+    with pytest.raises(TaskError) as excinfo:
+        assemble_textbook(**LOCAL_INPUTS, out_path=f"{tmpdir}/textbook.pdf", max_subprocesses=1)
+
+    assert set(excinfo.value.errors) == {"cover[1]", "cover[2]", "cover[3]", "cover[4]"}
+
+
+def test_concurrent_cover_sheets_match_serial_build(tmpdir, blank_cover_sheets):
+    outputs = []
+    for max_subprocesses in [1, 3]:
+        out_path = f"{tmpdir}/textbook_{max_subprocesses}.pdf"
+        report = assemble_textbook(
+            **LOCAL_INPUTS, out_path=out_path, max_subprocesses=max_subprocesses
+        )
+        assert report["critical_path"] <= report["seconds"]
+        with open(out_path, "rb") as file:
+            outputs.append(file.read())
+
+    assert outputs[0] == outputs[1]
+
+
+def test_lean_import_option_rebuilds_weeks(tmpdir, blank_cover_sheets):
+    out_path = f"{tmpdir}/textbook.pdf"
+    assemble_textbook(**LOCAL_INPUTS, out_path=out_path, incremental=True)
+
+    report = assemble_textbook(
+        **LOCAL_INPUTS, out_path=out_path, incremental=True, lean_import=True, import_links=False
+    )
+
+    assert report["weeks_reused"] == 0
+    with pytest.raises(ValueError, match="needs the lean page import"):
+        assemble_textbook(**LOCAL_INPUTS, out_path=out_path, import_forms=False)
+
+
+@pytest.mark.parametrize("max_workers", [None, 2])
+def test_split_weeks_matches_combined_book(tmpdir, blank_cover_sheets, max_workers):
+    out_path = f"{tmpdir}/textbook.pdf"
+    report = assemble_textbook(
+        **LOCAL_INPUTS, out_path=out_path, split_weeks=True, max_workers=max_workers
+    )
+
+    split_dir = f"{tmpdir}/textbook_weeks"
+    assert report["split_dir"] == split_dir
+    assert report["weeks_split"] == 4
+    assert sorted(os.listdir(split_dir)) == [f"week_{week}.pdf" for week in [1, 2, 3, 4]]
+
+    book = [page.extract_text() for page in pypdf.PdfReader(out_path).pages]
+    weeks = []
+    for week in [1, 2, 3, 4]:
+        reader = pypdf.PdfReader(f"{split_dir}/week_{week}.pdf", strict=True)
+        weeks.extend(page.extract_text() for page in reader.pages)
+    assert weeks == book
+
+
+def test_split_weeks_incremental(tmpdir, blank_cover_sheets):
+    out_path = f"{tmpdir}/textbook.pdf"
+    split_dir = f"{tmpdir}/weeks"
+    kwargs = {**LOCAL_INPUTS, "out_path": out_path, "split_dir": split_dir, "incremental": True}
+
+    assemble_textbook(**kwargs)
+    assert not os.path.isdir(split_dir)
+
+    report = assemble_textbook(**kwargs, split_weeks=True)
+    assert report["up_to_date"]
+    assert report["weeks_split"] == 4
+
+    os.remove(f"{split_dir}/week_2.pdf")
+    with open(f"{split_dir}/week_9.pdf", "w") as file:
+        file.write("left over from an older lesson plan")
+    mtime = os.stat(f"{split_dir}/week_1.pdf").st_mtime_ns
+
+    report = assemble_textbook(**kwargs, split_weeks=True)
+    assert report["weeks_split"] == 1
+    assert sorted(os.listdir(split_dir)) == [f"week_{week}.pdf" for week in [1, 2, 3, 4]]
+    assert os.stat(f"{split_dir}/week_1.pdf").st_mtime_ns == mtime
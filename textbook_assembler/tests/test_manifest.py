@@ -0,0 +1,109 @@
+import os
+import shutil
+
+import pandas as pd
+import pypdf
+
+from textbook_assembler.utils import make_text
+from textbook_assembler.utils.make_text import assemble_textbook
+from textbook_assembler.utils.manifest import file_record, load_manifest, manifest_path
+
+
+def _copy_inputs(tmpdir):
+    resources = "textbook_assembler/tests/resources"
+    data_path = os.path.join(tmpdir, "lesson_plan.csv")
+    shutil.copy(f"{resources}/csvs/test_local.csv", data_path)
+
+    return {
+        "data_path": data_path,
+        "pdf_path": f"{resources}/pdfs",
+        "ref_path": f"{resources}/config/ref_to_file_local.yaml",
+        "bibtex_path": f"{resources}/bibtex/test2.bib",
+        "out_path": os.path.join(tmpdir, "textbook.pdf"),
+    }
+
+
+def test_file_record_skips_hash_when_stat_unchanged(tmpdir):
+    path = os.path.join(tmpdir, "notes.txt")
+    with open(path, "w") as file:
+        file.write("notes")
+
+    record = file_record(path)
+    assert file_record(path, previous={**record, "sha256": "cached"})["sha256"] == "cached"
+    assert file_record(path, previous={**record, "size": 0})["sha256"] == record["sha256"]
+
+
+def test_manifest_records_build(tmpdir, blank_cover_sheets):
+    kwargs = _copy_inputs(tmpdir)
+    assemble_textbook(**kwargs)
+
+    manifest = load_manifest(kwargs["out_path"])
+    assert os.path.isfile(manifest_path(kwargs["out_path"]))
+    assert set(manifest["inputs"]) == {"lesson_plan", "references", "bibtex"}
+    assert set(manifest["sources"]) == {
+        "uribe-notes.pdf",
+        "rbc_notes_2017.pdf",
+        "stylized_facts_rbc_sp17.pdf",
+        "rbc_extensions_sp17.pdf",
+    }
+    assert [week["week"] for week in manifest["weeks"]] == [1, 2, 3, 4]
+    assert sum(week["pages"] for week in manifest["weeks"]) == len(
+        pypdf.PdfReader(kwargs["out_path"]).pages
+    )
+
+
+def test_incremental_build_is_noop_when_unchanged(tmpdir, blank_cover_sheets, monkeypatch):
+    kwargs = _copy_inputs(tmpdir)
+    assemble_textbook(**kwargs, incremental=True)
+    mtime = os.stat(kwargs["out_path"]).st_mtime_ns
+
+    def fail(*args, **kwargs):
+        raise AssertionError("An up to date build should not reload the lesson plan")
+
+    monkeypatch.setattr(make_text, "load_and_process_data", fail)
+    assemble_textbook(**kwargs, incremental=True)
+
+    assert os.stat(kwargs["out_path"]).st_mtime_ns == mtime
+
+
+def test_incremental_build_reruns_when_streaming_changes(tmpdir, blank_cover_sheets):
+    kwargs = _copy_inputs(tmpdir)
+    assemble_textbook(**kwargs, incremental=True)
+
+    report = assemble_textbook(**kwargs, incremental=True, streaming=True)
+
+    assert not report["up_to_date"]
+    assert load_manifest(kwargs["out_path"])["options"]["streaming"]
+
+
+def test_incremental_build_rebuilds_every_week_when_options_change(tmpdir, blank_cover_sheets):
+    kwargs = _copy_inputs(tmpdir)
+    assemble_textbook(**kwargs, incremental=True)
+
+    blank_cover_sheets.clear()
+    report = assemble_textbook(**kwargs, incremental=True, jpeg_quality=50)
+
+    assert report["weeks_reused"] == 0
+    assert blank_cover_sheets == [1, 2, 3, 4]
+
+
+def test_incremental_build_only_regenerates_changed_weeks(tmpdir, blank_cover_sheets):
+    kwargs = _copy_inputs(tmpdir)
+    assemble_textbook(**kwargs, incremental=True)
+    first = pypdf.PdfReader(kwargs["out_path"])
+    first_pages = [page.extract_text() for page in first.pages]
+
+    data = pd.read_csv(kwargs["data_path"])
+    data.loc[data.Week == 3, "page_end"] = 17
+    data.to_csv(kwargs["data_path"], index=False)
+
+    blank_cover_sheets.clear()
+    assemble_textbook(**kwargs, incremental=True)
+
+    second = pypdf.PdfReader(kwargs["out_path"])
+    weeks = load_manifest(kwargs["out_path"])["weeks"]
+
+    assert blank_cover_sheets == [3]
+    assert len(second.pages) == len(first_pages) - 2
+    assert [week["pages"] for week in weeks] == [8, 19, 5, 10]
+    assert [page.extract_text() for page in second.pages[:27]] == first_pages[:27]
@@ -0,0 +1,129 @@
+import os
+
+import pypdf
+
+from textbook_assembler.utils.cache import CoverSheetCache
+from textbook_assembler.utils.data import load_and_process_data
+from textbook_assembler.utils.latex import generate_cover_sheets
+from textbook_assembler.utils.make_text import assemble_textbook
+from textbook_assembler.utils.native import (
+    ITALIC,
+    ROMAN,
+    detex,
+    format_authors,
+    format_reference,
+    layout_lines,
+    text_width,
+)
+
+LOCAL_INPUTS = {
+    "data_path": "textbook_assembler/tests/resources/csvs/test_local.csv",
+    "pdf_path": "textbook_assembler/tests/resources/pdfs",
+    "ref_path": "textbook_assembler/tests/resources/config/ref_to_file_local.yaml",
+    "bibtex_path": "textbook_assembler/tests/resources/bibtex/test2.bib",
+}
+
+
+def _load_local_data():
+    return load_and_process_data(
+        LOCAL_INPUTS["data_path"],
+        LOCAL_INPUTS["pdf_path"],
+        LOCAL_INPUTS["ref_path"],
+        LOCAL_INPUTS["bibtex_path"],
+    )
+
+
+def test_detex():
+    assert (
+        detex(r"{RBC} Models \& Fluctuations, 1960--2000") == "RBC Models & Fluctuations, 1960–2000"
+    )
+    assert detex(r"Mart{\'i}n \emph{Uribe}") == "Martín Uribe"
+
+
+def test_format_authors():
+    assert format_authors("Eric Sims") == "Sims, Eric"
+    assert format_authors("Kydland, Finn E. and Prescott, Edward C.") == (
+        "Kydland, Finn E., and Edward C. Prescott"
+    )
+    assert format_authors("Garin, Julio and Lester, Robert and Sims, Eric") == (
+        "Garin, Julio, Robert Lester, and Eric Sims"
+    )
+
+
+def test_format_reference_article():
+    entry = {
+        "ENTRYTYPE": "article",
+        "author": "Kydland, Finn E. and Prescott, Edward C.",
+        "year": "1982",
+        "title": "Time to Build and Aggregate Fluctuations",
+        "journal": "Econometrica",
+        "volume": "50",
+        "number": "6",
+        "pages": "1345--1370",
+        "note": float("nan"),
+    }
+
+    assert format_reference(entry) == [
+        ("Kydland, Finn E., and Edward C. Prescott. 1982. ", ROMAN),
+        ("“Time to Build and Aggregate Fluctuations.” ", ROMAN),
+        ("Econometrica", ITALIC),
+        (", 50(6): 1345–1370.", ROMAN),
+    ]
+
+
+def test_layout_lines_wraps_to_width():
+    runs = [("The Real Business Cycle Model in a Closed Economy, " * 6, ROMAN, None)]
+    runs.append(("Available here", ROMAN, "https://example.com"))
+
+    lines = layout_lines(runs, 10, 200, indent=25, hanging=25)
+
+    assert len(lines) > 1
+    assert lines[0][0][0] == 25
+    for line in lines:
+        x, text, font, _ = line[-1]
+        assert x + text_width(text, font, 10) <= 200
+    assert lines[-1][-1][3] == "https://example.com"
+
+
+def test_generate_native_cover_sheets(tmpdir):
+    data = _load_local_data()
+
+    paths = generate_cover_sheets(
+        data, LOCAL_INPUTS["bibtex_path"], out_path=tmpdir, backend="native"
+    )
+
+    assert paths == [
+        os.path.join(tmpdir, f"week_{week}_coversheet.pdf") for week in data.week.unique()
+    ]
+    reader = pypdf.PdfReader(paths[1], strict=True)
+    text = reader.pages[0].extract_text()
+    assert "Readings for Week 2: RBC in Closed Economy" in text
+    assert "Reading Materials" in text
+    assert "Sims, Eric. 2017." in text
+    links = [annot.get_object()["/A"]["/URI"] for annot in reader.pages[0]["/Annots"]]
+    assert links == list(data[data.week == 2].url)
+
+
+def test_native_cover_sheets_are_cached(tmpdir):
+    data = _load_local_data()
+    cache = CoverSheetCache(os.path.join(tmpdir, "cache"))
+    out_path = os.path.join(tmpdir, "sheets")
+    os.makedirs(out_path)
+
+    for _ in range(2):
+        generate_cover_sheets(
+            data, LOCAL_INPUTS["bibtex_path"], out_path=out_path, backend="native", cache=cache
+        )
+
+    n_weeks = len(data.week.unique())
+    assert (cache.misses, cache.hits) == (n_weeks, n_weeks)
+
+
+def test_assemble_textbook_with_native_cover_sheets(tmpdir):
+    out_path = os.path.join(tmpdir, "textbook.pdf")
+
+    report = assemble_textbook(**LOCAL_INPUTS, out_path=out_path, cover_backend="native")
+
+    reader = pypdf.PdfReader(out_path, strict=True)
+    assert len(reader.pages) == report["pages"]
+    assert "Readings for Week 1" in reader.pages[0].extract_text()
@@ -0,0 +1,167 @@
+import zlib
+from io import BytesIO
+
+import pypdf
+import pytest
+from pypdf.generic import (
+    DecodedStreamObject,
+    DictionaryObject,
+    NameObject,
+    NumberObject,
+    StreamObject,
+)
+
+from textbook_assembler.utils.optimize import OutputOptimizer, optimize_settings
+from textbook_assembler.utils.streaming import StreamingPdfWriter
+
+TEXT = "BT /F1 12 Tf 72 720 Td (Reading materials for week one) Tj ET\n" * 20
+
+
+def _add_image(writer, width, height, level=1):
+    image = StreamObject()
+    pixels = bytes((x * 7 + y * 3) % 256 for y in range(height) for x in range(width * 3))
+    image._data = zlib.compress(pixels, level)
+    image.update(
+        {
+            NameObject("/Type"): NameObject("/XObject"),
+            NameObject("/Subtype"): NameObject("/Image"),
+            NameObject("/Width"): NumberObject(width),
+            NameObject("/Height"): NumberObject(height),
+            NameObject("/ColorSpace"): NameObject("/DeviceRGB"),
+            NameObject("/BitsPerComponent"): NumberObject(8),
+            NameObject("/Filter"): NameObject("/FlateDecode"),
+        }
+    )
+    return writer._add_object(image)
+
+
+def _page(writer, image_size=(60, 80)):
+    content = DecodedStreamObject()
+    content.set_data(TEXT.encode() + b"q 612 0 0 792 0 0 cm /Im1 Do Q")
+
+    # The image fills the page, so 60 pixels across 8.5 inches is about 7 dpi
+    page = writer.add_blank_page(width=612, height=792)
+    page[NameObject("/Resources")] = DictionaryObject(
+        {
+            NameObject("/XObject"): DictionaryObject(
+                {NameObject("/Im1"): _add_image(writer, *image_size)}
+            )
+        }
+    )
+    page[NameObject("/Contents")] = writer._add_object(content)
+
+
+def _write(writer):
+    buffer = BytesIO()
+    writer.write(buffer)
+    return pypdf.PdfReader(BytesIO(buffer.getvalue()), strict=True)
+
+
+def test_optimize_settings():
+    assert optimize_settings() is None
+    assert optimize_settings(compress_content=True)["compress_content"]
+    with pytest.raises(ValueError):
+        optimize_settings(jpeg_quality=120)
+    with pytest.raises(ValueError):
+        optimize_settings(image_dpi=0)
+
+
+def test_compress_content_streams():
+    writer = pypdf.PdfWriter()
+    _page(writer)
+    optimizer = OutputOptimizer(optimize_settings(compress_content=True))
+
+    stats = optimizer.optimize(writer)
+
+    # Only the content stream is looked at
+    assert stats["streams"] == 1
+    assert stats["optimized"] == 1
+    assert stats["bytes_after"] < stats["bytes_before"]
+
+    page = _write(writer).pages[0]
+    assert page["/Contents"]["/Filter"] == "/FlateDecode"
+    assert page["/Contents"].get_data().startswith(TEXT.encode())
+
+
+def test_recompress_streams_is_lossless():
+    writer = pypdf.PdfWriter()
+    _page(writer)
+    before = zlib.decompress(writer.pages[0]["/Resources"]["/XObject"]["/Im1"]._data)
+
+    stats = OutputOptimizer(optimize_settings(recompress_streams=True)).optimize(writer)
+
+    assert stats["streams"] == 2
+    assert stats["optimized"] == 2
+    image = _write(writer).pages[0]["/Resources"]["/XObject"]["/Im1"]
+    assert image.get_data() == before
+    assert image["/Width"] == 60
+
+
+def test_optimize_uses_cache(tmpdir):
+    settings = optimize_settings(recompress_streams=True, compress_content=True)
+    outputs = []
+    for expected_cached in [0, 2]:
+        writer = pypdf.PdfWriter()
+        _page(writer)
+        optimizer = OutputOptimizer(settings, cache_dir=str(tmpdir))
+        stats = optimizer.optimize(writer)
+        assert stats["cached"] == expected_cached
+        assert stats["optimized"] == 2
+        outputs.append(_write(writer).pages[0]["/Contents"].get_data())
+
+    assert outputs[0] == outputs[1]
+
+
+def test_parallel_optimize_matches_serial():
+    settings = optimize_settings(recompress_streams=True)
+    outputs = []
+    for max_workers in [None, 2]:
+        writer = pypdf.PdfWriter()
+        for _ in range(3):
+            _page(writer)
+        with OutputOptimizer(settings, max_workers=max_workers) as optimizer:
+            optimizer.optimize(writer)
+        buffer = BytesIO()
+        writer.write(buffer)
+        outputs.append(buffer.getvalue())
+
+    assert outputs[0] == outputs[1]
+
+
+def test_streaming_writer_optimizes_each_flush():
+    buffer = BytesIO()
+    with OutputOptimizer(optimize_settings(compress_content=True)) as optimizer:
+        writer = StreamingPdfWriter(buffer, optimizer=optimizer)
+        for _ in range(2):
+            _page(writer)
+            writer.flush()
+        writer.close()
+
+    assert optimizer.stats["optimized"] == 2
+    reader = pypdf.PdfReader(BytesIO(buffer.getvalue()), strict=True)
+    assert all(page["/Contents"]["/Filter"] == "/FlateDecode" for page in reader.pages)
+
+
+def test_downsample_and_jpeg():
+    pytest.importorskip("PIL")
+    writer = pypdf.PdfWriter()
+    # 1275 pixels across 8.5 inches is 150 dpi
+    _page(writer, image_size=(1275, 1650))
+
+    stats = OutputOptimizer(optimize_settings(image_dpi=50, jpeg_quality=60)).optimize(writer)
+
+    assert stats["optimized"] == 1
+    image = _write(writer).pages[0]["/Resources"]["/XObject"]["/Im1"]
+    assert image["/Filter"] == "/DCTDecode"
+    assert (image["/Width"], image["/Height"]) == (425, 550)
+
+
+def test_images_below_target_dpi_are_kept():
+    pytest.importorskip("PIL")
+    writer = pypdf.PdfWriter()
+    _page(writer)
+
+    stats = OutputOptimizer(optimize_settings(image_dpi=150)).optimize(writer)
+
+    assert stats["streams"] == 1
+    assert stats["optimized"] == 0
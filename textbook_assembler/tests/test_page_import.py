@@ -0,0 +1,170 @@
+from io import BytesIO
+
+import pypdf
+import pytest
+from pypdf.annotations import Link
+from pypdf.generic import (
+    ArrayObject,
+    DictionaryObject,
+    FloatObject,
+    NameObject,
+    TextStringObject,
+)
+
+from textbook_assembler.utils.page_import import import_pages, import_settings
+
+
+def _add_form_field(writer, page_numbers):
+    field = DictionaryObject(
+        {
+            NameObject("/FT"): NameObject("/Tx"),
+            NameObject("/T"): TextStringObject("student_name"),
+            NameObject("/Kids"): ArrayObject(),
+        }
+    )
+    field_ref = writer._add_object(field)
+    for page_number in page_numbers:
+        page = writer.pages[page_number]
+        widget = DictionaryObject(
+            {
+                NameObject("/Type"): NameObject("/Annot"),
+                NameObject("/Subtype"): NameObject("/Widget"),
+                NameObject("/Rect"): ArrayObject([FloatObject(x) for x in (72, 72, 300, 90)]),
+                NameObject("/Parent"): field_ref,
+                NameObject("/P"): page.indirect_reference,
+            }
+        )
+        widget_ref = writer._add_object(widget)
+        field["/Kids"].append(widget_ref)
+        page.setdefault(NameObject("/Annots"), ArrayObject()).append(widget_ref)
+
+    writer._root_object[NameObject("/AcroForm")] = writer._add_object(
+        DictionaryObject({NameObject("/Fields"): ArrayObject([field_ref])})
+    )
+
+
+# A 6 page source with a bookmark and a named destination per page, links from every page to the
+# first and last page and out to a URL, and a form field with a widget on pages 1 and 5
+@pytest.fixture
+def source():
+    writer = pypdf.PdfWriter()
+    for page_number in range(6):
+        writer.add_blank_page(width=612, height=792)
+        writer.add_outline_item(f"Section {page_number + 1}", page_number)
+        writer.add_named_destination(f"section{page_number + 1}", page_number)
+    for page_number in range(6):
+        for target in (0, 5):
+            writer.add_annotation(page_number, Link(rect=(0, 0, 10, 10), target_page_index=target))
+        writer.add_annotation(page_number, Link(rect=(0, 20, 10, 30), url="https://example.com"))
+    _add_form_field(writer, [1, 4])
+
+    buffer = BytesIO()
+    writer.write(buffer)
+    return pypdf.PdfReader(BytesIO(buffer.getvalue()))
+
+
+def _write(writer):
+    buffer = BytesIO()
+    writer.write(buffer)
+    return pypdf.PdfReader(BytesIO(buffer.getvalue()), strict=True)
+
+
+def _subtypes(page):
+    return sorted(annot.get_object()["/Subtype"] for annot in page.get("/Annots", []))
+
+
+def test_import_settings():
+    assert import_settings() is None
+    assert import_settings(lean=True, links=False) == {
+        "outline": True,
+        "links": False,
+        "forms": True,
+    }
+    with pytest.raises(ValueError, match="needs the lean page import"):
+        import_settings(outline=False)
+
+
+def test_import_pages_only_clones_selected_pages(source):
+    writer = pypdf.PdfWriter()
+
+    import_pages(writer, source, (0, 2))
+
+    page_objects = [obj for obj in writer._objects if isinstance(obj, pypdf.PageObject)]
+    assert len(page_objects) == 2
+
+    result = _write(writer)
+    assert len(result.pages) == 2
+    # The link to page 6 is dropped, the one to page 1 and the URL are kept
+    assert _subtypes(result.pages[0]) == ["/Link", "/Link"]
+    first_page = result.pages[0]["/Annots"][0].get_object()
+    assert first_page["/Dest"][0] == result.pages[0].indirect_reference
+    assert [item.title for item in result.outline] == ["Section 1", "Section 2"]
+    assert result.named_destinations == {}
+
+
+def test_import_pages_keeps_form_fields_of_imported_widgets(source):
+    writer = pypdf.PdfWriter()
+
+    import_pages(writer, source, (1, 3))
+
+    result = _write(writer)
+    assert "/Widget" in _subtypes(result.pages[0])
+    (field,) = result.trailer["/Root"]["/AcroForm"]["/Fields"]
+    assert field.get_object()["/T"] == "student_name"
+    assert len(field.get_object()["/Kids"]) == 1
+
+
+def test_import_pages_drops_requested_parts(source):
+    writer = pypdf.PdfWriter()
+
+    import_pages(writer, source, (0, 6), outline=False, links=False, forms=False)
+
+    result = _write(writer)
+    assert len(result.pages) == 6
+    assert all(_subtypes(page) == [] for page in result.pages)
+    assert result.outline == []
+    assert "/AcroForm" not in result.trailer["/Root"]
+
+
+def test_import_pages_resolves_named_destinations(source):
+    writer = pypdf.PdfWriter()
+    page = source.pages[2]
+    link = source.get_object(page["/Annots"][0].idnum)
+    link[NameObject("/Dest")] = TextStringObject("section3")
+
+    import_pages(writer, source, (2, 3), outline=False, forms=False)
+
+    result = _write(writer)
+    annot = result.pages[0]["/Annots"][0].get_object()
+    assert annot["/Dest"][0] == result.pages[0].indirect_reference
+
+
+def test_import_pages_keeps_nested_outline_items():
+    writer = pypdf.PdfWriter()
+    for _ in range(4):
+        writer.add_blank_page(width=612, height=792)
+    writer.add_named_destination("part2", 2)
+    chapter = writer.add_outline_item("Chapter", 0, color=(1, 0, 0), bold=True, is_open=False)
+    writer.add_outline_item("Part 1", 1, parent=chapter, italic=True)
+    part = writer.add_outline_item("Part 2", None, parent=chapter)
+    part.get_object()[NameObject("/Dest")] = TextStringObject("part2")
+    writer.add_outline_item("Appendix", 3)
+    source = _write(writer)
+    named_destinations = vars(source).get("_named_destinations")
+
+    writer = pypdf.PdfWriter()
+    import_pages(writer, source, (1, 3))
+
+    result = _write(writer)
+    # The chapter's page wasn't imported, but it is kept to hold its parts
+    chapter, parts = result.outline
+    assert chapter.title == "Chapter"
+    assert result.get_destination_page_number(chapter) is None
+    assert chapter["/C"] == [1, 0, 0]
+    assert chapter["/F"] == 2
+    assert chapter["/Count"] < 0
+    assert [item.title for item in parts] == ["Part 1", "Part 2"]
+    assert [result.get_destination_page_number(item) for item in parts] == [0, 1]
+    assert parts[0]["/F"] == 1
+    # The source reader is left as it was
+    assert vars(source).get("_named_destinations") is named_destinations
@@ -0,0 +1,113 @@
+import os
+import shutil
+
+import pandas as pd
+import pypdf
+import pytest
+
+from textbook_assembler.utils import pdf_index
+from textbook_assembler.utils.data import fill_page_numbers, validate_page_ranges
+from textbook_assembler.utils.pdf_index import PdfIndex, default_index_path
+
+
+@pytest.fixture
+def pdf_dir(tmpdir):
+    pdf_path = os.path.join(tmpdir, "pdfs")
+    shutil.copytree("textbook_assembler/tests/resources/pdfs", pdf_path)
+    return pdf_path
+
+
+def test_index_reads_pdf_metadata(pdf_dir):
+    index = PdfIndex(pdf_dir)
+    index.refresh(["rbc_notes_2017.pdf"])
+    entry = index.entries["rbc_notes_2017.pdf"]
+
+    assert entry["pages"] == 25
+    assert len(entry["page_sizes"]) == 25
+    assert entry["encrypted"] is False
+    assert set(entry) >= {"size", "mtime_ns", "linearized"}
+
+
+def test_index_hashes_only_when_kept(pdf_dir, monkeypatch):
+    hashed = []
+    monkeypatch.setattr(pdf_index, "hash_file", lambda path: hashed.append(path) or "digest")
+
+    PdfIndex(pdf_dir).refresh(["rbc_notes_2017.pdf"])
+    assert hashed == []
+
+    index = PdfIndex(pdf_dir, index_path=os.path.join(pdf_dir, "..", "index.json"))
+    index.refresh(["rbc_notes_2017.pdf"])
+    assert index.entries["rbc_notes_2017.pdf"]["sha256"] == "digest"
+
+
+def test_default_index_path_is_outside_the_sources(tmpdir):
+    path = default_index_path("materials/pdfs", str(tmpdir))
+
+    assert os.path.dirname(path) == str(tmpdir)
+    assert path == default_index_path(os.path.abspath("materials/pdfs"), str(tmpdir))
+    assert path != default_index_path("other/pdfs", str(tmpdir))
+
+
+def test_unreadable_sources_are_reported(pdf_dir):
+    writer = pypdf.PdfWriter()
+    writer.add_blank_page(width=612, height=792)
+    writer.encrypt("secret")
+    with open(os.path.join(pdf_dir, "locked.pdf"), "wb") as file:
+        writer.write(file)
+
+    index = PdfIndex(pdf_dir)
+    data = pd.DataFrame(
+        [
+            {
+                "reference": "S1",
+                "filename": "rbc_notes_2017.pdf",
+                "page_start": 1,
+                "page_end": None,
+            },
+            {"reference": "S2", "filename": "locked.pdf", "page_start": 1, "page_end": None},
+        ]
+    )
+
+    with pytest.raises(ValueError, match="Could not count the pages of locked.pdf"):
+        fill_page_numbers(data, pdf_dir, index=index)
+    assert index.entries["locked.pdf"]["encrypted"]
+
+
+def test_index_only_parses_changed_files(pdf_dir):
+    index_path = os.path.join(pdf_dir, "index.json")
+    fnames = ["rbc_notes_2017.pdf", "uribe-notes.pdf"]
+    PdfIndex(pdf_dir, index_path=index_path).refresh(fnames)
+
+    index = PdfIndex(pdf_dir, index_path=index_path)
+    index.refresh(fnames)
+    assert index.parse_count == 0
+
+    # Touching a file changes its mtime but not its content, so it is re-hashed but not re-parsed
+    os.utime(os.path.join(pdf_dir, "uribe-notes.pdf"), (0, 0))
+    index.refresh(fnames)
+    assert index.parse_count == 0
+
+    shutil.copy(
+        os.path.join(pdf_dir, "rbc_extensions_sp17.pdf"), os.path.join(pdf_dir, "uribe-notes.pdf")
+    )
+    index.refresh(fnames)
+    assert index.parse_count == 1
+    assert index.page_count("uribe-notes.pdf") == index.page_count("rbc_extensions_sp17.pdf")
+
+
+def test_validate_page_ranges(pdf_dir):
+    index = PdfIndex(pdf_dir)
+    data = pd.DataFrame(
+        [
+            {"reference": "S1", "filename": "rbc_notes_2017.pdf", "page_start": 1, "page_end": 25},
+            {"reference": "S2", "filename": "rbc_notes_2017.pdf", "page_start": 9, "page_end": 3},
+            {"reference": "S3", "filename": "rbc_notes_2017.pdf", "page_start": 1, "page_end": 30},
+        ]
+    )
+
+    with pytest.raises(ValueError) as error:
+        validate_page_ranges(data, index)
+
+    assert "S1" not in str(error.value)
+    assert "S2 starts on page 9 after it ends" in str(error.value)
+    assert "S3 ends on page 30, but rbc_notes_2017.pdf only has 25 pages" in str(error.value)
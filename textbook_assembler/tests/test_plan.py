@@ -0,0 +1,137 @@
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from textbook_assembler.utils import plan as plan_module
+from textbook_assembler.utils.plan import BuildPlan, TaskError, format_plan, run_plan
+
+
+def _fail(message):
+    raise ValueError(message)
+
+
+def test_tasks_run_after_their_dependencies():
+    order = []
+    plan = BuildPlan()
+    plan.add("load", "main", order.append, "load")
+    plan.add("cover", "subprocess", order.append, "cover", deps=["load"])
+    plan.add("merge", "main", order.append, "merge", deps=["load", "cover"])
+    plan.add("extract", "cpu", pow, 2, 10, deps=["load"])
+    run_plan(plan, max_workers=1, max_subprocesses=2)
+
+    assert order.index("load") < order.index("cover") < order.index("merge")
+    assert plan.result("extract") == 1024
+    assert plan.pending() == []
+
+
+def test_subprocess_tasks_respect_their_limit():
+    lock = threading.Lock()
+    running = []
+    peak = []
+
+    def compile_week():
+        with lock:
+            running.append(1)
+            peak.append(len(running))
+        time.sleep(0.05)
+        with lock:
+            running.pop()
+
+    plan = BuildPlan()
+    for week in range(6):
+        plan.add(f"cover[{week}]", "subprocess", compile_week)
+    run_plan(plan, max_subprocesses=2)
+
+    assert max(peak) == 2
+
+
+def test_cpu_tasks_run_in_worker_processes():
+    plan = BuildPlan()
+    for i in range(4):
+        plan.add(f"square[{i}]", "cpu", pow, i, 2)
+    run_plan(plan, max_workers=2)
+
+    assert [plan.result(f"square[{i}]") for i in range(4)] == [0, 1, 4, 9]
+
+
+def test_cpu_workers_start_before_subprocess_threads(monkeypatch):
+    workers = []
+
+    def thread_pool(**kwargs):
+        workers.append(len(multiprocessing.active_children()))
+        return ThreadPoolExecutor(**kwargs)
+
+    monkeypatch.setattr(plan_module, "ThreadPoolExecutor", thread_pool)
+    plan = BuildPlan()
+    plan.add("cover", "subprocess", time.sleep, 0)
+    plan.add("extract", "cpu", pow, 2, 10)
+    run_plan(plan, max_workers=2, max_subprocesses=2)
+
+    assert workers == [2]
+
+
+def test_failed_task_stops_the_plan():
+    plan = BuildPlan()
+    plan.add("cover", "main", _fail, "no pdflatex")
+    plan.add("merge", "main", print, deps=["cover"])
+
+    with pytest.raises(ValueError, match="no pdflatex"):
+        run_plan(plan)
+    assert plan["merge"].finished is None
+
+
+def test_several_failures_are_collected():
+    plan = BuildPlan()
+    plan.add("cover[1]", "subprocess", _fail, "bad bibtex")
+    plan.add("cover[2]", "subprocess", _fail, "no pdflatex")
+
+    with pytest.raises(TaskError) as excinfo:
+        run_plan(plan, max_subprocesses=2)
+    assert set(excinfo.value.errors) == {"cover[1]", "cover[2]"}
+
+
+def test_tasks_independent_of_a_failure_still_run():
+    plan = BuildPlan()
+    plan.add("lessons", "main", print)
+    for week in range(1, 4):
+        plan.add(f"cover[{week}]", "subprocess", _fail, f"week {week}", deps=["lessons"])
+    plan.add("cover[4]", "subprocess", time.sleep, 0, deps=["lessons"])
+    plan.add("merge[4]", "main", print, deps=["cover[4]", "cover[1]"])
+
+    with pytest.raises(TaskError) as excinfo:
+        run_plan(plan, max_subprocesses=1)
+    assert set(excinfo.value.errors) == {"cover[1]", "cover[2]", "cover[3]"}
+    assert plan["cover[4]"].done
+    assert plan["merge[4]"].finished is None
+
+
+def test_plan_rejects_unknown_tasks():
+    plan = BuildPlan()
+    plan.add("load", "main", print)
+    with pytest.raises(ValueError, match="unknown task"):
+        plan.add("merge", "main", print, deps=["cover"])
+    with pytest.raises(ValueError, match="already has"):
+        plan.add("load", "main", print)
+    with pytest.raises(ValueError, match="Unknown task kind"):
+        plan.add("cover", "thread", print)
+
+
+def test_critical_path_and_format_plan():
+    plan = BuildPlan()
+    plan.add("load", "main", time.sleep, 0.01)
+    plan.add("cover", "subprocess", time.sleep, 0.05, deps=["load"])
+    plan.add("extract", "main", time.sleep, 0.01, deps=["load"], pages=12)
+    plan.add("merge", "main", time.sleep, 0, deps=["cover", "extract"])
+    assert "after load" in format_plan(plan)
+    run_plan(plan, max_subprocesses=2)
+
+    seconds, names = plan.critical_path()
+    assert names == ["load", "cover", "merge"]
+    assert seconds >= 0.06
+
+    text = format_plan(plan)
+    assert text.splitlines()[0] == "4 task(s): 3 main, 1 subprocess"
+    assert "12 pages" in text and "done in" in text
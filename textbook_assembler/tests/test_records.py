@@ -0,0 +1,83 @@
+import pickle
+
+import pandas as pd
+import pytest
+
+from textbook_assembler.utils.cache import CoverSheetCache
+from textbook_assembler.utils.constants import EXPECTED_KEYS
+from textbook_assembler.utils.data import load_and_process_data
+from textbook_assembler.utils.latex import (
+    _data_to_bibtex,
+    cover_sheet_key,
+    template_fingerprint,
+)
+from textbook_assembler.utils.records import Lesson, LessonPlan, as_lesson_plan, as_week
+
+LOCAL_INPUTS = [
+    "textbook_assembler/tests/resources/csvs/test_local.csv",
+    "textbook_assembler/tests/resources/pdfs",
+    "textbook_assembler/tests/resources/config/ref_to_file_local.yaml",
+    "textbook_assembler/tests/resources/bibtex/test2.bib",
+]
+
+
+def test_lesson_reads_like_a_row():
+    lesson = Lesson(
+        {"week": 2, "reference": "S1", "page_start": 1.0, "filename": "rbc.pdf", "url": "u"}
+    )
+
+    assert lesson["week"] == 2
+    assert lesson.filename == lesson["filename"] == "rbc.pdf"
+    assert lesson.get("topic") is None
+    assert lesson.get("author", "none") == "none"
+    assert list(lesson) == EXPECTED_KEYS + ["filename", "url"]
+    assert not hasattr(lesson, "__dict__")
+    with pytest.raises(KeyError):
+        lesson["author"]
+
+
+def test_lesson_plan_groups_weeks_in_order():
+    data = pd.DataFrame(
+        {
+            "week": [2, 1, 2, 1],
+            "topic": ["RBC", "PIH", "RBC II", "PIH"],
+            "reference": ["S1", "U", "S2", "SE"],
+            "filename": ["a.pdf", None, "b.pdf", "a.pdf"],
+        }
+    )
+
+    plan = LessonPlan.from_frame(data)
+
+    assert list(plan.weeks) == [1, 2]
+    assert [lesson.reference for lesson in plan.weeks[2]] == ["S1", "S2"]
+    assert plan.weeks[2].topic == "RBC"
+    assert plan.weeks[1].filenames() == ["a.pdf"]
+    assert plan.filenames() == ["a.pdf", "b.pdf"]
+    assert list(plan.select([2]).weeks) == [2]
+    pd.testing.assert_frame_equal(plan.to_frame(), data)
+
+
+def test_cover_sheet_keys_match_dataframe_rows():
+    data = load_and_process_data(*LOCAL_INPUTS)
+    plan = as_lesson_plan(data)
+
+    for week_number, group in data.groupby("week"):
+        rows = list(group.T.to_dict().values())
+        expected = CoverSheetCache.make_key(
+            template_fingerprint("latex"),
+            week_number,
+            [{k: row.get(k) for k in EXPECTED_KEYS} for row in rows],
+            [_data_to_bibtex(row) for row in rows],
+        )
+        assert cover_sheet_key("latex", plan.weeks[week_number]) == expected
+
+
+def test_as_week():
+    data = load_and_process_data(*LOCAL_INPUTS)
+    week = as_week(data[data.week == 2])
+
+    assert week.number == 2
+    assert as_week(week) is week
+    assert pickle.loads(pickle.dumps(week)).lessons[0]["reference"] == week.lessons[0].reference
+    with pytest.raises(ValueError, match="single week"):
+        as_week(data)
@@ -1,11 +1,17 @@
+import os
+
 import pytest
 
+from textbook_assembler.utils import references
 from textbook_assembler.utils.references import (
+    BibtexCache,
+    FilenameIndex,
     find_by_full_name,
     find_by_partial_name,
     get_pdf_names,
     get_referenced_bibtex_data,
     load_bibtex_data,
+    load_bibtex_entries,
     load_reference_list,
     match_references_to_pdf_filenames,
 )
@@ -99,3 +105,141 @@ def test_get_referenced_bibtex():
 
     assert len(referenced_bibtex) == len(ref_dict)
     assert (set(referenced_bibtex.keys()) - set(ref_dict.keys())) == set()
+
+
+@pytest.mark.parametrize(
+    "fname, expected",
+    [
+        ("RBC_NOTES_2017.pdf", "rbc_notes_2017.pdf"),
+        ("rbc_notes_2017", None),
+        ("rbc_notes...", "rbc_notes_2017.pdf"),
+        ("Stylized...", "stylized_facts_rbc_sp17.pdf"),
+        ("zzz...", None),
+    ],
+)
+def test_filename_index_matches_linear_search(fname, expected):
+    all_files = get_pdf_names("textbook_assembler/tests/resources/pdfs")
+    index = FilenameIndex(all_files)
+
+    linear = find_by_partial_name if fname.endswith("...") else find_by_full_name
+    assert index.find(fname) == linear(fname, all_files) == expected
+
+
+def test_filename_index_ambiguous_prefix():
+    index = FilenameIndex(["Notes_A.pdf", "notes_b.pdf", "slides.pdf"])
+    with pytest.raises(
+        ValueError,
+        match="Ambiguous partial file name, found two possible matches: notes_a.pdf, notes_b.pdf",
+    ):
+        index.find("notes...")
+
+
+def test_match_references_accepts_prebuilt_index():
+    ref_dict = {"S1": "rbc_notes...", "U": "URIBE-notes.pdf"}
+    index = FilenameIndex(get_pdf_names("textbook_assembler/tests/resources/pdfs"))
+
+    assert match_references_to_pdf_filenames(ref_dict, index) == {
+        "S1": "rbc_notes_2017.pdf",
+        "U": "uribe-notes.pdf",
+    }
+    with pytest.raises(ValueError, match="missing.pdf not found among PDF files"):
+        match_references_to_pdf_filenames({"M": "missing.pdf"}, index)
+
+
+BIBLIOGRAPHY = """% A comment mentioning @misc{NOT_AN_ENTRY,
+@string{nd = "University of Notre Dame"}
+
+@misc{S1,
+    title = {The {RBC} Model (Part I)},
+    institution = nd,
+    month = jan,
+}
+
+@comment{S2, title = {Ignored}}
+
+@online{WEB, title = {Not a standard type}}
+
+@unpublished(U,
+    title = {Lectures in Open Economy Macroeconomics},
+    note = {Chapter (1)},
+)
+"""
+
+
+@pytest.mark.parametrize("fname", ["test1.bib", "test2.bib"])
+def test_load_bibtex_entries_matches_full_parse(fname):
+    path = os.path.join("textbook_assembler/tests/resources/bibtex", fname)
+    full = load_bibtex_data(path)
+    ids = [entry["ID"] for entry in full.entries]
+
+    scanned = load_bibtex_entries(path, ids[::2])
+
+    assert scanned.ids == ids
+    assert scanned.entries == full.entries[::2]
+
+
+def test_load_bibtex_entries_only_parses_requested(tmpdir):
+    path = os.path.join(tmpdir, "refs.bib")
+    with open(path, "w") as file:
+        file.write(BIBLIOGRAPHY)
+
+    scanned = load_bibtex_entries(path, ["U", "S1", "MISSING"])
+
+    assert scanned.ids == ["S1", "U"]
+    assert scanned.entries == load_bibtex_data(path).entries
+    assert scanned.entries[0]["institution"] == "University of Notre Dame"
+    assert load_bibtex_entries(path, ["U"]).entries[0]["note"] == "Chapter (1)"
+
+
+def test_parenthesized_entries_keep_quoted_parentheses(tmpdir):
+    path = os.path.join(tmpdir, "refs.bib")
+    with open(path, "w") as file:
+        file.write(
+            "@misc(k1, title = {Braced (one)})\n"
+            '@misc(k2, title = "Effects (robust) of x", note = "a {"} b)")\n'
+            "@misc{k3, title = {After}}\n"
+        )
+
+    scanned = load_bibtex_entries(path, ["k1", "k2", "k3"])
+
+    assert scanned.entries == load_bibtex_data(path).entries
+    assert [entry["ID"] for entry in scanned.entries] == ["k1", "k2", "k3"]
+    assert scanned.entries[1]["title"] == "Effects (robust) of x"
+
+
+def test_bibtex_cache_key_covers_the_parser(tmpdir, monkeypatch):
+    path = os.path.join(tmpdir, "refs.bib")
+    with open(path, "w") as file:
+        file.write(BIBLIOGRAPHY)
+    cache_dir = os.path.join(tmpdir, "cache")
+    BibtexCache(cache_dir).load(path, ["U"])
+
+    monkeypatch.setattr(references, "BIBTEX_SCANNER_VERSION", references.BIBTEX_SCANNER_VERSION + 1)
+    cache = BibtexCache(cache_dir)
+    cache.load(path, ["U"])
+    assert cache.parse_count == 1
+
+
+def test_bibtex_cache_keeps_parsed_entries_on_disk(tmpdir):
+    path = os.path.join(tmpdir, "refs.bib")
+    with open(path, "w") as file:
+        file.write(BIBLIOGRAPHY)
+    cache_dir = os.path.join(tmpdir, "cache")
+
+    first = BibtexCache(cache_dir)
+    assert [e["ID"] for e in first.load(path, ["U"]).entries] == ["U"]
+    assert [e["ID"] for e in first.load(path, ["S1", "U"]).entries] == ["S1", "U"]
+    assert first.parse_count == 2
+
+    # A new process parses nothing, including for IDs that aren't in the file
+    second = BibtexCache(cache_dir)
+    loaded = second.load(path, ["S1", "U", "MISSING"])
+    assert second.parse_count == 0
+    assert loaded.entries == load_bibtex_data(path).entries
+    assert loaded.ids == ["S1", "U"]
+
+    with open(path, "a") as file:
+        file.write("@misc{NEW, title = {New}}\n")
+    third = BibtexCache(cache_dir)
+    assert [e["ID"] for e in third.load(path, ["S1", "NEW"]).entries] == ["S1", "NEW"]
+    assert third.parse_count == 1
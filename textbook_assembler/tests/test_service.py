@@ -0,0 +1,151 @@
+import asyncio
+import json
+
+import pytest
+from pypdf import PdfReader
+
+from textbook_assembler.main import course_to_kwargs, parse_args
+from textbook_assembler.utils import service as service_module
+from textbook_assembler.utils.service import BuildService
+
+LOCAL_INPUTS = {
+    "data_path": "textbook_assembler/tests/resources/csvs/test_local.csv",
+    "pdf_path": "textbook_assembler/tests/resources/pdfs",
+    "ref_path": "textbook_assembler/tests/resources/config/ref_to_file_local.yaml",
+    "bibtex_path": "textbook_assembler/tests/resources/bibtex/test2.bib",
+    "out_path": "textbook.pdf",
+}
+
+
+def config_to_kwargs(config):
+    unknown = set(config) - {"streaming"}
+    if unknown:
+        raise ValueError(f"unknown options {unknown}")
+    return {**LOCAL_INPUTS, **config}
+
+
+async def request(port, method, path, body=None, headers=None):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    payload = json.dumps(body).encode() if body is not None else b""
+    lines = [f"{method} {path} HTTP/1.1", "Host: localhost", f"Content-Length: {len(payload)}"]
+    lines += [f"{key}: {value}" for key, value in (headers or {}).items()]
+    writer.write(("\r\n".join(lines) + "\r\n\r\n").encode() + payload)
+    await writer.drain()
+
+    response = await reader.read()
+    writer.close()
+    head, _, content = response.partition(b"\r\n\r\n")
+    status_line, *header_lines = head.decode().split("\r\n")
+    response_headers = dict(line.split(": ", 1) for line in header_lines)
+    return int(status_line.split()[1]), response_headers, content
+
+
+def run_service(tmpdir, scenario):
+    async def main():
+        service = BuildService(config_to_kwargs, str(tmpdir))
+        await service.start("127.0.0.1", 0)
+        try:
+            return await scenario(service)
+        finally:
+            await service.close()
+
+    return asyncio.run(main())
+
+
+def test_build_and_download(tmpdir, blank_cover_sheets, monkeypatch):
+    # Small chunks, so the download is sent in several pieces
+    monkeypatch.setattr(service_module, "OUTPUT_CHUNK_SIZE", 1024)
+
+    async def scenario(service):
+        status, _, content = await request(service.port, "POST", "/build", {})
+        assert status == 200
+        result = json.loads(content)
+
+        status, headers, pdf = await request(service.port, "GET", result["url"])
+        assert status == 200
+        assert int(headers["Content-Length"]) == len(pdf)
+        assert headers["Content-Type"] == "application/pdf"
+        assert headers["ETag"] == f'"{result["id"]}"'
+
+        status, _, cached = await request(
+            service.port, "GET", result["url"], headers={"If-None-Match": headers["ETag"]}
+        )
+        assert status == 304
+        assert cached == b""
+
+        return result, pdf
+
+    result, pdf = run_service(tmpdir, scenario)
+    path = f"{tmpdir}/downloaded.pdf"
+    with open(path, "wb") as file:
+        file.write(pdf)
+    assert len(PdfReader(path).pages) == result["pages"]
+    assert not result["coalesced"]
+
+
+def test_identical_requests_share_a_build(tmpdir, blank_cover_sheets):
+    async def scenario(service):
+        results = await asyncio.gather(
+            service.build({}), service.build({}), service.build({"streaming": True})
+        )
+        return service.builds_started, results
+
+    builds_started, (first, second, streaming) = run_service(tmpdir, scenario)
+
+    assert builds_started == 2
+    assert first["id"] == second["id"]
+    assert [first["coalesced"], second["coalesced"], streaming["coalesced"]] == [
+        False,
+        True,
+        False,
+    ]
+
+
+def test_repeated_request_is_up_to_date(tmpdir, blank_cover_sheets):
+    async def scenario(service):
+        first = await service.build({})
+        second = await service.build({})
+        return first, second
+
+    first, second = run_service(tmpdir, scenario)
+    assert not first["up_to_date"]
+    assert second["up_to_date"]
+    assert second["id"] == first["id"]
+
+
+@pytest.mark.parametrize(
+    "method, path, body, status",
+    [
+        ("POST", "/build", {"unknown": 1}, 400),
+        ("POST", "/build", [1, 2], 400),
+        ("GET", "/build", None, 405),
+        ("GET", f"/outputs/{'0' * 64}.pdf", None, 404),
+        ("GET", "/nothing", None, 404),
+        ("GET", "/health", None, 200),
+    ],
+)
+def test_request_errors(tmpdir, method, path, body, status):
+    async def scenario(service):
+        return await request(service.port, method, path, body)
+
+    response_status, _, content = run_service(tmpdir, scenario)
+    assert response_status == status
+    assert isinstance(json.loads(content), dict)
+
+
+def test_course_to_kwargs():
+    args = parse_args(["-l", "macro.csv", "-s", "shared/pdfs", "--serve"])
+    kwargs = course_to_kwargs(args, {"streaming": True, "image_dpi": 150})
+
+    assert kwargs["data_path"] == "macro.csv"
+    assert kwargs["pdf_path"] == "shared/pdfs"
+    assert kwargs["streaming"] and kwargs["image_dpi"] == 150
+    with pytest.raises(ValueError, match="Build config has unknown options: unknown"):
+        course_to_kwargs(args, {"unknown": 1})
+
+
+@pytest.mark.parametrize("option", ["lesson_path", "split_dir", "cache_dir", "pdf_index", "jobs"])
+def test_course_to_kwargs_rejects_paths_and_resources(option):
+    args = parse_args(["--serve"])
+    with pytest.raises(ValueError, match=f"Build config can't set {option}"):
+        course_to_kwargs(args, {option: "/etc/passwd"})
@@ -0,0 +1,76 @@
+import json
+
+import pytest
+
+from textbook_assembler.utils import tracing
+from textbook_assembler.utils.tracing import Tracer, traced
+
+
+def test_span_is_a_no_op_without_tracer():
+    assert tracing.get_tracer() is None
+    with tracing.span("stage", week=1) as span:
+        span.add(pages=3)
+    tracing.count(bytes_read=10)
+
+    assert tracing.span("stage") is tracing.span("other")
+
+
+def test_spans_nest_and_collect_counters():
+    with tracing.tracing() as tracer:
+        with tracing.span("outer"):
+            tracing.count(bytes_read=100)
+            with tracing.span("inner", week=2) as span:
+                span.add(pages=3)
+                tracing.count(pages=2)
+
+    assert tracing.get_tracer() is None
+    spans = {s.name: s for s in tracer.spans}
+    assert spans["outer"].depth == 0
+    assert spans["inner"].depth == 1
+    assert spans["outer"].counters == {"bytes_read": 100}
+    assert spans["inner"].counters == {"pages": 5}
+    assert spans["inner"].attrs == {"week": 2}
+    assert spans["outer"].wall >= spans["inner"].wall
+
+
+def test_traced_decorator():
+    @traced("stage")
+    def f(x):
+        return x + 1
+
+    assert f(1) == 2
+    with tracing.tracing() as tracer:
+        assert f(2) == 3
+
+    assert [s.name for s in tracer.spans] == ["stage"]
+
+
+def test_span_records_errors():
+    tracer = Tracer()
+    with pytest.raises(ValueError):
+        with tracing.tracing(tracer):
+            with tracing.span("stage"):
+                raise ValueError
+
+    assert tracer.spans[0].attrs["error"] == "ValueError"
+
+
+def test_chrome_trace_and_summary(tmpdir):
+    with tracing.tracing() as tracer:
+        for week in range(3):
+            with tracing.span("week", week=week) as span:
+                span.add(pages=2)
+
+    path = f"{tmpdir}/trace.json"
+    tracer.write(path)
+    with open(path) as file:
+        events = json.load(file)["traceEvents"]
+
+    assert len(events) == 3
+    assert all(event["ph"] == "X" for event in events)
+    assert [event["args"]["week"] for event in events] == [0, 1, 2]
+
+    (row,) = tracer.summarize()
+    assert row["calls"] == 3
+    assert row["pages"] == 6
+    assert "week" in tracer.format_summary()
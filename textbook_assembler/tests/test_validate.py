@@ -0,0 +1,108 @@
+import os
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+from textbook_assembler.utils.pdf_index import default_index_path
+from textbook_assembler.utils.validate import validate_courses, validate_inputs
+
+RESOURCES = "textbook_assembler/tests/resources"
+
+
+@pytest.fixture
+def inputs(tmpdir):
+    # A private copy of the sources, so tests can change them
+    pdf_path = os.path.join(tmpdir, "pdfs")
+    shutil.copytree(f"{RESOURCES}/pdfs", pdf_path)
+    return {
+        "data_path": f"{RESOURCES}/csvs/test_local.csv",
+        "pdf_path": pdf_path,
+        "ref_path": f"{RESOURCES}/config/ref_to_file_local.yaml",
+        "bibtex_path": f"{RESOURCES}/bibtex/test2.bib",
+    }
+
+
+def _write_lesson_plan(tmpdir, rows):
+    path = os.path.join(tmpdir, "lesson_plan.csv")
+    with open(path, "w") as file:
+        file.write("Week,Date,Topic,Reference,Chapter,page_start,page_end\n")
+        file.writelines(row + "\n" for row in rows)
+    return path
+
+
+def test_validate_inputs(inputs):
+    assert validate_inputs(**inputs) == []
+
+
+def test_validate_inputs_reports_every_problem(tmpdir, inputs):
+    inputs["data_path"] = _write_lesson_plan(
+        tmpdir,
+        [
+            "1,11-Oct,Permanent Income,U,1,9,15000",
+            "2,8-Nov,RBC,S1,,7,1",
+            "3,15-Nov,RBC II,MISSING,,,",
+        ],
+    )
+
+    errors = validate_inputs(**inputs)
+
+    assert len(errors) == 3
+    assert "References without a bibtex entry: MISSING" in errors
+    assert any("U ends on page 15000" in error for error in errors)
+    assert any("S1 starts on page 7 after it ends" in error for error in errors)
+
+
+def test_validate_inputs_reports_missing_columns(tmpdir, inputs):
+    path = os.path.join(tmpdir, "lesson_plan.csv")
+    with open(path, "w") as file:
+        file.write("Week,Date,Reference\n1,11-Oct,U\n")
+    inputs["data_path"] = path
+
+    errors = validate_inputs(**inputs)
+
+    assert len(errors) == 1
+    assert "missing the following columns" in errors[0]
+
+
+def test_validate_courses_labels_each_course(tmpdir, inputs):
+    broken = {**inputs, "ref_path": os.path.join(tmpdir, "refs.yaml")}
+    with open(broken["ref_path"], "w") as file:
+        file.write("U: not-a-real-file.pdf\n")
+
+    errors = validate_courses([("good", inputs), ("broken", broken)])
+
+    assert errors == [
+        "broken: U: not-a-real-file.pdf not found among PDF files in " + inputs["pdf_path"]
+    ]
+
+
+def test_validate_skips_pdf_and_latex_stack(inputs, tmpdir):
+    output_path = os.path.join(tmpdir, "output", "textbook.pdf")
+    args = [
+        "validate",
+        "-l",
+        inputs["data_path"],
+        "-s",
+        inputs["pdf_path"],
+        "-r",
+        inputs["ref_path"],
+        "-b",
+        inputs["bibtex_path"],
+        "-o",
+        output_path,
+    ]
+    # The first run indexes the sources, after which validating reads no PDF at all
+    index_path = default_index_path(inputs["pdf_path"], os.path.dirname(output_path))
+    assert validate_inputs(**inputs, index_path=index_path) == []
+    script = (
+        "import sys; from textbook_assembler.main import parse_args, run; "
+        f"run(parse_args({args!r})); "
+        "print(sorted(name for name in ('pypdf', 'pylatex') if name in sys.modules))"
+    )
+
+    result = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True)
+
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == "[]"
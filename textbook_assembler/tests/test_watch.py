@@ -0,0 +1,86 @@
+import os
+import shutil
+import threading
+import time
+
+from pypdf import PdfReader
+
+from textbook_assembler.utils.watch import Watcher, watch
+
+LOCAL_INPUTS = {
+    "data_path": "textbook_assembler/tests/resources/csvs/test_local.csv",
+    "pdf_path": "textbook_assembler/tests/resources/pdfs",
+    "ref_path": "textbook_assembler/tests/resources/config/ref_to_file_local.yaml",
+    "bibtex_path": "textbook_assembler/tests/resources/bibtex/test2.bib",
+}
+
+
+def _touch(path, text):
+    with open(path, "a") as file:
+        file.write(text)
+
+
+def test_watcher_detects_changes(tmpdir):
+    pdf_dir = tmpdir.mkdir("pdfs")
+    data_path = f"{tmpdir}/lesson_plan.csv"
+    _touch(data_path, "week\n")
+
+    watcher = Watcher([data_path, None], str(pdf_dir), interval=0.01, debounce=0.01)
+    assert watcher.poll() == set()
+
+    _touch(data_path, "1\n")
+    _touch(f"{pdf_dir}/new.pdf", "%PDF")
+    _touch(f"{pdf_dir}/.new.pdf.swp", "")
+    _touch(f"{pdf_dir}/.textbook_assembler_index.json", "{}")
+    assert watcher.poll() == {data_path, os.path.join(str(pdf_dir), "new.pdf")}
+
+    os.remove(f"{pdf_dir}/new.pdf")
+    assert watcher.poll() == {os.path.join(str(pdf_dir), "new.pdf")}
+
+
+def test_watcher_debounces_bursts(tmpdir):
+    data_path = f"{tmpdir}/lesson_plan.csv"
+    bib_path = f"{tmpdir}/citations.bib"
+    _touch(data_path, "week\n")
+    _touch(bib_path, "")
+    watcher = Watcher([data_path, bib_path], str(tmpdir.mkdir("pdfs")), interval=0.01, debounce=0.2)
+
+    def burst():
+        for i in range(5):
+            _touch(data_path if i % 2 else bib_path, f"{i}\n")
+            time.sleep(0.05)
+
+    thread = threading.Thread(target=burst)
+    thread.start()
+    changed = watcher.wait_for_changes()
+    thread.join()
+
+    assert changed == {data_path, bib_path}
+    assert watcher.poll() == set()
+
+
+def test_watch_rebuilds_changed_week(tmpdir, blank_cover_sheets):
+    data_path = f"{tmpdir}/lesson_plan.csv"
+    shutil.copy(LOCAL_INPUTS["data_path"], data_path)
+    out_path = f"{tmpdir}/textbook.pdf"
+    kwargs = {**LOCAL_INPUTS, "data_path": data_path, "out_path": out_path}
+
+    thread = threading.Thread(
+        target=watch, args=(kwargs,), kwargs={"interval": 0.01, "debounce": 0.05, "max_rebuilds": 1}
+    )
+    thread.start()
+    while not os.path.isfile(out_path):
+        time.sleep(0.01)
+    n_weeks = len(blank_cover_sheets)
+    n_pages = len(PdfReader(out_path).pages)
+
+    with open(data_path) as file:
+        lesson_plan = file.read()
+    # Changing the topic of the last week only invalidates that week
+    with open(data_path, "w") as file:
+        file.write(lesson_plan.replace("Small Open Economy", "Open Economy"))
+
+    thread.join(timeout=30)
+    assert not thread.is_alive()
+    assert len(blank_cover_sheets) == n_weeks + 1
+    assert len(PdfReader(out_path).pages) == n_pages
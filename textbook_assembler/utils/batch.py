@@ -0,0 +1,168 @@
+import logging
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import yaml
+
+from textbook_assembler.utils import tracing
+from textbook_assembler.utils.cache import (
+    DEFAULT_CACHE_SIZE,
+    CoverSheetCache,
+    cache_share,
+)
+from textbook_assembler.utils.make_text import assemble_textbook
+from textbook_assembler.utils.pdf_index import PdfIndex
+from textbook_assembler.utils.readers import DEFAULT_MAX_OPEN, ReaderPool
+from textbook_assembler.utils.references import BibtexCache
+
+_log = logging.getLogger("textbook_assembler")
+
+
+def load_batch_config(path):
+    with open(path) as file:
+        config = yaml.safe_load(file)
+
+    if isinstance(config, list):
+        config = {"courses": config}
+    if not isinstance(config, dict) or not config.get("courses"):
+        raise ValueError(f"Batch config {path} does not list any courses")
+
+    defaults = config.get("defaults") or {}
+    return [{**defaults, **course} for course in config["courses"]]
+
+
+class BatchBuildError(RuntimeError):
+    def __init__(self, errors):
+        self.errors = errors
+        details = "; ".join(f"{name}: {err}" for name, err in errors.items())
+        super().__init__(f"Failed to build {len(errors)} course(s). {details}")
+
+
+# State that builds running in the same process can share: parsed bibtex files, a reader pool and
+# PDF index per source directory, and a cover sheet cache per cache directory.
+class SharedResources:
+    def __init__(self):
+        self.bibtex = BibtexCache()
+        self._readers = {}
+        self._indexes = {}
+        self._caches = {}
+
+    def readers(self, pdf_path, max_open=DEFAULT_MAX_OPEN, use_mmap=True):
+        key = os.path.abspath(pdf_path)
+        if key not in self._readers:
+            self._readers[key] = ReaderPool(pdf_path, max_open=max_open, use_mmap=use_mmap)
+        return self._readers[key]
+
+    def index(self, pdf_path, index_path=None):
+        key = (os.path.abspath(pdf_path), index_path)
+        if key not in self._indexes:
+            self._indexes[key] = PdfIndex(pdf_path, index_path=index_path)
+        return self._indexes[key]
+
+    def cache(self, cache_dir, cache_size):
+        key = os.path.abspath(cache_dir)
+        if key not in self._caches:
+            self._caches[key] = CoverSheetCache(cache_dir, cache_share(cache_size, "cover_sheets"))
+        return self._caches[key]
+
+    def build(self, kwargs):
+        pdf_path = kwargs["pdf_path"]
+        shared = {
+            "readers": self.readers(
+                pdf_path,
+                kwargs.get("max_open_readers", DEFAULT_MAX_OPEN),
+                kwargs.get("use_mmap", True),
+            ),
+            "index": self.index(pdf_path, kwargs.get("index_path")),
+            "bibtex_cache": self.bibtex,
+        }
+        if kwargs.get("cache_dir"):
+            shared["cache"] = self.cache(
+                kwargs["cache_dir"], kwargs.get("cache_size", DEFAULT_CACHE_SIZE)
+            )
+
+        return assemble_textbook(**kwargs, **shared)
+
+    def close(self):
+        for readers in self._readers.values():
+            readers.close()
+
+
+def _timed_build(resources, name, kwargs):
+    start = time.perf_counter()
+    result = {"name": name, "out_path": kwargs["out_path"]}
+    try:
+        with tracing.span("course", name=name):
+            result["report"] = resources.build(kwargs)
+    except Exception as e:
+        result["error"] = e
+    result["seconds"] = time.perf_counter() - start
+
+    return result
+
+
+_worker_resources = None
+
+
+def build_in_worker(name, kwargs):
+    # Each worker process keeps its own shared resources for every course it is handed
+    global _worker_resources
+    if _worker_resources is None:
+        _worker_resources = SharedResources()
+
+    return _timed_build(_worker_resources, name, kwargs)
+
+
+def format_batch_report(results, total_seconds):
+    width = max([len("course")] + [len(result["name"]) for result in results])
+    lines = [f"{'course':<{width}} {'seconds':>9}  status"]
+    for result in results:
+        if "error" in result:
+            status = "failed"
+        elif result["report"]["up_to_date"]:
+            status = "up to date"
+        else:
+            status = f"{result['report']['pages']} pages"
+        lines.append(f"{result['name']:<{width}} {result['seconds']:>9.2f}  {status}")
+    lines.append(f"{'total':<{width}} {total_seconds:>9.2f}")
+
+    return "\n".join(lines)
+
+
+# Builds each (name, assemble_textbook kwargs) pair in courses, in this process or in a pool of
+# max_workers processes, and returns one result per course in the order given
+def build_batch(courses, max_workers=None):
+    out_paths = [os.path.abspath(kwargs["out_path"]) for _, kwargs in courses]
+    duplicates = {path for path in out_paths if out_paths.count(path) > 1}
+    if len(duplicates) > 0:
+        raise ValueError(f'Courses share output paths: {", ".join(sorted(duplicates))}')
+
+    start = time.perf_counter()
+    with tempfile.TemporaryDirectory() as shared_cache_dir:
+        # Courses without a cover sheet cache of their own share one for the run, so weeks that
+        # appear in several courses are only compiled once
+        courses = [
+            (name, {**kwargs, "cache_dir": kwargs.get("cache_dir") or shared_cache_dir})
+            for name, kwargs in courses
+        ]
+
+        if max_workers is None or max_workers <= 1:
+            resources = SharedResources()
+            try:
+                results = [_timed_build(resources, name, kwargs) for name, kwargs in courses]
+            finally:
+                resources.close()
+        else:
+            with ProcessPoolExecutor(max_workers=max_workers) as pool:
+                futures = [pool.submit(build_in_worker, name, kwargs) for name, kwargs in courses]
+                results = [future.result() for future in futures]
+
+    _log.info(format_batch_report(results, time.perf_counter() - start))
+
+    errors = {result["name"]: result["error"] for result in results if "error" in result}
+    if len(errors) > 0:
+        raise BatchBuildError(errors)
+
+    return results
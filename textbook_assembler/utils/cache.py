@@ -0,0 +1,186 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+
+from textbook_assembler.utils import tracing
+
+_log = logging.getLogger("textbook_assembler")
+
+DEFAULT_CACHE_SIZE = 256 * 1024 * 1024
+
+# A cache directory holds the compiled cover sheets, with the optimized streams and parsed bibtex
+# in subdirectories. Each gets this share of the cache size, so together they stay within it.
+CACHE_SHARES = {"cover_sheets": 0.3, "streams": 0.6, "bibtex": 0.1}
+
+
+def cache_share(cache_size, name):
+    return int(cache_size * CACHE_SHARES[name])
+
+
+def hash_payload(payload):
+    encoded = json.dumps(payload, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def hash_file(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    n_bytes = 0
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(chunk_size), b""):
+            digest.update(chunk)
+            n_bytes += len(chunk)
+    tracing.count(bytes_read=n_bytes)
+
+    return digest.hexdigest()
+
+
+# Files stored under a key in cache_dir, evicted least recently used first once they take up more
+# than max_bytes. fetch() and store() copy whole files in and out; subclasses set the suffix of
+# their entries and may read and write them differently.
+class DiskCache:
+    suffix = ".bin"
+
+    def __init__(self, cache_dir, max_bytes=DEFAULT_CACHE_SIZE):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def path_for(self, key):
+        return os.path.join(self.cache_dir, f"{key}{self.suffix}")
+
+    def fetch(self, key, out_path):
+        cached = self.path_for(key)
+        if not os.path.isfile(cached):
+            self.misses += 1
+            return False
+
+        shutil.copyfile(cached, out_path)
+        # Eviction is ordered by mtime, so a hit marks the entry as recently used
+        os.utime(cached)
+        self.hits += 1
+
+        return True
+
+    def store(self, key, path):
+        # Copy to a temporary name first so concurrent builds never see a partially written entry
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        os.close(fd)
+        shutil.copyfile(path, tmp_path)
+        os.replace(tmp_path, self.path_for(key))
+        self.evict()
+
+    def entries(self):
+        entries = []
+        for fname in os.listdir(self.cache_dir):
+            if not fname.endswith(self.suffix):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.cache_dir, fname))
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, fname))
+
+        return sorted(entries)
+
+    def evict(self):
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+
+        for _, size, fname in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.cache_dir, fname))
+            except FileNotFoundError:
+                pass
+            total -= size
+            _log.debug(f"Evicted {fname} from {self.cache_dir}")
+
+
+# Compiled cover sheets, keyed by the template and everything a week's cover sheet shows
+class CoverSheetCache(DiskCache):
+    suffix = ".pdf"
+
+    @staticmethod
+    def make_key(fingerprint, week_number, rows, bibtex_entries):
+        payload = {
+            "template": fingerprint,
+            "week": week_number,
+            "rows": rows,
+            "bibtex": sorted(bibtex_entries, key=lambda entry: entry["ID"]),
+        }
+        return hash_payload(payload)
+
+
+# Results of the output optimizer, one per stream, stored as a JSON header line followed by the
+# new stream data. Entries are written without evicting, so callers run evict() once a batch of
+# results is stored.
+class StreamCache(DiskCache):
+    suffix = ".stream"
+
+    def get(self, key):
+        path = self.path_for(key)
+        try:
+            with open(path, "rb") as file:
+                header, _, data = file.read().partition(b"\n")
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+
+        os.utime(path)
+        self.hits += 1
+        return json.loads(header), data
+
+    def put(self, key, result, data=b""):
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        with os.fdopen(fd, "wb") as file:
+            file.write(json.dumps(result).encode("utf-8") + b"\n" + data)
+        os.replace(tmp_path, self.path_for(key))
+
+
+# Parsed bibtex entries of one bibtex file, stored as JSON under the hash of the file
+class BibtexEntryCache(DiskCache):
+    suffix = ".json"
+
+    def get(self, key):
+        path = self.path_for(key)
+        try:
+            with open(path) as file:
+                payload = json.load(file)
+        except (FileNotFoundError, ValueError):
+            self.misses += 1
+            return None
+
+        os.utime(path)
+        self.hits += 1
+        return payload
+
+    def put(self, key, payload):
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        with os.fdopen(fd, "w") as file:
+            json.dump(payload, file)
+        os.replace(tmp_path, self.path_for(key))
+        self.evict()
+
+
+# Finished textbooks of the build service, stored under the sha256 of the PDF
+class OutputStore(DiskCache):
+    suffix = ".pdf"
+
+    def open(self, key):
+        # The open file can still be read if the entry is evicted while it is being sent
+        path = self.path_for(key)
+        try:
+            file = open(path, "rb")
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+
+        os.utime(path)
+        self.hits += 1
+        return file
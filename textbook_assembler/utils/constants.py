@@ -1,12 +1,25 @@
-import numpy as np
-
 EXPECTED_KEYS = ["week", "date", "topic", "reference", "chapter", "page_start", "page_end"]
-EXPECTED_DTYPES = {
-    "week": np.dtype(int),
-    "date": np.dtype("datetime64[ns]"),
-    "topic": np.dtype("O"),
-    "reference": np.dtype("O"),
-    "chapter": np.dtype(float),
-    "page_start": np.dtype(float),
-    "page_end": np.dtype(float),
-}
+
+COVER_SHEET_BACKENDS = ("latex", "single_pass", "native")
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+
+def __getattr__(name):
+    # numpy is only imported once the dtypes are needed, so the command line starts without it
+    if name == "EXPECTED_DTYPES":
+        import numpy as np
+
+        globals()[name] = {
+            "week": np.dtype(int),
+            "date": np.dtype("datetime64[ns]"),
+            "topic": np.dtype("O"),
+            "reference": np.dtype("O"),
+            "chapter": np.dtype(float),
+            "page_start": np.dtype(float),
+            "page_end": np.dtype(float),
+        }
+        return globals()[name]
+
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -3,14 +3,21 @@ import os
 
 import dateutil
 import pandas as pd
-import pypdf
 from unidecode import unidecode_expect_ascii
 
+try:
+    from pandas.tseries.api import guess_datetime_format
+except ImportError:
+    from pandas._libs.tslibs.parsing import guess_datetime_format
+
+from textbook_assembler.utils import tracing
 from textbook_assembler.utils.constants import EXPECTED_DTYPES, EXPECTED_KEYS
+from textbook_assembler.utils.pdf_index import PdfIndex
 from textbook_assembler.utils.references import (
     get_pdf_names,
     get_referenced_bibtex_data,
     load_bibtex_data,
+    load_bibtex_entries,
     load_reference_list,
     match_references_to_pdf_filenames,
 )
@@ -18,7 +25,9 @@ from textbook_assembler.utils.references import (
 _log = logging.getLogger("textbook_assembler")
 
 
+@tracing.traced()
 def load_input_data(path):
+    tracing.count(bytes_read=os.path.getsize(path))
     data = pd.read_csv(path)
     data = lowercase_columns(data)
     data = convert_date_column(data)
@@ -31,15 +40,37 @@ def drop_empty_rows(data):
     return data.dropna(axis=1, how="all")
 
 
+def _map_unique(series, f):
+    # Lesson plans repeat the same dates, topics and references on many rows, so the Python level
+    # function only needs to run once per distinct value
+    uniques = series.unique()
+    return series.map(dict(zip(uniques, map(f, uniques))))
+
+
 def convert_date_column(data):
     col = [col for col in data.columns if col == "date"][0]
-    data[col] = data[col].map(dateutil.parser.parse)
+    values = data[col]
+
+    first = values.dropna().iloc[0] if values.notna().any() else None
+    fmt = guess_datetime_format(first) if isinstance(first, str) else None
+
+    # Formats without a year (e.g. "4-Oct") are left to dateutil, which fills in the current year
+    # where pandas would use 1900
+    if fmt is not None and ("%Y" in fmt or "%y" in fmt):
+        try:
+            data[col] = pd.to_datetime(values, format=fmt)
+            return data
+        except (ValueError, TypeError):
+            pass
+
+    data[col] = pd.to_datetime(_map_unique(values, dateutil.parser.parse))
     return data
 
 
 def clean_string_data(data):
     cols = [col for col in data.columns if col in ["topic", "reference"]]
-    data[cols] = data[cols].applymap(unidecode_expect_ascii)
+    for col in cols:
+        data[col] = _map_unique(data[col], unidecode_expect_ascii)
     return data
 
 
@@ -61,8 +92,12 @@ def validate_datatypes(data):
         col_type = EXPECTED_DTYPES[column]
 
         if data[column].dtype != col_type:  # and (col_type in (float, int)):
+            if col_type.kind == "f" and data[column].dtype.kind in "iuf":
+                continue
+            # Conversion is elementwise, so checking the distinct values is enough and avoids
+            # converting a full copy of the column
             try:
-                data[column].astype(col_type)
+                pd.Series(data[column].unique()).astype(col_type)
             except Exception as e:
                 invalid_cols[column] = data[column].dtype
 
@@ -80,7 +115,8 @@ def lowercase_columns(data):
     return data
 
 
-def fill_page_numbers(data, pdf_path):
+@tracing.traced()
+def fill_page_numbers(data, pdf_path, readers=None, index=None):
     cache = {}
     data_out = data.copy()
     data_out.page_start = data_out.page_start.fillna(0)
@@ -88,13 +124,55 @@ def fill_page_numbers(data, pdf_path):
     missing = data.loc[data.page_end.isna(), "filename"].unique()
     nan_mask = data_out.page_end.isna()
     for pdf_file in missing:
-        reader = pypdf.PdfReader(os.path.join(pdf_path, pdf_file))
-        cache[pdf_file] = len(reader.pages)
+        if index is not None:
+            cache[pdf_file] = index.page_count(pdf_file)
+        elif readers is not None:
+            cache[pdf_file] = readers.page_count(pdf_file)
+        else:
+            import pypdf
+
+            from textbook_assembler.utils.readers import SourceFile
+
+            with SourceFile(os.path.join(pdf_path, pdf_file)) as source:
+                cache[pdf_file] = len(pypdf.PdfReader(source.stream).pages)
+
+    unknown = [pdf_file for pdf_file in missing if cache[pdf_file] is None]
+    if len(unknown) > 0:
+        # The index has no page count for sources it couldn't open, like encrypted ones
+        raise ValueError(
+            "Could not count the pages of "
+            + ", ".join(f"{pdf_file} (set page_end for its rows)" for pdf_file in unknown)
+        )
     data_out.loc[nan_mask, "page_end"] = data_out.loc[nan_mask, "filename"].apply(cache.get)
 
     return data_out
 
 
+def page_range_errors(data, index):
+    errors = []
+    for row in data[["reference", "filename", "page_start", "page_end"]].itertuples(index=False):
+        if row.filename is None or index.page_count(row.filename) is None:
+            continue
+
+        n_pages = index.page_count(row.filename)
+        if row.page_start > row.page_end:
+            errors.append(f"{row.reference} starts on page {row.page_start:g} after it ends")
+        elif row.page_end > n_pages:
+            errors.append(
+                f"{row.reference} ends on page {row.page_end:g}, but {row.filename} only has "
+                f"{n_pages} pages"
+            )
+
+    return errors
+
+
+@tracing.traced()
+def validate_page_ranges(data, index):
+    errors = page_range_errors(data, index)
+    if len(errors) > 0:
+        raise ValueError(f'Found invalid page ranges in lesson plan: {"; ".join(errors)}')
+
+
 def add_filename_to_data(data, ref_dict, pdf_files):
     out = data.copy()
     matched_refs = match_references_to_pdf_filenames(ref_dict, pdf_files)
@@ -120,7 +198,16 @@ def add_bibtext_to_data(data, bibtex_data):
     return out
 
 
-def load_and_process_data(path, pdf_path=None, reference_path=None, bibtex_path=None):
+@tracing.traced()
+def load_and_process_data(
+    path,
+    pdf_path=None,
+    reference_path=None,
+    bibtex_path=None,
+    readers=None,
+    index=None,
+    bibtex_cache=None,
+):
     ref_dict = {}
 
     data = load_input_data(path)
@@ -132,10 +219,21 @@ def load_and_process_data(path, pdf_path=None, reference_path=None, bibtex_path=
         pdf_files = get_pdf_names(pdf_path)
         ref_dict = load_reference_list(reference_path)
         data = add_filename_to_data(data, ref_dict, pdf_files)
-        data = fill_page_numbers(data, pdf_path)
+        if index is None:
+            index = PdfIndex(pdf_path)
+        index.refresh(data.filename.dropna().unique(), readers=readers)
+        data = fill_page_numbers(data, pdf_path, readers=readers, index=index)
+        validate_page_ranges(data, index)
 
     if bibtex_path:
-        bibtext_dict = load_bibtex_data(bibtex_path)
+        # Only the entries the reference list points to are used, so only those are parsed
+        ids = list(ref_dict) if reference_path else None
+        if bibtex_cache is not None:
+            bibtext_dict = bibtex_cache.load(bibtex_path, ids)
+        elif ids is not None:
+            bibtext_dict = load_bibtex_entries(bibtex_path, ids)
+        else:
+            bibtext_dict = load_bibtex_data(bibtex_path)
         if reference_path:
             bibtext_dict = get_referenced_bibtex_data(bibtext_dict, ref_dict)
         data = add_bibtext_to_data(data, bibtext_dict)
@@ -0,0 +1,142 @@
+import hashlib
+from io import BytesIO
+
+from pypdf.generic import ArrayObject, DictionaryObject, IndirectObject, StreamObject
+
+# Objects that have an identity in the document structure. Two pages (or annotations) with the
+# same content are still two pages, so these are never merged.
+UNIQUE_TYPES = {"/Catalog", "/Pages", "/Page", "/Annot"}
+
+
+def _canonical(canon, idnum):
+    while idnum in canon:
+        idnum = canon[idnum]
+    return idnum
+
+
+def _stream_digest(obj):
+    # The raw (still encoded) data, so streams are compared without decompressing them
+    return hashlib.sha256(obj._data).digest()
+
+
+def _feed(digest, obj, canon, data_digests):
+    if isinstance(obj, IndirectObject):
+        digest.update(b"R%d;" % _canonical(canon, obj.idnum))
+    elif isinstance(obj, DictionaryObject):
+        digest.update(b"<<")
+        for key in sorted(obj.keys()):
+            digest.update(key.encode("utf-8"))
+            _feed(digest, dict.__getitem__(obj, key), canon, data_digests)
+        digest.update(b">>")
+        if isinstance(obj, StreamObject):
+            if id(obj) not in data_digests:
+                data_digests[id(obj)] = _stream_digest(obj)
+            digest.update(b"stream%d;" % len(obj._data))
+            digest.update(data_digests[id(obj)])
+    elif isinstance(obj, ArrayObject):
+        digest.update(b"[")
+        for item in obj:
+            _feed(digest, item, canon, data_digests)
+        digest.update(b"]")
+    else:
+        buffer = BytesIO()
+        obj.write_to_stream(buffer)
+        digest.update(buffer.getvalue())
+        digest.update(b" ")
+
+
+# data_digests maps id(stream) to the digest of its data, so searches that hash the same streams
+# again only hash their data once. Its streams must stay alive while it is in use.
+def object_digest(obj, canon=None, data_digests=None):
+    digest = hashlib.sha256()
+    _feed(digest, obj, canon or {}, {} if data_digests is None else data_digests)
+    return digest.digest()
+
+
+def is_mergeable(obj):
+    if obj is None:
+        return False
+    if isinstance(obj, DictionaryObject):
+        return obj.get("/Type") not in UNIQUE_TYPES
+    return True
+
+
+# Finds candidates whose content is identical to an earlier object, or to one of the `known`
+# digests of objects that were already written. References count as equal when they point at
+# objects that were themselves found to be identical, so the search repeats until nothing more
+# merges; that is what lets two copies of a font, whose descriptors point at two copies of the
+# same font program, collapse into one. Stream data doesn't change between passes, so it is only
+# hashed in the first. Returns the map from each duplicate to the idnum it duplicates, and the
+# digests of every kept object.
+def find_duplicates(objects, candidates, known=None):
+    canon = {}
+    data_digests = {}
+    while True:
+        digests = dict(known or {})
+        merged = False
+        for idnum in candidates:
+            if idnum in canon:
+                continue
+            digest = object_digest(objects[idnum - 1], canon, data_digests)
+            first = digests.setdefault(digest, idnum)
+            if first != idnum:
+                canon[idnum] = first
+                merged = True
+
+        if not merged:
+            return {idnum: _canonical(canon, idnum) for idnum in canon}, digests
+
+
+def _redirect(obj, canon, pdf):
+    if isinstance(obj, DictionaryObject):
+        items = list(obj.items())
+    elif isinstance(obj, ArrayObject):
+        items = list(enumerate(obj))
+    else:
+        return
+
+    for key, value in items:
+        if isinstance(value, IndirectObject):
+            if value.idnum in canon:
+                obj[key] = IndirectObject(canon[value.idnum], 0, pdf)
+        else:
+            _redirect(value, canon, pdf)
+
+
+def _serialized_size(idnum, obj):
+    buffer = BytesIO()
+    obj.write_to_stream(buffer)
+    # Object header, "endobj" and the xref entry
+    return len(buffer.getvalue()) + len(f"{idnum} 0 obj\n\nendobj\n") + 20
+
+
+def merge_duplicates(writer, canon):
+    objects = writer._objects
+    bytes_saved = 0
+    for idnum in canon:
+        bytes_saved += _serialized_size(idnum, objects[idnum - 1])
+        objects[idnum - 1] = None
+
+    for obj in objects:
+        if obj is not None:
+            _redirect(obj, canon, writer)
+
+    return bytes_saved
+
+
+# Shares identical objects across a PdfWriter before it is written, and reports how many objects
+# were removed and roughly how many bytes that saves in the output
+def deduplicate_objects(writer, exclude=()):
+    excluded = set(exclude) | {writer._root_object.indirect_reference.idnum}
+    if writer._info_obj is not None:
+        excluded.add(writer._info_obj.indirect_reference.idnum)
+
+    candidates = [
+        idnum
+        for idnum, obj in enumerate(writer._objects, start=1)
+        if idnum not in excluded and is_mergeable(obj)
+    ]
+    canon, _ = find_duplicates(writer._objects, candidates)
+    bytes_saved = merge_duplicates(writer, canon)
+
+    return {"objects": len(canon), "bytes_saved": bytes_saved}
@@ -1,7 +1,8 @@
+import json
 import os
 import shutil
+from concurrent.futures import ProcessPoolExecutor
 
-import pandas as pd
 from pylatex import (
     Command,
     Document,
@@ -11,12 +12,31 @@ from pylatex import (
     Section,
     escape_latex,
 )
+from pypdf import PdfReader, PdfWriter
 
-from textbook_assembler.utils.constants import EXPECTED_KEYS
+from textbook_assembler.utils import tracing
+from textbook_assembler.utils.cache import CoverSheetCache
+from textbook_assembler.utils.constants import COVER_SHEET_BACKENDS, EXPECTED_KEYS
+from textbook_assembler.utils.records import as_lesson_plan, as_week, is_missing
+
+# Bumped whenever the native renderer's layout changes, so cached cover sheets are rebuilt
+NATIVE_LAYOUT_VERSION = 1
+# The same for the LaTeX documents, bumped when make_document, generate_weekly_cover_sheet or the
+# reading list they share change what is typeset
+LATEX_LAYOUT_VERSION = 1
+PREAMBLE_PACKAGES = ["bibentry", "natbib"]
+DOCUMENT_PACKAGES = ["hyperref"]
+BIBLIOGRAPHY_STYLE = "aer"
+
+# \maketitle can only be used once per document, so the single pass backend typesets each week's
+# title block with an equivalent macro.
+WEEK_TITLE_MACRO = r"""\newcommand{\weektitle}[2]{%
+\clearpage\setcounter{section}{0}%
+\begin{center}{\LARGE #1\par}\vskip 1.5em{\large #2\par}\end{center}\par\vskip 1.5em}"""
 
 
 def _safe_int(x):
-    if x is None or pd.isna(x):
+    if is_missing(x):
         return None
     elif isinstance(x, str):
         return x
@@ -35,57 +55,91 @@ def prettify_date(date):
     return f"{date.day_name()}, {date.month_name()} {date.day}, {date.year}"
 
 
-def data_to_list(data):
-    return [d for d in data.T.to_dict().values()]
-
-
 def hyperlink(url, text):
     text = escape_latex(text)
     return NoEscape(r"\href{" + url + "}{" + text + "}")
 
 
-def generate_weekly_cover_sheet(week_number, date, data, bibtex_path, out_path=None):
-    if out_path is None:
-        out_path = ""
+def make_document():
+    doc = Document()
+    for package in PREAMBLE_PACKAGES:
+        doc.preamble.append(Package(package))
+    for package in DOCUMENT_PACKAGES:
+        doc.packages.append(Package(package))
 
-    bibtex_file = os.path.split(bibtex_path)[-1]
-    shutil.copy(bibtex_path, os.path.join(out_path, bibtex_file))
+    return doc
+
+
+def template_fingerprint(backend):
+    template = {
+        "backend": backend,
+        "preamble_packages": PREAMBLE_PACKAGES,
+        "document_packages": DOCUMENT_PACKAGES,
+        "bibliography_style": BIBLIOGRAPHY_STYLE,
+        "week_title_macro": WEEK_TITLE_MACRO if backend == "single_pass" else None,
+    }
+    if backend == "native":
+        template["native_layout"] = NATIVE_LAYOUT_VERSION
+    else:
+        template["latex_layout"] = LATEX_LAYOUT_VERSION
+    return json.dumps(template, sort_keys=True)
 
-    doc = Document()
-    doc.preamble.append(Package("bibentry"))
-    doc.preamble.append(Package("natbib"))
-    doc.packages.append(Package("hyperref"))
 
-    topic = getattr(data, "topic", None)
+def week_title(week_number, topic=None):
     title = f"Readings for Week {week_number}"
 
-    if topic is not None:
-        topic = topic.unique()
-        title = f"{title}: {topic[0]}"
+    if not is_missing(topic):
+        title = f"{title}: {topic}"
 
-    doc.preamble.append(Command("title", title))
-    doc.preamble.append(Command("date", prettify_date(date)))
-    doc.append(NoEscape(r"\maketitle"))
+    return title
 
-    with doc.create(Section("Reading Materials")):
+
+# The text of a reading's entry in the enumerated list, and the URL of its "Available here" link.
+# Titles are title cased here, the bibliography keeps them as they are in the bibtex file.
+def reading_list_item(row):
+    title = row.get("title")
+    elements = [None if is_missing(title) else title.title()]
+    elements += map(row.get, ["chapter", "page_start", "page_end"])
+    line = ""
+    for s, element, suffix in zip(["", "Chapter", "Pages", "-"], elements, [", ", ", ", " ", ". "]):
+        if not is_missing(element):
+            line += f"{s} {_safe_int(element)}{suffix}"
+
+    url = row["url"] if not is_missing(row["url"]) else None
+    return line, url
+
+
+def add_reading_list(doc, lessons, label=True):
+    with doc.create(Section("Reading Materials", label=label)):
         with doc.create(Enumerate()) as enum:
-            for row in data_to_list(data):
-                row["title"] = row["title"].title()
-                elements = map(row.get, ["title", "chapter", "page_start", "page_end"])
-                line = ""
-                for s, element, suffix in zip(
-                    ["", "Chapter", "Pages", "-"], elements, [", ", ", ", " ", ". "]
-                ):
-                    if element is not None and not pd.isna(element):
-                        line += f"{s} {_safe_int(element)}{suffix}"
-                if row["url"] is not None and not pd.isna(row["url"]):
-                    line += hyperlink(row["url"], "Available here")
+            for row in lessons:
+                line, url = reading_list_item(row)
+                if url is not None:
+                    line += hyperlink(url, "Available here")
                 enum.add_item(NoEscape(line))
 
-    for row in data_to_list(data):
+    for row in lessons:
         doc.append(Command("bibentry", arguments=[row["reference"]]))
 
-    doc.append(Command("bibliographystyle", arguments=["aer"]))
+
+# data holds the lessons of a single week, as a Week from the lesson plan or a DataFrame
+def generate_weekly_cover_sheet(week_number, date, data, bibtex_path, out_path=None):
+    if out_path is None:
+        out_path = ""
+    week = as_week(data)
+
+    bibtex_file = os.path.split(bibtex_path)[-1]
+    shutil.copy(bibtex_path, os.path.join(out_path, bibtex_file))
+
+    doc = make_document()
+
+    doc.preamble.append(Command("title", week_title(week_number, week.topic)))
+    doc.preamble.append(Command("date", prettify_date(date)))
+    doc.append(NoEscape(r"\maketitle"))
+
+    add_reading_list(doc, week.lessons)
+
+    doc.append(Command("bibliographystyle", arguments=[BIBLIOGRAPHY_STYLE]))
     doc.append(Command("bibliography", arguments=[NoEscape(bibtex_file.replace(".bib", ""))]))
 
     filepath = os.path.join(out_path, f"week_{week_number}_coversheet")
@@ -94,13 +148,201 @@ def generate_weekly_cover_sheet(week_number, date, data, bibtex_path, out_path=N
     return filepath + ".pdf"
 
 
-def generate_weekly_cover_sheets(data, bibtex_path, out_path=None):
-    weekly_data = data.groupby("week")
+class CoverSheetError(RuntimeError):
+    def __init__(self, errors):
+        self.errors = errors
+        details = "; ".join(f"week {week}: {err}" for week, err in sorted(errors.items()))
+        super().__init__(f"Failed to generate cover sheets for {len(errors)} week(s). {details}")
+
+
+def _generate_isolated_cover_sheet(week_number, date, data, bibtex_path, out_path):
+    # pdflatex writes aux/log/bbl files named after the document, and every week copies the same
+    # .bib file, so concurrent weeks each get a private working directory.
+    work_dir = os.path.join(out_path, f"week_{week_number}")
+    os.makedirs(work_dir, exist_ok=True)
+    fpath = generate_weekly_cover_sheet(week_number, date, data, bibtex_path, work_dir)
+
+    final_path = os.path.join(out_path, os.path.basename(fpath))
+    shutil.move(fpath, final_path)
+    shutil.rmtree(work_dir, ignore_errors=True)
+
+    return final_path
+
+
+@tracing.traced()
+def generate_weekly_cover_sheets(data, bibtex_path, out_path=None, max_workers=None):
+    weeks = as_lesson_plan(data).weeks.values()
     paths = []
 
-    for week_number, group in weekly_data:
-        date = group.date.unique()[0]
-        fpath = generate_weekly_cover_sheet(week_number, date, group, bibtex_path, out_path)
-        paths.append(fpath)
+    if max_workers is None or max_workers <= 1:
+        for week in weeks:
+            with tracing.span("cover_sheet", week=week.number):
+                fpath = generate_weekly_cover_sheet(
+                    week.number, week.date, week, bibtex_path, out_path
+                )
+            paths.append(fpath)
+
+        return paths
+
+    if out_path is None:
+        out_path = ""
+
+    errors = {}
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        futures = [
+            (
+                week.number,
+                pool.submit(
+                    _generate_isolated_cover_sheet,
+                    week.number,
+                    week.date,
+                    week,
+                    bibtex_path,
+                    out_path,
+                ),
+            )
+            for week in weeks
+        ]
+
+        # Results are collected in submission order, so the cover sheets line up with the week
+        # order regardless of which week finishes first.
+        for week_number, future in futures:
+            try:
+                paths.append(future.result())
+            except Exception as e:
+                errors[week_number] = e
+
+    if len(errors) > 0:
+        raise CoverSheetError(errors)
 
     return paths
+
+
+@tracing.traced()
+def split_pdf_by_outline(pdf_path, out_paths):
+    reader = PdfReader(pdf_path)
+    # Nested lists hold the section bookmarks hyperref adds below each week
+    starts = [
+        reader.get_destination_page_number(item)
+        for item in reader.outline
+        if not isinstance(item, list)
+    ]
+
+    if len(starts) != len(out_paths):
+        raise ValueError(
+            f"Expected {len(out_paths)} week bookmarks in combined cover sheets, found {len(starts)}"
+        )
+
+    ends = starts[1:] + [len(reader.pages)]
+    for out_file, start, end in zip(out_paths, starts, ends):
+        writer = PdfWriter()
+        for page in reader.pages[start:end]:
+            writer.add_page(page)
+        with open(out_file, "wb") as file:
+            writer.write(file)
+
+    return out_paths
+
+
+@tracing.traced()
+def generate_combined_cover_sheets(data, bibtex_path, out_path=None):
+    if out_path is None:
+        out_path = ""
+
+    bibtex_file = os.path.split(bibtex_path)[-1]
+    shutil.copy(bibtex_path, os.path.join(out_path, bibtex_file))
+
+    doc = make_document()
+    doc.preamble.append(NoEscape(WEEK_TITLE_MACRO))
+
+    doc.append(Command("bibliographystyle", arguments=[BIBLIOGRAPHY_STYLE]))
+    doc.append(Command("nobibliography", arguments=[NoEscape(bibtex_file.replace(".bib", ""))]))
+
+    week_paths = []
+    for week in as_lesson_plan(data).weeks.values():
+        week_number = week.number
+        doc.append(
+            NoEscape(
+                r"\weektitle{"
+                + escape_latex(week_title(week_number, week.topic))
+                + "}{"
+                + escape_latex(prettify_date(week.date))
+                + "}"
+            )
+        )
+        # Each week starts with a top level bookmark, which is how the compiled document is split
+        # back into per week page ranges.
+        doc.append(
+            Command(
+                "pdfbookmark",
+                arguments=[f"Week {week_number}", f"week{week_number}"],
+                options=["0"],
+            )
+        )
+        add_reading_list(doc, week.lessons, label=False)
+        week_paths.append(os.path.join(out_path, f"week_{week_number}_coversheet.pdf"))
+
+    filepath = os.path.join(out_path, "combined_coversheets")
+    doc.generate_pdf(filepath=filepath, clean=True, clean_tex=True)
+
+    return split_pdf_by_outline(filepath + ".pdf", week_paths)
+
+
+def cover_sheet_key(backend, week):
+    return CoverSheetCache.make_key(
+        template_fingerprint(backend),
+        week.number,
+        [{k: row.get(k) for k in EXPECTED_KEYS} for row in week.lessons],
+        [_data_to_bibtex(row) for row in week.lessons],
+    )
+
+
+def _run_cover_sheet_backend(data, bibtex_path, out_path, backend, max_workers):
+    if backend == "latex":
+        return generate_weekly_cover_sheets(data, bibtex_path, out_path, max_workers=max_workers)
+    elif backend == "single_pass":
+        return generate_combined_cover_sheets(data, bibtex_path, out_path)
+    elif backend == "native":
+        # Imported here since the native renderer builds on the helpers in this module
+        from textbook_assembler.utils.native import generate_native_cover_sheets
+
+        return generate_native_cover_sheets(data, bibtex_path, out_path)
+
+    raise ValueError(
+        f"Unknown cover sheet backend {backend}, expected one of: {', '.join(COVER_SHEET_BACKENDS)}"
+    )
+
+
+@tracing.traced()
+def generate_cover_sheets(
+    data, bibtex_path, out_path=None, backend="latex", max_workers=None, cache=None
+):
+    if cache is None:
+        return _run_cover_sheet_backend(data, bibtex_path, out_path, backend, max_workers)
+
+    plan = as_lesson_plan(data)
+    paths = fetch_cover_sheets(plan, out_path or "", backend, cache)
+    stale = plan.select(week_number for week_number in plan.weeks if week_number not in paths)
+    if len(stale) > 0:
+        new_paths = _run_cover_sheet_backend(stale, bibtex_path, out_path, backend, max_workers)
+        new_paths = dict(zip(stale.weeks, new_paths))
+        store_cover_sheets(stale, new_paths, backend, cache)
+        paths.update(new_paths)
+
+    return [paths[week_number] for week_number in plan.weeks]
+
+
+# The cover sheets of plan that are in cache, copied into out_path, by week number
+def fetch_cover_sheets(plan, out_path, backend, cache):
+    paths = {}
+    for week_number, week in plan.weeks.items():
+        fpath = os.path.join(out_path, f"week_{week_number}_coversheet.pdf")
+        if cache.fetch(cover_sheet_key(backend, week), fpath):
+            paths[week_number] = fpath
+
+    return paths
+
+
+def store_cover_sheets(plan, paths, backend, cache):
+    for week_number, fpath in paths.items():
+        cache.store(cover_sheet_key(backend, plan.weeks[week_number]), fpath)
@@ -1,13 +1,69 @@
+import logging
 import os
+import re
 import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack, contextmanager, nullcontext
 
-from pypdf import PdfWriter
+from pypdf import PdfReader, PdfWriter
 
+from textbook_assembler.utils import tracing
+from textbook_assembler.utils.cache import (
+    DEFAULT_CACHE_SIZE,
+    CoverSheetCache,
+    cache_share,
+)
 from textbook_assembler.utils.data import load_and_process_data
-from textbook_assembler.utils.latex import generate_weekly_cover_sheets
+from textbook_assembler.utils.dedup import deduplicate_objects
+from textbook_assembler.utils.latex import (
+    cover_sheet_key,
+    fetch_cover_sheets,
+    generate_cover_sheets,
+    store_cover_sheets,
+)
+from textbook_assembler.utils.manifest import (
+    is_up_to_date,
+    load_manifest,
+    reusable_weeks,
+    snapshot_inputs,
+    stat_record,
+    week_signature,
+    write_manifest,
+)
+from textbook_assembler.utils.optimize import (
+    OutputOptimizer,
+    format_optimize_stats,
+    optimize_settings,
+)
+from textbook_assembler.utils.page_import import import_pages, import_settings
+from textbook_assembler.utils.pdf_index import PdfIndex
+from textbook_assembler.utils.plan import BuildPlan, run_plan
+from textbook_assembler.utils.readers import DEFAULT_MAX_OPEN, ReaderPool, SourceFile
+from textbook_assembler.utils.records import LessonPlan, is_missing
+from textbook_assembler.utils.references import BibtexCache
+from textbook_assembler.utils.streaming import StreamingPdfWriter
+from textbook_assembler.utils.tracing import format_bytes, peak_rss_bytes
 
+_log = logging.getLogger("textbook_assembler")
 
-def read_pages_from_pdf(writer, row, pdf_path):
+WEEK_OUTPUT_PATTERN = re.compile(r"^week_\d+\.pdf$")
+
+
+def append_pages(writer, source, page_slice, import_outline=True, page_import=None):
+    if page_import is None:
+        writer.append(source, pages=page_slice, import_outline=import_outline)
+        return
+
+    if not isinstance(source, PdfReader):
+        source = PdfReader(source)
+    settings = {**page_import, "outline": page_import["outline"] and import_outline}
+    import_pages(writer, source, page_slice, **settings)
+
+
+def read_pages_from_pdf(
+    writer, row, pdf_path, readers=None, import_outline=True, page_import=None, use_mmap=True
+):
     start_page = max(0, int(row["page_start"]) - 1)
     end_page = int(row["page_end"])
     pdf_fname = row["filename"]
@@ -15,11 +71,43 @@ def read_pages_from_pdf(writer, row, pdf_path):
     if pdf_fname is None:
         return
 
-    fname = os.path.join(pdf_path, pdf_fname)
+    page_slice = (start_page, end_page)
+    with tracing.span("read_pages", filename=pdf_fname) as span:
+        span.add(pages=end_page - start_page)
+        if readers is not None:
+            append_pages(writer, readers.get(pdf_fname), page_slice, import_outline, page_import)
+            return
+
+        with SourceFile(os.path.join(pdf_path, pdf_fname), use_mmap) as source:
+            span.add(bytes_read=source.size)
+            append_pages(writer, source.stream, page_slice, import_outline, page_import)
+
+
+def chunk_path(chunk_dir, week):
+    return os.path.join(chunk_dir, f"week_{week}_pages.pdf")
 
-    with open(fname, "rb") as file:
-        page_slice = (start_page, end_page)
-        writer.append(file, pages=page_slice)
+
+# Extracts the source pages of one week's lessons into a PDF of their own. Each worker parses the
+# sources it needs with its own reader pool; the sources are memory-mapped, so workers reading
+# the same file share it through the page cache.
+def extract_week_chunk(
+    pdf_path, lessons, out_path, import_outline=True, page_import=None, use_mmap=True
+):
+    writer = PdfWriter()
+    with ReaderPool(pdf_path, use_mmap=use_mmap) as readers:
+        for lesson in lessons:
+            read_pages_from_pdf(writer, lesson, pdf_path, readers, import_outline, page_import)
+
+    with open(out_path, "wb") as file:
+        writer.write(file)
+    return out_path
+
+
+def append_chunk(writer, chunk_path, import_outline=True, page_import=None):
+    with tracing.span("append_chunk") as span, SourceFile(chunk_path) as chunk:
+        reader = PdfReader(chunk.stream)
+        span.add(bytes_read=chunk.size, pages=len(reader.pages))
+        append_pages(writer, reader, (0, len(reader.pages)), import_outline, page_import)
 
 
 def make_output_dir(dir="output"):
@@ -27,21 +115,591 @@ def make_output_dir(dir="output"):
         os.mkdir(dir)
 
 
-def assemble_textbook(data_path, pdf_path, ref_path, bibtex_path, out_path):
-    data = load_and_process_data(data_path, pdf_path, ref_path, bibtex_path)
-    merger = PdfWriter()
-    out_dir, out_fname = os.path.split(out_path)
+@contextmanager
+def atomic_output(out_path):
+    out_dir = os.path.dirname(out_path) or "."
+    fd, tmp_path = tempfile.mkstemp(dir=out_dir, suffix=".pdf.tmp")
+    try:
+        with os.fdopen(fd, "wb") as file:
+            yield file
+        os.replace(tmp_path, out_path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def split_output_dir(out_path):
+    return os.path.splitext(out_path)[0] + "_weeks"
+
+
+def week_output_path(split_dir, week):
+    return os.path.join(split_dir, f"week_{week}.pdf")
+
+
+def write_week_slices(book_path, slices):
+    # The book is parsed once for every batch of weeks, and mapped rather than copied into each
+    # worker's memory
+    paths = []
+    with SourceFile(book_path) as book:
+        reader = PdfReader(book.stream)
+        for week, start, n_pages, out_path in slices:
+            with tracing.span("split_week", week=week):
+                writer = PdfWriter()
+                writer.append(reader, pages=(start, start + n_pages))
+                with atomic_output(out_path) as file:
+                    writer.write(file)
+            paths.append(out_path)
+
+    return paths
+
+
+@tracing.traced()
+def write_weekly_outputs(book_path, weeks, split_dir, max_workers=None, only=None):
+    # Each week is sliced out of the finished book, so the source page ranges and cover sheets
+    # are only extracted once. Weeks outside `only` keep their existing file if there is one.
+    os.makedirs(split_dir, exist_ok=True)
+    expected = {os.path.basename(week_output_path(split_dir, week["week"])) for week in weeks}
+    for fname in os.listdir(split_dir):
+        if WEEK_OUTPUT_PATTERN.match(fname) and fname not in expected:
+            os.remove(os.path.join(split_dir, fname))
+
+    slices = [
+        (week["week"], week["start"], week["pages"], week_output_path(split_dir, week["week"]))
+        for week in weeks
+    ]
+    slices = [
+        item for item in slices if only is None or item[0] in only or not os.path.isfile(item[3])
+    ]
+
+    if max_workers is None or max_workers <= 1 or len(slices) <= 1:
+        return write_week_slices(book_path, slices)
+
+    # Contiguous batches of weeks, one per worker, so each worker only parses the book once
+    size = -(-len(slices) // max_workers)
+    batches = [slices[i : i + size] for i in range(0, len(slices), size)]
+    with ProcessPoolExecutor(max_workers=len(batches)) as pool:
+        futures = [pool.submit(write_week_slices, book_path, batch) for batch in batches]
+        return [path for future in futures for path in future.result()]
+
+
+def source_slices(week):
+    # The source file and page range of each lesson that has one, which is all read_pages_from_pdf
+    # needs, so they are what is sent to extraction workers
+    return [
+        {key: lesson[key] for key in ("filename", "page_start", "page_end")}
+        for lesson in week
+        if not is_missing(lesson.filename)
+    ]
+
+
+def count_slice_pages(slices):
+    return sum(int(item["page_end"]) - max(0, int(item["page_start"]) - 1) for item in slices)
+
+
+# Compiles the cover sheets of lessons into a directory of their own, so weeks compiled at the
+# same time don't share LaTeX's working files, and returns them by week. Weeks in cached, the
+# cover sheets found in the cache by week, are returned as they are.
+def compile_cover_sheets(lessons, bibtex_path, out_dir, backend="latex", cached=None):
+    cached = cached or {}
+    paths = {week: cached[week] for week in lessons.weeks if week in cached}
+    misses = lessons.select(week for week in lessons.weeks if week not in cached)
+    if len(misses) > 0:
+        os.makedirs(out_dir, exist_ok=True)
+        compiled = generate_cover_sheets(misses, bibtex_path, out_path=out_dir, backend=backend)
+        paths.update(zip(misses.weeks, compiled))
+    return {week: paths[week] for week in lessons.weeks}
+
+
+def fetch_cached_cover_sheets(lessons, out_dir, backend, cache):
+    os.makedirs(out_dir, exist_ok=True)
+    return fetch_cover_sheets(lessons, out_dir, backend, cache)
+
+
+# The output of a build, assembled by the tasks of its plan. open() creates the writer and the
+# output file, add_week() appends a week's cover sheet and pages, or a reused week's pages from the
+# previous output, and write() finishes the file and moves it into place. Leaving the with block
+# before write() discards the partial output.
+class AssembledBook:
+    def __init__(
+        self,
+        out_path,
+        pdf_path,
+        readers,
+        reused=None,
+        streaming=False,
+        dedupe=False,
+        optimize=None,
+        page_import=None,
+        max_workers=None,
+        cache=None,
+        cache_size=DEFAULT_CACHE_SIZE,
+        use_mmap=True,
+    ):
+        self.out_path = out_path
+        self.pdf_path = pdf_path
+        self.readers = readers
+        self.reused = reused or {}
+        self.streaming = streaming
+        self.dedupe = dedupe
+        self.optimize = optimize
+        self.page_import = page_import
+        self.max_workers = max_workers
+        self.cache = cache
+        self.cache_size = cache_size
+        self.use_mmap = use_mmap
+        self.weeks = []
+        self.n_pages = None
+        self.dedupe_stats = None
+        self.optimizer = None
+        self._stack = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self._stack is None:
+            return False
+        stack, self._stack = self._stack, None
+        return stack.__exit__(exc_type, exc_val, exc_tb)
+
+    def open(self):
+        self._stack = stack = ExitStack()
+        make_output_dir(os.path.split(self.out_path)[0])
+
+        self.previous_output = None
+        if len(self.reused) > 0:
+            # The previous output is replaced by a rename, so its mapping stays valid
+            previous = stack.enter_context(SourceFile(self.out_path, self.use_mmap))
+            self.previous_output = PdfReader(previous.stream)
+
+        if self.optimize is not None:
+            # Optimized streams are cached next to the cover sheets
+            cache_dir = os.path.join(self.cache.cache_dir, "streams") if self.cache else None
+            self.optimizer = stack.enter_context(
+                OutputOptimizer(
+                    self.optimize,
+                    self.max_workers,
+                    cache_dir,
+                    cache_share(self.cache_size, "streams"),
+                )
+            )
+
+        self.out_file = stack.enter_context(atomic_output(self.out_path))
+        if self.streaming:
+            self.merger = StreamingPdfWriter(self.out_file, self.dedupe, optimizer=self.optimizer)
+        else:
+            self.merger = PdfWriter()
+
+    def add_week(self, week, signature, cover_sheet=None, lessons=(), chunk=None):
+        merger = self.merger
+        import_outline = not self.streaming
+        start = len(merger.pages)
+        with tracing.span("week", week=week, reused=week in self.reused) as span:
+            if week in self.reused:
+                end = self.reused[week]["start"] + self.reused[week]["pages"]
+                append_pages(
+                    merger,
+                    self.previous_output,
+                    (self.reused[week]["start"], end),
+                    import_outline=import_outline,
+                    page_import=self.page_import,
+                )
+            else:
+                merger.append(cover_sheet, import_outline=import_outline)
+                if chunk is not None:
+                    append_chunk(merger, chunk, import_outline, self.page_import)
+                for lesson in lessons:
+                    read_pages_from_pdf(
+                        merger,
+                        lesson,
+                        self.pdf_path,
+                        readers=self.readers,
+                        import_outline=import_outline,
+                        page_import=self.page_import,
+                    )
+            span.add(pages=len(merger.pages) - start)
+
+        self.weeks.append(
+            {
+                "week": int(week),
+                "signature": signature,
+                "start": start,
+                "pages": len(merger.pages) - start,
+            }
+        )
+
+        if self.streaming:
+            with tracing.span("flush", week=week) as span:
+                position = self.out_file.tell()
+                merger.flush()
+                span.add(bytes_written=self.out_file.tell() - position)
+            # Parsed sources are the other thing that grows with the book, so they are only kept
+            # for the week that needs them
+            self.readers.close()
+
+    def write(self):
+        merger, out_file = self.merger, self.out_file
+        self.n_pages = len(merger.pages)
+        with tracing.span("write") as span:
+            position = out_file.tell()
+            if self.streaming:
+                merger.close()
+                self.dedupe_stats = merger.dedupe_stats
+            else:
+                if self.dedupe:
+                    with tracing.span("dedupe"):
+                        self.dedupe_stats = deduplicate_objects(merger)
+                if self.optimizer is not None:
+                    self.optimizer.optimize(merger)
+                merger.write(out_file)
+            span.add(bytes_written=out_file.tell() - position, pages=self.n_pages)
+
+        stack, self._stack = self._stack, None
+        stack.close()
+
+    def split(self, split_dir, max_workers=None):
+        rebuilt = {week["week"] for week in self.weeks if week["week"] not in self.reused}
+        return write_weekly_outputs(self.out_path, self.weeks, split_dir, max_workers, only=rebuilt)
+
+
+def load_lessons(
+    data_path, pdf_path, ref_path, bibtex_path, readers=None, index=None, bibtex_cache=None
+):
+    # The rest of the build walks the lessons week by week, so they are grouped once here
+    data = load_and_process_data(
+        data_path,
+        pdf_path,
+        ref_path,
+        bibtex_path,
+        readers=readers,
+        index=index,
+        bibtex_cache=bibtex_cache,
+    )
+    return LessonPlan.from_frame(data)
+
+
+def _merge_week(build, book, week, signature, cover_task=None, lessons=(), extract_task=None):
+    cover_sheet = build.result(cover_task)[week] if cover_task is not None else None
+    chunk = build.result(extract_task) if extract_task is not None else None
+    book.add_week(week, signature, cover_sheet, lessons, chunk)
+
+
+def _compile_cover_sheets(build, fetch_task, lessons, bibtex_path, out_dir, backend):
+    cached = build.result(fetch_task) if fetch_task is not None else None
+    return compile_cover_sheets(lessons, bibtex_path, out_dir, backend, cached)
+
+
+def _store_cover_sheets(build, cover_task, fetch_task, lessons, backend, cache):
+    cached = build.result(fetch_task)
+    compiled = {week: path for week, path in build.result(cover_task).items() if week not in cached}
+    store_cover_sheets(lessons, compiled, backend, cache)
+
+
+# Adds the tasks that assemble book from lessons to build: the cover sheet of each rebuilt week
+# (one task for all of them with the single_pass backend), the extraction of its source pages
+# when parallel_extract is set, and a merge per week, each after the week before, so merging
+# starts as soon as the first week is ready. LaTeX runs as subprocess tasks, extraction as cpu
+# tasks, and everything that touches the book or the cache as main tasks: cached cover sheets are
+# fetched before any are compiled, and the ones compiled are stored once they are done.
+def add_week_tasks(
+    build,
+    book,
+    lessons,
+    stale,
+    signatures,
+    bibtex_path,
+    work_dir,
+    cover_backend="latex",
+    cache=None,
+    parallel_extract=False,
+):
+    cover_kind = "main" if cover_backend == "native" else "subprocess"
+    build.add("open", "main", book.open, deps=["lessons"])
+
+    fetch_task = None
+    if cache is not None and len(stale) > 0:
+        fetch_task = build.add(
+            "cached_cover_sheets",
+            "main",
+            fetch_cached_cover_sheets,
+            stale,
+            os.path.join(work_dir, "cached_cover_sheets"),
+            cover_backend,
+            cache,
+            deps=["lessons"],
+        )
+    cover_deps = [task for task in ["lessons", fetch_task] if task is not None]
+
+    def add_cover_task(name, week_lessons, out_dir):
+        cover_task = build.add(
+            name,
+            cover_kind,
+            _compile_cover_sheets,
+            build,
+            fetch_task,
+            week_lessons,
+            bibtex_path,
+            out_dir,
+            cover_backend,
+            deps=cover_deps,
+        )
+        if fetch_task is not None:
+            build.add(
+                f"store_{name}",
+                "main",
+                _store_cover_sheets,
+                build,
+                cover_task,
+                fetch_task,
+                week_lessons,
+                cover_backend,
+                cache,
+                deps=[cover_task],
+            )
+        return cover_task
+
+    combined = None
+    if cover_backend == "single_pass" and len(stale) > 0:
+        combined = add_cover_task("cover_sheets", stale, os.path.join(work_dir, "cover_sheets"))
+
+    previous = "open"
+    for number, week in lessons.weeks.items():
+        cover_task = extract_task = None
+        slices = source_slices(week)
+        if number in stale.weeks:
+            cover_task = combined
+            if cover_task is None:
+                cover_task = add_cover_task(
+                    f"cover[{number}]",
+                    stale.select([number]),
+                    os.path.join(work_dir, f"week_{number}"),
+                )
+            if parallel_extract and len(slices) > 0:
+                extract_task = build.add(
+                    f"extract[{number}]",
+                    "cpu",
+                    extract_week_chunk,
+                    book.pdf_path,
+                    slices,
+                    chunk_path(work_dir, number),
+                    not book.streaming,
+                    book.page_import,
+                    book.use_mmap,
+                    deps=["lessons"],
+                    pages=count_slice_pages(slices),
+                )
+
+        deps = [task for task in [previous, cover_task, extract_task] if task is not None]
+        inline = week if number in stale.weeks and not parallel_extract else ()
+        if number in book.reused:
+            pages = book.reused[number]["pages"]
+        else:
+            pages = count_slice_pages(slices) + 1
+        previous = build.add(
+            f"merge[{number}]",
+            "main",
+            _merge_week,
+            build,
+            book,
+            number,
+            signatures[number],
+            cover_task,
+            inline,
+            extract_task,
+            deps=deps,
+            pages=pages,
+        )
+
+    build.add("write", "main", book.write, deps=[previous])
+
+
+@tracing.traced()
+def assemble_textbook(
+    data_path,
+    pdf_path,
+    ref_path,
+    bibtex_path,
+    out_path,
+    max_workers=None,
+    cover_backend="latex",
+    cache_dir=None,
+    cache_size=DEFAULT_CACHE_SIZE,
+    max_open_readers=DEFAULT_MAX_OPEN,
+    use_mmap=True,
+    incremental=False,
+    streaming=False,
+    index_path=None,
+    readers=None,
+    index=None,
+    bibtex_cache=None,
+    cache=None,
+    split_weeks=False,
+    split_dir=None,
+    dedupe=False,
+    image_dpi=None,
+    jpeg_quality=None,
+    recompress_streams=False,
+    compress_content=False,
+    lean_import=False,
+    import_outline=True,
+    import_links=True,
+    import_forms=True,
+    parallel_extract=False,
+    max_subprocesses=None,
+    dry_run=False,
+):
+    inputs = {"lesson_plan": data_path, "references": ref_path, "bibtex": bibtex_path}
+    optimize = optimize_settings(image_dpi, jpeg_quality, recompress_streams, compress_content)
+    page_import = import_settings(lean_import, import_outline, import_links, import_forms)
+    options = {
+        "cover_backend": cover_backend,
+        "streaming": streaming,
+        "dedupe": dedupe,
+        "optimize": optimize,
+    }
+    if page_import is not None:
+        options["page_import"] = page_import
+    # Every build records the files it was built from, and the last record tells which files kept
+    # their size and mtime and so don't need hashing again. Only incremental builds reuse output.
+    previous = load_manifest(out_path)
+    manifest = previous if incremental else None
+
+    if split_weeks and split_dir is None:
+        split_dir = split_output_dir(out_path)
+
+    if is_up_to_date(manifest, inputs, pdf_path, out_path, options):
+        _log.info(f"{out_path} is up to date, nothing to rebuild")
+        report = {"out_path": out_path, "up_to_date": True}
+        if split_weeks and not dry_run:
+            # Only weekly files that are missing are written
+            written = write_weekly_outputs(
+                out_path, manifest["weeks"], split_dir, max_workers, only=set()
+            )
+            report.update({"split_dir": split_dir, "weeks_split": len(written)})
+        return report
+
+    if cache is None and cache_dir:
+        cache = CoverSheetCache(cache_dir, cache_share(cache_size, "cover_sheets"))
+    if bibtex_cache is None and cache is not None:
+        # Parsed bibtex entries are cached next to the cover sheets
+        bibtex_cache = BibtexCache(
+            os.path.join(cache.cache_dir, "bibtex"), cache_share(cache_size, "bibtex")
+        )
+    if max_subprocesses is None:
+        max_subprocesses = max_workers
+
+    # Readers, the PDF index and parsed bibtex can be passed in to share them between builds
+    if readers is not None:
+        pool = nullcontext(readers)
+    else:
+        pool = ReaderPool(pdf_path, max_open_readers, use_mmap)
+    with pool as readers:
+        if index is None:
+            index = PdfIndex(pdf_path, index_path=index_path)
+        # The lesson plan is loaded first, since the rest of the plan has tasks for each week
+        started = time.time()
+        build = BuildPlan()
+        build.add(
+            "lessons",
+            "main",
+            load_lessons,
+            data_path,
+            pdf_path,
+            ref_path,
+            bibtex_path,
+            readers,
+            index,
+            bibtex_cache,
+        )
+        run_plan(build)
+        lessons = build.result("lessons")
+        snapshot = snapshot_inputs(inputs, lessons.filenames(), pdf_path, previous)
+
+        signatures = {
+            number: week_signature(
+                cover_sheet_key(cover_backend, week), week.filenames(), snapshot, page_import
+            )
+            for number, week in lessons.weeks.items()
+        }
+        reused = reusable_weeks(manifest, signatures, out_path, options)
+        stale = lessons.select(number for number in lessons.weeks if number not in reused)
+        if len(reused) > 0:
+            _log.info(f"Reusing {len(reused)} unchanged week(s) from {out_path}")
+
+        book = AssembledBook(
+            out_path,
+            pdf_path,
+            readers,
+            reused,
+            streaming=streaming,
+            dedupe=dedupe,
+            optimize=optimize,
+            page_import=page_import,
+            max_workers=max_workers,
+            cache=cache,
+            cache_size=cache_size,
+            use_mmap=use_mmap,
+        )
+        with tempfile.TemporaryDirectory() as tempdir, book:
+            add_week_tasks(
+                build,
+                book,
+                lessons,
+                stale,
+                signatures,
+                bibtex_path,
+                tempdir,
+                cover_backend=cover_backend,
+                cache=cache,
+                parallel_extract=parallel_extract,
+            )
+            if split_weeks:
+                build.add("split", "main", book.split, split_dir, max_workers, deps=["write"])
+            if dry_run:
+                return {"out_path": out_path, "up_to_date": False, "dry_run": True, "plan": build}
+
+            run_plan(build, max_workers, max_subprocesses)
+            seconds = time.time() - started
 
-    with tempfile.TemporaryDirectory() as tempdir:
-        cover_sheets = generate_weekly_cover_sheets(data, bibtex_path, out_path=tempdir)
-        weekly_data = data.groupby("week")
+    critical_seconds, _ = build.critical_path()
+    _log.debug(
+        f"Ran {len(build)} build tasks in {seconds:.2f}s, critical path {critical_seconds:.2f}s"
+    )
+    if split_weeks:
+        written = build.result("split")
+        _log.info(f"Wrote {len(written)} weekly file(s) to {split_dir}")
 
-        for cover_sheet, (week, group) in zip(cover_sheets, weekly_data):
-            merger.append(cover_sheet)
-            for idx, row in group.iterrows():
-                read_pages_from_pdf(merger, row, pdf_path)
+    write_manifest(
+        out_path,
+        {**snapshot, "options": options, "weeks": book.weeks, "output": stat_record(out_path)},
+    )
 
-        make_output_dir(out_dir)
+    report = {
+        "out_path": out_path,
+        "up_to_date": False,
+        "pages": book.n_pages,
+        "weeks_rebuilt": len(book.weeks) - len(reused),
+        "weeks_reused": len(reused),
+        "seconds": seconds,
+        "critical_path": critical_seconds,
+    }
+    if dedupe:
+        report["dedupe"] = book.dedupe_stats
+        _log.info(
+            f"Shared {book.dedupe_stats['objects']} duplicate object(s), saving about "
+            f"{format_bytes(book.dedupe_stats['bytes_saved'])}"
+        )
+    if book.optimizer is not None:
+        report["optimize"] = dict(book.optimizer.stats)
+        _log.info(format_optimize_stats(book.optimizer.stats))
+    if split_weeks:
+        report.update({"split_dir": split_dir, "weeks_split": len(written)})
+    if streaming:
+        # The peak of the whole process, which includes earlier builds in batch and watch mode
+        report["process_peak_rss"] = peak_rss_bytes()
+        _log.info(
+            "Streaming assembly finished, peak RSS of this process so far "
+            f"{format_bytes(report['process_peak_rss'])}"
+        )
 
-        with open(out_path, "wb") as file:
-            merger.write(file)
+    return report
@@ -0,0 +1,147 @@
+import json
+import logging
+import os
+import tempfile
+
+from textbook_assembler.utils import tracing
+from textbook_assembler.utils.cache import hash_file, hash_payload
+
+_log = logging.getLogger("textbook_assembler")
+
+MANIFEST_VERSION = 1
+
+
+def manifest_path(out_path):
+    return f"{out_path}.manifest.json"
+
+
+def load_manifest(out_path):
+    path = manifest_path(out_path)
+    if not os.path.isfile(path):
+        return None
+
+    try:
+        with open(path) as file:
+            manifest = json.load(file)
+    except (OSError, ValueError) as e:
+        _log.warning(f"Ignoring unreadable build manifest {path}: {e}")
+        return None
+
+    if manifest.get("version") != MANIFEST_VERSION:
+        return None
+
+    return manifest
+
+
+@tracing.traced()
+def write_manifest(out_path, manifest):
+    path = manifest_path(out_path)
+    out_dir = os.path.dirname(path) or "."
+
+    fd, tmp_path = tempfile.mkstemp(dir=out_dir, suffix=".tmp")
+    with os.fdopen(fd, "w") as file:
+        json.dump({**manifest, "version": MANIFEST_VERSION}, file, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def stat_record(path):
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def file_record(path, previous=None):
+    record = stat_record(path)
+
+    # Only files whose size or mtime moved are re-hashed; a touched but identical file keeps its
+    # hash and so does not invalidate anything downstream.
+    if previous is not None and all(previous.get(k) == v for k, v in record.items()):
+        record["sha256"] = previous["sha256"]
+    else:
+        record["sha256"] = hash_file(path)
+
+    return record
+
+
+def source_listing_hash(pdf_path):
+    # Partial names in the reference yaml resolve against the directory listing, so adding or
+    # removing a PDF can change which file a reference points to.
+    return hash_payload(sorted(os.listdir(pdf_path)))
+
+
+@tracing.traced()
+def snapshot_inputs(inputs, source_files, pdf_path, previous=None):
+    previous = previous or {}
+    previous_inputs = previous.get("inputs", {})
+    previous_sources = previous.get("sources", {})
+
+    return {
+        "inputs": {
+            name: {"path": path, **file_record(path, previous_inputs.get(name))}
+            for name, path in inputs.items()
+            if path
+        },
+        "sources": {
+            fname: file_record(os.path.join(pdf_path, fname), previous_sources.get(fname))
+            for fname in sorted(source_files)
+        },
+        "source_listing": source_listing_hash(pdf_path),
+    }
+
+
+def _stat_matches(record, path):
+    try:
+        return all(record.get(k) == v for k, v in stat_record(path).items())
+    except OSError:
+        return False
+
+
+def is_up_to_date(manifest, inputs, pdf_path, out_path, options):
+    if manifest is None or manifest.get("options") != options:
+        return False
+
+    recorded = manifest.get("inputs", {})
+    if set(recorded) != {name for name, path in inputs.items() if path}:
+        return False
+
+    for name, path in inputs.items():
+        if path and (recorded[name]["path"] != path or not _stat_matches(recorded[name], path)):
+            return False
+
+    for fname, record in manifest.get("sources", {}).items():
+        if not _stat_matches(record, os.path.join(pdf_path, fname)):
+            return False
+
+    if manifest.get("source_listing") != source_listing_hash(pdf_path):
+        return False
+
+    return _stat_matches(manifest.get("output", {}), out_path)
+
+
+def week_signature(cover_key, filenames, snapshot, page_import=None):
+    sources = {fname: snapshot["sources"][fname]["sha256"] for fname in sorted(filenames)}
+    payload = {"cover_sheet": cover_key, "sources": sources}
+    # Only part of the signature when set, so weeks built before the option existed still match
+    if page_import is not None:
+        payload["page_import"] = page_import
+    return hash_payload(payload)
+
+
+# Weeks of the previous output that can be copied into the new one. Options like dedupe and the
+# optimize settings change the pages written, and optimizing pages again loses quality, so any
+# change in options rebuilds every week.
+def reusable_weeks(manifest, signatures, out_path, options):
+    if manifest is None or not os.path.isfile(out_path):
+        return {}
+    if manifest.get("options") != options:
+        _log.info("The build options changed, rebuilding every week")
+        return {}
+    if not _stat_matches(manifest.get("output", {}), out_path):
+        _log.warning(f"{out_path} was modified outside of a build, rebuilding every week")
+        return {}
+
+    previous = {entry["week"]: entry for entry in manifest.get("weeks", [])}
+    return {
+        week: previous[week]
+        for week, signature in signatures.items()
+        if week in previous and previous[week]["signature"] == signature
+    }
@@ -0,0 +1,376 @@
+import os
+import re
+import unicodedata
+import zlib
+
+from pypdf import PdfWriter
+from pypdf.generic import (
+    ArrayObject,
+    DictionaryObject,
+    FloatObject,
+    NameObject,
+    NumberObject,
+    StreamObject,
+    TextStringObject,
+)
+from unidecode import unidecode
+
+from textbook_assembler.utils import tracing
+from textbook_assembler.utils.font_metrics import FIRST_CHAR, WIDTHS
+from textbook_assembler.utils.latex import prettify_date, reading_list_item, week_title
+from textbook_assembler.utils.records import as_lesson_plan, is_missing
+
+# US letter with the margins, type sizes and spacing of a 10pt LaTeX article, so native cover
+# sheets sit in the book the same way compiled ones do
+PAGE_WIDTH = 612
+PAGE_HEIGHT = 792
+TEXT_WIDTH = 345
+LEFT_MARGIN = (PAGE_WIDTH - TEXT_WIDTH) / 2
+TOP = PAGE_HEIGHT - 110
+BOTTOM = 120
+BODY_SIZE = 10
+BODY_LEADING = 12
+TITLE_SIZE = 17.28
+DATE_SIZE = 12
+SECTION_SIZE = 14.4
+ITEM_INDENT = 25
+HANGING_INDENT = 20
+
+ROMAN, BOLD, ITALIC = "/F1", "/F2", "/F3"
+FONTS = {ROMAN: "Times-Roman", BOLD: "Times-Bold", ITALIC: "Times-Italic"}
+# hyperref's default border colour for URL links
+LINK_COLOR = (0, 1, 1)
+
+LATEX_ACCENTS = {"'": "\u0301", "`": "\u0300", '"': "\u0308", "^": "\u0302", "~": "\u0303"}
+LATEX_REPLACEMENTS = [
+    ("---", "\u2014"),
+    ("--", "\u2013"),
+    ("``", "\u201c"),
+    ("''", "\u201d"),
+    ("~", "\u00a0"),
+]
+
+
+def detex(text):
+    text = re.sub(
+        r"\\([" + re.escape("".join(LATEX_ACCENTS)) + r"])\{?(\w)\}?",
+        lambda m: unicodedata.normalize("NFC", m[2] + LATEX_ACCENTS[m[1]]),
+        text,
+    )
+    for latex, replacement in LATEX_REPLACEMENTS:
+        text = text.replace(latex, replacement)
+    # Escaped characters keep the character, other commands (\emph, \textit) are dropped
+    text = re.sub(r"\\([&%$#_])", r"\1", text)
+    text = re.sub(r"\\[a-zA-Z]+\s*", "", text)
+    text = text.replace("{", "").replace("}", "")
+
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def encode_text(text):
+    encoded = bytearray()
+    for char in text:
+        try:
+            encoded += char.encode("cp1252")
+        except UnicodeEncodeError:
+            # Characters the standard fonts can't show are transliterated, like unidecode does for
+            # file names
+            encoded += unidecode(char).encode("cp1252", errors="replace")
+
+    return bytes(encoded)
+
+
+def text_width(text, font, size):
+    widths = WIDTHS[FONTS[font]]
+    return sum(widths[code - FIRST_CHAR] for code in encode_text(text) if code >= FIRST_CHAR) * (
+        size / 1000
+    )
+
+
+def _escape(data):
+    return data.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)")
+
+
+def _words(runs):
+    space = False
+    for text, font, url in runs:
+        for part in re.split(r"( +)", text):
+            if part == "":
+                continue
+            if part.isspace():
+                space = True
+                continue
+            yield part, font, url, space
+            space = False
+
+
+# Breaks runs of (text, font, url) into lines no wider than width. Each line is a list of
+# segments [x, text, font, url], where neighbouring words in the same font and link share a
+# segment.
+def layout_lines(runs, size, width, indent=0, hanging=0):
+    lines = []
+    line = []
+    x = indent
+    for word, font, url, space in _words(runs):
+        word_width = text_width(word, font, size)
+        gap = text_width(" ", font, size) if space and len(line) > 0 else 0
+        if len(line) > 0 and x + gap + word_width > width:
+            lines.append(line)
+            line, x, gap = [], hanging, 0
+
+        previous = line[-1] if len(line) > 0 else None
+        if previous is not None and previous[2:] == [font, url]:
+            previous[1] += (" " if gap > 0 else "") + word
+        else:
+            line.append([x + gap, word, font, url])
+        x += gap + word_width
+
+    if len(line) > 0:
+        lines.append(line)
+
+    return lines
+
+
+# Collects the pages of one cover sheet as content stream operators and link rectangles
+class CoverSheetCanvas:
+    def __init__(self):
+        self.pages = []
+        self.new_page()
+
+    def new_page(self):
+        self.pages.append({"operators": [], "links": []})
+        self.y = TOP
+
+    def skip(self, points):
+        self.y -= points
+
+    def paragraph(self, runs, size, leading, indent=0, hanging=0, center=False, label=None):
+        lines = layout_lines(runs, size, TEXT_WIDTH, indent, hanging)
+        for i, line in enumerate(lines):
+            if self.y - leading < BOTTOM:
+                self.new_page()
+            self.y -= leading
+
+            offset = LEFT_MARGIN
+            if center:
+                last = line[-1]
+                offset += (TEXT_WIDTH - last[0] - text_width(last[1], last[2], size)) / 2
+            if label is not None and i == 0:
+                self.text(offset + indent - text_width(label, ROMAN, size) - 5, label, ROMAN, size)
+            for x, text, font, url in line:
+                self.text(offset + x, text, font, size)
+                if url is not None:
+                    self.link(offset + x, text_width(text, font, size), size, url)
+
+    def text(self, x, text, font, size):
+        self.pages[-1]["operators"].append(
+            b"BT %s %.2f Tf 1 0 0 1 %.2f %.2f Tm (%s) Tj ET"
+            % (font.encode(), size, x, self.y, _escape(encode_text(text)))
+        )
+
+    def link(self, x, width, size, url):
+        links = self.pages[-1]["links"]
+        rect = (x - 1, self.y - 0.25 * size, x + width + 1, self.y + 0.8 * size)
+        # Segments of one link broken across a line are separate annotations, as in hyperref
+        links.append((rect, url))
+
+
+def _field(entry, key):
+    value = entry.get(key)
+    if is_missing(value):
+        return None
+    return detex(str(value)) or None
+
+
+def _split_name(name):
+    if "," in name:
+        last, first = [part.strip() for part in name.split(",", 1)]
+    else:
+        parts = name.split()
+        last, first = parts[-1], " ".join(parts[:-1])
+    return last, first
+
+
+def format_authors(authors):
+    names = [name.strip() for name in re.split(r"\s+and\s+", authors) if name.strip()]
+    formatted = []
+    for i, name in enumerate(names):
+        if name == "others":
+            formatted.append("et al.")
+            continue
+        last, first = _split_name(name)
+        # The first author is listed surname first, the way aer sorts and shows them
+        formatted.append(f"{last}, {first}".strip(", ") if i == 0 else f"{first} {last}".strip())
+
+    if len(formatted) <= 1:
+        return "".join(formatted)
+    if len(formatted) == 2:
+        return f"{formatted[0]}, and {formatted[1]}"
+    return ", ".join(formatted[:-1]) + ", and " + formatted[-1]
+
+
+def _sentence(text):
+    return text if text.endswith((".", "?", "!")) else text + "."
+
+
+# Formats a bibtex entry the way the aer bibliography style does, as runs of (text, font)
+def format_reference(entry):
+    authors = _field(entry, "author") or _field(entry, "editor")
+    year = _field(entry, "year")
+    title = _field(entry, "title")
+    kind = (_field(entry, "ENTRYTYPE") or "misc").lower()
+
+    runs = []
+    head = ". ".join(part for part in [format_authors(authors) if authors else None, year] if part)
+    if head:
+        runs.append((_sentence(head) + " ", ROMAN))
+
+    if kind == "book":
+        if title:
+            runs.append((_sentence(title) + " ", ITALIC))
+        publisher = ": ".join(
+            part for part in [_field(entry, "address"), _field(entry, "publisher")] if part
+        )
+        if publisher:
+            runs.append((_sentence(publisher), ROMAN))
+        return runs
+
+    if title:
+        runs.append((f"\u201c{_sentence(title)}\u201d ", ROMAN))
+
+    if kind == "article" and _field(entry, "journal"):
+        runs.append((_field(entry, "journal"), ITALIC))
+        volume = _field(entry, "volume") or ""
+        if _field(entry, "number"):
+            volume += f"({_field(entry, 'number')})"
+        pages = _field(entry, "pages")
+        details = ", " + volume if volume else ""
+        details += (": " if volume else ", ") + pages if pages else ""
+        runs.append((details + ".", ROMAN))
+    elif kind in ("incollection", "inproceedings") and _field(entry, "booktitle"):
+        runs.append(("In ", ROMAN))
+        runs.append((_field(entry, "booktitle"), ITALIC))
+        pages = _field(entry, "pages")
+        runs.append(((", " + pages if pages else "") + ".", ROMAN))
+    else:
+        keys = ["howpublished", "journal", "institution", "school", "organization", "publisher"]
+        details = ", ".join(_field(entry, key) for key in keys + ["note"] if _field(entry, key))
+        if details:
+            runs.append((_sentence(details), ROMAN))
+
+    return runs
+
+
+def _reference_sort_key(entry):
+    authors = _field(entry, "author") or _field(entry, "editor") or ""
+    first = re.split(r"\s+and\s+", authors)[0] if authors else ""
+    return (_split_name(first)[0].lower() if first else "", _field(entry, "year") or "")
+
+
+def draw_cover_sheet(week):
+    canvas = CoverSheetCanvas()
+    rows = week.lessons
+
+    canvas.skip(20)
+    canvas.paragraph(
+        [(detex(week_title(week.number, week.topic)), ROMAN, None)], TITLE_SIZE, 22, center=True
+    )
+    canvas.skip(10)
+    canvas.paragraph([(prettify_date(week.date), ROMAN, None)], DATE_SIZE, 15, center=True)
+    canvas.skip(24)
+
+    canvas.paragraph([("1   Reading Materials", BOLD, None)], SECTION_SIZE, 18)
+    canvas.skip(6)
+    for i, row in enumerate(rows, start=1):
+        line, url = reading_list_item(row)
+        runs = [(detex(line) + " ", ROMAN, None)]
+        if url is not None:
+            runs.append(("Available here", ROMAN, url))
+        canvas.paragraph(runs, BODY_SIZE, BODY_LEADING, ITEM_INDENT, ITEM_INDENT, label=f"{i}.")
+        canvas.skip(2)
+
+    canvas.skip(18)
+    canvas.paragraph([("References", BOLD, None)], SECTION_SIZE, 18)
+    canvas.skip(6)
+    entries = {row["reference"]: row for row in rows}
+    for entry in sorted(entries.values(), key=_reference_sort_key):
+        runs = [(text, font, None) for text, font in format_reference(entry)]
+        canvas.paragraph(runs, BODY_SIZE, BODY_LEADING, hanging=HANGING_INDENT)
+        canvas.skip(4)
+
+    return canvas
+
+
+def _font_resources():
+    return DictionaryObject(
+        {
+            NameObject(key): DictionaryObject(
+                {
+                    NameObject("/Type"): NameObject("/Font"),
+                    NameObject("/Subtype"): NameObject("/Type1"),
+                    NameObject("/BaseFont"): NameObject("/" + name),
+                    NameObject("/Encoding"): NameObject("/WinAnsiEncoding"),
+                }
+            )
+            for key, name in FONTS.items()
+        }
+    )
+
+
+def _link_annotation(rect, url):
+    return DictionaryObject(
+        {
+            NameObject("/Type"): NameObject("/Annot"),
+            NameObject("/Subtype"): NameObject("/Link"),
+            NameObject("/Rect"): ArrayObject([FloatObject(round(v, 2)) for v in rect]),
+            NameObject("/Border"): ArrayObject([NumberObject(0), NumberObject(0), NumberObject(1)]),
+            NameObject("/C"): ArrayObject([NumberObject(c) for c in LINK_COLOR]),
+            NameObject("/A"): DictionaryObject(
+                {
+                    NameObject("/S"): NameObject("/URI"),
+                    NameObject("/URI"): TextStringObject(url),
+                }
+            ),
+        }
+    )
+
+
+def write_cover_sheet(canvas, out_file):
+    writer = PdfWriter()
+    fonts = writer._add_object(_font_resources())
+    for number, page_content in enumerate(canvas.pages):
+        page = writer.add_blank_page(width=PAGE_WIDTH, height=PAGE_HEIGHT)
+        page[NameObject("/Resources")] = DictionaryObject({NameObject("/Font"): fonts})
+
+        content = StreamObject()
+        content._data = zlib.compress(b"\n".join(page_content["operators"]))
+        content[NameObject("/Filter")] = NameObject("/FlateDecode")
+        page[NameObject("/Contents")] = writer._add_object(content)
+
+        for rect, url in page_content["links"]:
+            writer.add_annotation(number, _link_annotation(rect, url))
+
+    # The same bookmark hyperref adds for the section
+    writer.add_outline_item("1 Reading Materials", 0)
+    with open(out_file, "wb") as file:
+        writer.write(file)
+
+    return out_file
+
+
+# Lays out each week's cover sheet directly as PDF pages, in the standard Times fonts, without
+# LaTeX. The bibliography is formatted from the bibtex fields merged into the lesson plan, so
+# bibtex_path is only taken to match the other backends.
+@tracing.traced()
+def generate_native_cover_sheets(data, bibtex_path, out_path=None):
+    if out_path is None:
+        out_path = ""
+
+    paths = []
+    for week in as_lesson_plan(data).weeks.values():
+        with tracing.span("cover_sheet", week=week.number):
+            canvas = draw_cover_sheet(week)
+            fpath = os.path.join(out_path, f"week_{week.number}_coversheet.pdf")
+            paths.append(write_cover_sheet(canvas, fpath))
+
+    return paths
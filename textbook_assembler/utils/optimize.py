@@ -0,0 +1,446 @@
+import hashlib
+import logging
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+from pypdf.generic import (
+    ArrayObject,
+    ContentStream,
+    DictionaryObject,
+    EncodedStreamObject,
+    IndirectObject,
+    NameObject,
+    NumberObject,
+    StreamObject,
+)
+
+from textbook_assembler.utils import tracing
+from textbook_assembler.utils.cache import DEFAULT_CACHE_SIZE, StreamCache, hash_payload
+from textbook_assembler.utils.tracing import format_bytes
+
+try:
+    from PIL import Image
+except ImportError:  # pragma: nocover
+    Image = None
+
+_log = logging.getLogger("textbook_assembler")
+
+DEFAULT_JPEG_QUALITY = 85
+# Images are only resampled when they are noticeably denser than the target, since every
+# resample of a JPEG loses a little quality
+DPI_TOLERANCE = 1.1
+IMAGE_MODES = {"/DeviceRGB": "RGB", "/DeviceGray": "L"}
+
+
+def optimize_settings(
+    image_dpi=None, jpeg_quality=None, recompress_streams=False, compress_content=False
+):
+    if image_dpi is None and jpeg_quality is None and not recompress_streams:
+        if not compress_content:
+            return None
+
+    if image_dpi is not None and image_dpi <= 0:
+        raise ValueError(f"image_dpi must be positive, got {image_dpi}")
+    if jpeg_quality is not None and not 1 <= jpeg_quality <= 95:
+        raise ValueError(f"jpeg_quality must be between 1 and 95, got {jpeg_quality}")
+    if (image_dpi is not None or jpeg_quality is not None) and Image is None:
+        raise ImportError(
+            "Downsampling and JPEG recompression need Pillow, install it with "
+            "`pip install textbook_assembler[images]`"
+        )
+
+    return {
+        "image_dpi": image_dpi,
+        "jpeg_quality": jpeg_quality,
+        "recompress_streams": recompress_streams,
+        "compress_content": compress_content,
+    }
+
+
+def _resolve(objects, obj):
+    if isinstance(obj, IndirectObject):
+        return objects[obj.idnum - 1]
+    return obj
+
+
+def _names(objects, value):
+    value = _resolve(objects, value)
+    if value is None:
+        return []
+    if isinstance(value, ArrayObject):
+        return [str(_resolve(objects, item)) for item in value]
+    return [str(value)]
+
+
+def _page_size(objects, page):
+    # Inherited boxes live on the page tree nodes, which are always in memory
+    node = page
+    while node is not None and "/MediaBox" not in node:
+        node = _resolve(objects, dict.get(node, "/Parent"))
+    if node is None:
+        return 612.0, 792.0
+
+    x0, y0, x1, y1 = [float(_resolve(objects, v)) for v in _resolve(objects, node["/MediaBox"])]
+    return abs(x1 - x0) or 612.0, abs(y1 - y0) or 792.0
+
+
+def _image_dpi(stream, page_size):
+    width, height = int(stream.get("/Width", 0)), int(stream.get("/Height", 0))
+    # Images are assumed to fill the page at most, which holds for scans and errs towards keeping
+    # resolution for smaller figures
+    return max(width * 72 / page_size[0], height * 72 / page_size[1])
+
+
+def _stream_info(objects, stream, kind, scale):
+    info = {"kind": kind, "filters": _names(objects, dict.get(stream, "/Filter"))}
+    if kind == "image":
+        params = _resolve(objects, dict.get(stream, "/DecodeParms"))
+        if isinstance(params, ArrayObject):
+            params = _resolve(objects, params[0]) if len(params) > 0 else None
+        colorspace = _resolve(objects, dict.get(stream, "/ColorSpace"))
+        info.update(
+            {
+                "width": int(stream.get("/Width", 0)),
+                "height": int(stream.get("/Height", 0)),
+                "bits": int(_resolve(objects, stream.get("/BitsPerComponent", 0)) or 0),
+                "colorspace": str(colorspace) if isinstance(colorspace, NameObject) else None,
+                "predictor": isinstance(params, DictionaryObject)
+                and int(_resolve(objects, params.get("/Predictor", 1))) > 1,
+                # Colour key masks and decode arrays depend on exact sample values
+                "exact": any(key in stream for key in ("/Mask", "/Decode", "/ImageMask")),
+                "scale": scale,
+            }
+        )
+
+    return info
+
+
+def _deflate(data, info):
+    filters = info["filters"]
+    try:
+        if filters == []:
+            raw = data
+        elif filters == ["/FlateDecode"]:
+            raw = zlib.decompress(data)
+        else:
+            return None
+    except zlib.error:
+        return None
+
+    return {"/Filter": "/FlateDecode"}, [], zlib.compress(raw, 9)
+
+
+def _decode_image(data, info):
+    mode = IMAGE_MODES.get(info["colorspace"])
+    if mode is None or info["bits"] != 8 or info["exact"]:
+        return None
+
+    filters = info["filters"]
+    size = (info["width"], info["height"])
+    try:
+        if filters == ["/DCTDecode"]:
+            image = Image.open(BytesIO(data))
+            image.load()
+            # CMYK and Adobe-inverted JPEGs are left alone
+            return image if image.mode == mode else None
+        if filters == ["/FlateDecode"] and not info["predictor"]:
+            return Image.frombytes(mode, size, zlib.decompress(data))
+        if filters == []:
+            return Image.frombytes(mode, size, data)
+    except (OSError, ValueError, zlib.error):
+        return None
+
+    return None
+
+
+def _recompress_image(data, info, settings):
+    image = _decode_image(data, info)
+    if image is None:
+        return None
+
+    resized = info["scale"] < 1
+    if resized:
+        size = (
+            max(1, round(info["width"] * info["scale"])),
+            max(1, round(info["height"] * info["scale"])),
+        )
+        image = image.resize(size, Image.LANCZOS)
+    elif settings["jpeg_quality"] is None:
+        return None
+
+    if settings["jpeg_quality"] is not None or info["filters"] == ["/DCTDecode"]:
+        buffer = BytesIO()
+        image.save(buffer, "JPEG", quality=settings["jpeg_quality"] or DEFAULT_JPEG_QUALITY)
+        updates, new_data = {"/Filter": "/DCTDecode"}, buffer.getvalue()
+    else:
+        updates, new_data = {"/Filter": "/FlateDecode"}, zlib.compress(image.tobytes(), 9)
+
+    updates.update({"/Width": image.size[0], "/Height": image.size[1], "/BitsPerComponent": 8})
+    return updates, ["/DecodeParms"], new_data
+
+
+# Recompresses one stream and returns (updates, removed keys, data) for its dictionary, or None
+# when nothing smaller was found. Runs in worker processes, so it only deals in plain values.
+def optimize_stream(data, info, settings):
+    result = None
+    lossy = settings["image_dpi"] is not None or settings["jpeg_quality"] is not None
+    if info["kind"] == "image" and lossy:
+        result = _recompress_image(data, info, settings)
+
+    if result is None and (
+        settings["recompress_streams"]
+        or (info["kind"] == "content" and settings["compress_content"])
+    ):
+        result = _deflate(data, info)
+
+    if result is None or len(result[2]) >= len(data):
+        return None
+    return result
+
+
+def optimize_page_streams(tasks, settings):
+    return [(key, optimize_stream(data, info, settings)) for key, data, info in tasks]
+
+
+# Collects the streams each page draws on, following its contents and resources (and those of
+# the form XObjects and annotations it uses) but never other pages. Each stream is handed to the
+# first page that reaches it, along with how it is used there.
+def _page_streams(objects, page_idnum, candidates, seen, settings):
+    page = objects[page_idnum - 1]
+    page_size = _page_size(objects, page)
+    contents = {ref.idnum for ref in _content_refs(objects, page)}
+    streams = []
+
+    stack = [value for key, value in page.items() if key != "/Parent"]
+    while stack:
+        obj = stack.pop()
+        if isinstance(obj, IndirectObject):
+            if obj.idnum in seen or obj.idnum not in candidates:
+                continue
+            target = objects[obj.idnum - 1]
+            if isinstance(target, DictionaryObject) and target.get("/Type") == "/Page":
+                continue
+            seen.add(obj.idnum)
+            if isinstance(target, StreamObject) and not isinstance(target, ContentStream):
+                streams.append((obj.idnum, _stream_kind(obj.idnum, target, contents)))
+            obj = target
+
+        if isinstance(obj, DictionaryObject):
+            stack.extend(value for key, value in obj.items() if key not in ("/Parent", "/P"))
+        elif isinstance(obj, ArrayObject):
+            stack.extend(obj)
+
+    masks = set()
+    for idnum, kind in streams:
+        for key in ("/SMask", "/Mask"):
+            ref = dict.get(objects[idnum - 1], key)
+            if isinstance(ref, IndirectObject):
+                masks.add(ref.idnum)
+
+    tasks = []
+    for idnum, kind in streams:
+        if idnum in masks:
+            # Soft masks are alpha channels, which JPEG artefacts would show up in as halos
+            kind = "stream"
+        if not _wanted(kind, settings):
+            continue
+        stream = objects[idnum - 1]
+        scale = 1.0
+        if kind == "image" and settings["image_dpi"] is not None:
+            dpi = _image_dpi(stream, page_size)
+            if dpi > settings["image_dpi"] * DPI_TOLERANCE:
+                scale = settings["image_dpi"] / dpi
+        tasks.append((idnum, _stream_info(objects, stream, kind, scale)))
+
+    return tasks
+
+
+def _content_refs(objects, page):
+    contents = dict.get(page, "/Contents")
+    refs = []
+    if isinstance(contents, IndirectObject):
+        refs.append(contents)
+        contents = _resolve(objects, contents)
+    if isinstance(contents, ArrayObject):
+        refs.extend(ref for ref in contents if isinstance(ref, IndirectObject))
+    return refs
+
+
+def _stream_kind(idnum, stream, contents):
+    if idnum in contents:
+        return "content"
+    if stream.get("/Subtype") == "/Image":
+        return "image"
+    return "stream"
+
+
+def _wanted(kind, settings):
+    if settings["recompress_streams"]:
+        return True
+    if kind == "content":
+        return settings["compress_content"]
+    if kind == "image":
+        return settings["image_dpi"] is not None or settings["jpeg_quality"] is not None
+    return False
+
+
+def _replace_stream(writer, idnum, updates, removed, data):
+    old = writer._objects[idnum - 1]
+    new = EncodedStreamObject()
+    for key, value in old.items():
+        if key not in removed and key != "/Length":
+            new[key] = value
+    for key, value in updates.items():
+        new[NameObject(key)] = NameObject(value) if isinstance(value, str) else NumberObject(value)
+    new._data = data
+    new.indirect_reference = IndirectObject(idnum, 0, writer)
+    writer._objects[idnum - 1] = new
+
+
+# Shrinks the streams of a PdfWriter before it is written: images are downsampled to image_dpi
+# and re-encoded as JPEG at jpeg_quality, streams are recompressed with the best zlib level and
+# uncompressed page content streams are compressed. Work is split per page over a pool of
+# max_workers processes, and results are cached per stream content, page geometry and settings,
+# so sources that are assembled again are not recompressed. A stream is only replaced when the
+# result is smaller.
+class OutputOptimizer:
+    def __init__(self, settings, max_workers=None, cache_dir=None, cache_size=DEFAULT_CACHE_SIZE):
+        self.settings = settings
+        self.max_workers = max_workers
+        self.cache = StreamCache(cache_dir, cache_size) if cache_dir else None
+        self.stats = {
+            "streams": 0,
+            "optimized": 0,
+            "cached": 0,
+            "bytes_before": 0,
+            "bytes_after": 0,
+            "seconds": 0.0,
+        }
+        self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+        return False
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+
+    def _key(self, data, info):
+        return hash_payload(
+            {
+                "data": hashlib.sha256(data).hexdigest(),
+                "info": info,
+                "settings": self.settings,
+            }
+        )
+
+    def _run(self, pages):
+        if self.max_workers is None or self.max_workers <= 1 or len(pages) <= 1:
+            return [
+                result for tasks in pages for result in optimize_page_streams(tasks, self.settings)
+            ]
+
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.max_workers)
+        futures = [
+            self._pool.submit(optimize_page_streams, tasks, self.settings) for tasks in pages
+        ]
+        return [result for future in futures for result in future.result()]
+
+    def _lookup(self, key):
+        cached = self.cache.get(key) if self.cache is not None else None
+        if cached is None:
+            return False, None
+
+        header, data = cached
+        self.stats["cached"] += 1
+        return True, None if header is None else (header[0], header[1], data)
+
+    def _store(self, key, result):
+        if self.cache is None:
+            return
+        if result is None:
+            self.cache.put(key, None)
+        else:
+            self.cache.put(key, [result[0], result[1]], result[2])
+
+    # Optimizes the streams used by the pages among candidates (idnums of the writer's objects,
+    # all of them by default) and returns the running totals for this optimizer
+    def optimize(self, writer, candidates=None):
+        start = time.perf_counter()
+        objects = writer._objects
+        if candidates is None:
+            candidates = range(1, len(objects) + 1)
+        candidates = {idnum for idnum in candidates if objects[idnum - 1] is not None}
+
+        with tracing.span("optimize") as span:
+            seen = set()
+            results = {}
+            # Streams with the same content and use share one result, like the copies of a
+            # figure that appears in several weeks
+            pending = {}
+            pages = []
+            for idnum in sorted(candidates):
+                obj = objects[idnum - 1]
+                if not isinstance(obj, DictionaryObject) or obj.get("/Type") != "/Page":
+                    continue
+
+                tasks = []
+                for stream_idnum, info in _page_streams(
+                    objects, idnum, candidates, seen, self.settings
+                ):
+                    data = objects[stream_idnum - 1]._data
+                    key = self._key(data, info)
+                    self.stats["streams"] += 1
+                    self.stats["bytes_before"] += len(data)
+                    if key in pending:
+                        pending[key].append(stream_idnum)
+                        continue
+
+                    found, result = self._lookup(key)
+                    if found:
+                        results[stream_idnum] = result
+                    else:
+                        pending[key] = [stream_idnum]
+                        tasks.append((key, data, info))
+                if len(tasks) > 0:
+                    pages.append(tasks)
+
+            for key, result in self._run(pages):
+                self._store(key, result)
+                for stream_idnum in pending[key]:
+                    results[stream_idnum] = result
+            if self.cache is not None and len(pages) > 0:
+                self.cache.evict()
+
+            for stream_idnum, result in results.items():
+                if result is None:
+                    self.stats["bytes_after"] += len(objects[stream_idnum - 1]._data)
+                    continue
+                updates, removed, data = result
+                _replace_stream(writer, stream_idnum, updates, removed, data)
+                self.stats["optimized"] += 1
+                self.stats["bytes_after"] += len(data)
+
+            span.add(pages=len(pages))
+
+        self.stats["seconds"] += time.perf_counter() - start
+        return self.stats
+
+
+def format_optimize_stats(stats):
+    saved = stats["bytes_before"] - stats["bytes_after"]
+    percent = 100 * saved / stats["bytes_before"] if stats["bytes_before"] > 0 else 0.0
+    return (
+        f"Optimized {stats['optimized']} of {stats['streams']} stream(s) "
+        f"({stats['cached']} from cache) in {stats['seconds']:.2f}s, "
+        f"{format_bytes(stats['bytes_before'])} -> {format_bytes(stats['bytes_after'])} "
+        f"(saved {format_bytes(saved)}, {percent:.1f}%)"
+    )
@@ -0,0 +1,248 @@
+import logging
+import weakref
+
+from pypdf.generic import (
+    PAGE_FIT,
+    ArrayObject,
+    DictionaryObject,
+    Fit,
+    IndirectObject,
+    NameObject,
+)
+
+from textbook_assembler.utils import tracing
+
+_log = logging.getLogger("textbook_assembler")
+
+# Annotations are filtered below rather than cloned with the page, and article beads point into
+# the source's thread list, so both are left out of the page itself like PdfWriter.merge does
+PAGE_EXCLUDED_KEYS = [1, "/B", 1, "/Annots"]
+
+
+# Options of the lean page import, or None for PdfWriter.append, which imports the outline, every
+# named destination, annotations, form fields and article threads for each slice of a source
+def import_settings(lean=False, outline=True, links=True, forms=True):
+    if not lean:
+        if not (outline and links and forms):
+            raise ValueError(
+                "Dropping the outline, links or form fields needs the lean page import"
+            )
+        return None
+
+    return {"outline": outline, "links": links, "forms": forms}
+
+
+def _page_idnum(page):
+    if isinstance(page, IndirectObject):
+        return page.idnum
+    reference = getattr(page, "indirect_reference", None)
+    return reference.idnum if reference is not None else None
+
+
+# The source page an internal link jumps to as (idnum, explicit destination), or None for links
+# that leave the document, like URIs and links to other files
+def _link_target(annot, reader):
+    dest = annot.get("/Dest")
+    action = annot.get("/A")
+    if dest is None and action is not None and action.get("/S") == "/GoTo":
+        dest = action.get("/D")
+    if dest is None:
+        return None
+
+    dest = dest.get_object()
+    if isinstance(dest, DictionaryObject):
+        dest = dest.get("/D", ArrayObject()).get_object()
+    if isinstance(dest, ArrayObject):
+        if len(dest) == 0:
+            return (None, dest)
+        page = dest[0]
+        if isinstance(page, int) and 0 <= page < len(reader.pages):
+            page = reader.pages[page].indirect_reference
+        return (_page_idnum(page), dest)
+
+    named = reader.named_destinations.get(str(dest))
+    if named is None:
+        return (None, None)
+    return (_page_idnum(named.get("/Page")), named.dest_array)
+
+
+def _import_link(writer, annot, reader, pages):
+    target = _link_target(annot, reader)
+    if target is None:
+        return annot.clone(writer)
+
+    idnum, dest = target
+    if idnum not in pages:
+        return None
+
+    # Named and GoTo destinations become an explicit destination on the imported page
+    link = annot.clone(writer, False, ["/Dest", "/A"])
+    dest = ArrayObject(dest)
+    dest[0] = pages[idnum].indirect_reference
+    link[NameObject("/Dest")] = dest.clone(writer)
+    return link
+
+
+def _fields_array(writer, reader):
+    acroform = writer.root_object.get("/AcroForm")
+    if acroform is None:
+        # A direct AcroForm is cloned into the catalog as is
+        source = reader.root_object["/AcroForm"].get_object()
+        acroform = source.clone(writer, False, ["/Fields"])
+        writer.root_object[NameObject("/AcroForm")] = acroform.indirect_reference or acroform
+    acroform = acroform.get_object()
+
+    if "/Fields" not in acroform:
+        acroform[NameObject("/Fields")] = ArrayObject()
+    return acroform["/Fields"]
+
+
+# Form fields are trees whose kids can sit on any page, so each widget's ancestors are cloned
+# without their kids, and the kids that were imported are linked back in
+def _import_widget(writer, annot, reader):
+    widget = annot.clone(writer, False, ["/Parent"])
+    child, source = widget, annot
+    while "/Parent" in source:
+        source = source["/Parent"].get_object()
+        parent = source.clone(writer, False, ["/Kids", "/Parent"])
+        seen = "/Kids" in parent
+        kids = parent.setdefault(NameObject("/Kids"), ArrayObject())
+        if child.indirect_reference not in kids:
+            kids.append(child.indirect_reference)
+        child[NameObject("/Parent")] = parent.indirect_reference
+        child = parent
+        if seen:
+            return widget
+
+    fields = _fields_array(writer, reader)
+    if child.indirect_reference not in fields:
+        fields.append(child.indirect_reference)
+    return widget
+
+
+def _import_annotations(writer, page, source_page, reader, pages, links, forms):
+    annots = ArrayObject()
+    dropped = 0
+    for annot in source_page.get("/Annots", []):
+        annot = annot.get_object()
+        subtype = annot.get("/Subtype")
+        if subtype == "/Link":
+            imported = _import_link(writer, annot, reader, pages) if links else None
+        elif subtype == "/Widget":
+            imported = _import_widget(writer, annot, reader) if forms else None
+        else:
+            imported = annot.clone(writer)
+
+        if imported is None:
+            dropped += 1
+        else:
+            annots.append(getattr(imported, "indirect_reference", None) or imported)
+
+    if len(annots) > 0:
+        page[NameObject("/Annots")] = annots
+    return dropped
+
+
+def _outline_items(reader, node, visited):
+    items = []
+    while node is not None:
+        node = node.get_object()
+        if id(node) in visited:
+            _log.warning("Ignoring a cycle in the outline of a source PDF")
+            break
+        visited.add(id(node))
+
+        target = _link_target(node, reader) or (None, None)
+        children = _outline_items(reader, node.get("/First"), visited)
+        items.append((node, target, children))
+        node = node.get("/Next")
+
+    return items
+
+
+# The outline of a source as (node, (page idnum, destination), children) items. PdfWriter.merge
+# parses every item again for each slice, which is where it spends most of its time on bookmarked
+# sources, so the tree is read once per reader and only the items that are kept are added.
+_outline_trees = weakref.WeakKeyDictionary()
+
+
+def _outline_tree(reader):
+    if reader not in _outline_trees:
+        root = reader.root_object.get("/Outlines")
+        first = root.get_object().get("/First") if root is not None else None
+        _outline_trees[reader] = _outline_items(reader, first, set())
+
+    return _outline_trees[reader]
+
+
+def _outline_fit(dest):
+    if dest is None or len(dest) < 2:
+        return PAGE_FIT
+    return Fit(str(dest[1]), tuple(dest[2:]))
+
+
+def _outline_color(node):
+    color = node.get("/C")
+    if not isinstance(color, ArrayObject) or len(color) != 3:
+        return None
+    return tuple(float(value) for value in color)
+
+
+def _add_outline(writer, items, pages, parent=None):
+    for node, (idnum, dest), children in items:
+        if idnum not in pages and not _keeps_outline(children, pages):
+            continue
+
+        # Items whose page wasn't imported are kept without a destination to hold their children
+        flags = int(node.get("/F", 0))
+        item = writer.add_outline_item(
+            str(node.get("/Title", "")),
+            pages[idnum].indirect_reference if idnum in pages else None,
+            parent=parent,
+            color=_outline_color(node),
+            bold=bool(flags & 2),
+            italic=bool(flags & 1),
+            fit=_outline_fit(dest),
+            is_open=node.get("/Count", 0) >= 0,
+        )
+        _add_outline(writer, children, pages, item)
+
+
+def _keeps_outline(items, pages):
+    return any(
+        idnum in pages or _keeps_outline(children, pages) for _, (idnum, _), children in items
+    )
+
+
+def _import_outline(writer, reader, pages):
+    _add_outline(writer, _outline_tree(reader), pages)
+
+
+# Appends pages[0]:pages[1] of reader to writer, cloning only what those pages reference. Links
+# are kept when they leave the document or point at one of the imported pages, and dropped
+# otherwise; form widgets keep their field, without sibling widgets on pages that weren't
+# imported. Named destinations and article threads are not imported.
+@tracing.traced()
+def import_pages(writer, reader, pages, outline=True, links=True, forms=True):
+    imported = {}
+    sources = []
+    for index in range(*pages):
+        source_page = reader.pages[index]
+        page = writer.add_page(source_page, PAGE_EXCLUDED_KEYS)
+        imported[source_page.indirect_reference.idnum] = page
+        sources.append((source_page, page))
+
+    dropped = 0
+    for source_page, page in sources:
+        if "/Annots" in source_page:
+            dropped += _import_annotations(
+                writer, page, source_page, reader, imported, links, forms
+            )
+
+    if outline:
+        _import_outline(writer, reader, imported)
+
+    if dropped > 0:
+        _log.debug(f"Dropped {dropped} annotation(s) from pages {pages[0] + 1}-{pages[1]}")
+    tracing.count(annotations_dropped=dropped)
+    return list(imported.values())
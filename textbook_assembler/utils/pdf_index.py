@@ -0,0 +1,135 @@
+import json
+import logging
+import os
+import tempfile
+
+from textbook_assembler.utils import tracing
+from textbook_assembler.utils.cache import hash_file, hash_payload
+from textbook_assembler.utils.manifest import stat_record
+
+_log = logging.getLogger("textbook_assembler")
+
+INDEX_PREFIX = ".textbook_assembler_index"
+INDEX_VERSION = 1
+
+
+# The index is kept out of the source directory, whose listing is one of the build's inputs and
+# which may be read-only. It is named after the source directory, so courses that keep their
+# indexes in the same directory don't share one.
+def default_index_path(pdf_path, index_dir):
+    key = hash_payload(os.path.abspath(pdf_path))[:16]
+    return os.path.join(index_dir, f"{INDEX_PREFIX}_{key}.json")
+
+
+def is_linearized(path):
+    # A linearization dictionary has to be the first object in the file
+    with open(path, "rb") as file:
+        return b"/Linearized" in file.read(1024)
+
+
+def read_pdf_metadata(path, reader=None):
+    if reader is None:
+        # pypdf is only loaded for files that aren't indexed yet, so checks against an up to date
+        # index never import it
+        from pypdf import PdfReader
+
+        from textbook_assembler.utils.readers import SourceFile
+
+        with SourceFile(path) as source:
+            return read_pdf_metadata(path, PdfReader(source.stream))
+
+    encrypted = reader.is_encrypted
+    if encrypted:
+        # Files that only need an empty user password open; decrypt returns a falsy result for
+        # the rest
+        try:
+            error = None if reader.decrypt("") else "it needs a password"
+        except Exception as e:
+            error = e
+        if error is not None:
+            _log.warning(f"Could not open encrypted PDF {path}: {error}")
+            return {"pages": None, "page_sizes": [], "encrypted": True, "linearized": False}
+
+    return {
+        "pages": len(reader.pages),
+        "page_sizes": [
+            [float(page.mediabox.width), float(page.mediabox.height)] for page in reader.pages
+        ],
+        "encrypted": encrypted,
+        "linearized": is_linearized(path),
+    }
+
+
+# Page counts, page sizes and encryption/linearization flags for the PDFs in a source directory.
+# Entries are keyed by file name and carry the size, mtime and content hash they were computed
+# from, so a refresh only stats unchanged files and only parses files whose content changed. When
+# index_path is set the index is kept in that file between builds. An index that isn't kept never
+# compares content with an earlier build, so it doesn't hash the files.
+class PdfIndex:
+    def __init__(self, pdf_path, index_path=None):
+        self.pdf_path = pdf_path
+        self.index_path = index_path
+        self.entries = {}
+        self.parse_count = 0
+        self._dirty = False
+
+        if index_path is not None:
+            self.load()
+
+    def load(self):
+        if not os.path.isfile(self.index_path):
+            return
+        try:
+            with open(self.index_path) as file:
+                index = json.load(file)
+        except (OSError, ValueError) as e:
+            _log.warning(f"Ignoring unreadable PDF index {self.index_path}: {e}")
+            return
+
+        if index.get("version") == INDEX_VERSION:
+            self.entries = index.get("entries", {})
+
+    def save(self):
+        if self.index_path is None or not self._dirty:
+            return
+
+        index_dir = os.path.dirname(self.index_path) or "."
+        try:
+            os.makedirs(index_dir, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=index_dir, suffix=".tmp")
+            with os.fdopen(fd, "w") as file:
+                json.dump({"version": INDEX_VERSION, "entries": self.entries}, file)
+            os.replace(tmp_path, self.index_path)
+        except OSError as e:
+            _log.warning(f"Could not write PDF index {self.index_path}: {e}")
+            return
+
+        self._dirty = False
+
+    @tracing.traced("pdf_index.refresh")
+    def refresh(self, fnames, readers=None):
+        for fname in fnames:
+            path = os.path.join(self.pdf_path, fname)
+            record = stat_record(path)
+            entry = self.entries.get(fname)
+
+            if entry is not None and all(entry.get(k) == v for k, v in record.items()):
+                continue
+
+            if self.index_path is not None:
+                record["sha256"] = hash_file(path)
+            if entry is not None and "sha256" in record and entry.get("sha256") == record["sha256"]:
+                self.entries[fname] = {**entry, **record}
+            else:
+                reader = readers.get(fname) if readers is not None else None
+                self.entries[fname] = {**record, **read_pdf_metadata(path, reader)}
+                self.parse_count += 1
+            self._dirty = True
+
+        self.save()
+
+    def page_count(self, fname):
+        if fname not in self.entries:
+            self.refresh([fname])
+
+        return self.entries[fname]["pages"]
@@ -0,0 +1,221 @@
+import logging
+import os
+import time
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+from contextlib import ExitStack
+
+from textbook_assembler.utils import tracing
+
+_log = logging.getLogger("textbook_assembler")
+
+# Where a task runs. main tasks run one at a time in the thread running the plan, and are the only
+# ones that may touch shared build state like the writer, the reader pool or the caches. cpu tasks
+# run in a process pool. subprocess tasks spend their time waiting on another program, like LaTeX,
+# so they run in a thread pool with a limit of its own.
+TASK_KINDS = ("main", "cpu", "subprocess")
+
+
+class Task:
+    __slots__ = (
+        "name",
+        "kind",
+        "func",
+        "args",
+        "deps",
+        "pages",
+        "result",
+        "error",
+        "started",
+        "finished",
+    )
+
+    def __init__(self, name, kind, func, args, deps, pages=None):
+        self.name = name
+        self.kind = kind
+        self.func = func
+        self.args = args
+        self.deps = deps
+        self.pages = pages
+        self.result = None
+        self.error = None
+        self.started = None
+        self.finished = None
+
+    @property
+    def done(self):
+        return self.finished is not None and self.error is None
+
+    @property
+    def seconds(self):
+        if self.finished is None:
+            return None
+        return self.finished - self.started
+
+    def __repr__(self):
+        return f"Task({self.name!r}, {self.kind!r})"
+
+
+class TaskError(RuntimeError):
+    def __init__(self, errors):
+        self.errors = errors
+        details = "; ".join(f"{name}: {err}" for name, err in errors.items())
+        super().__init__(f"{len(errors)} build task(s) failed. {details}")
+
+
+# The tasks of a build and the tasks each one waits for. A task can only depend on tasks added
+# before it, so the order tasks were added in is a valid order to run them in and the graph can't
+# have cycles. Tasks can be added after part of the plan ran; run_plan() runs the ones left.
+class BuildPlan:
+    def __init__(self):
+        self.tasks = {}
+
+    def add(self, name, kind, func, *args, deps=(), pages=None):
+        if name in self.tasks:
+            raise ValueError(f"The plan already has a task named {name}")
+        if kind not in TASK_KINDS:
+            raise ValueError(f"Unknown task kind {kind}, expected one of: {', '.join(TASK_KINDS)}")
+        missing = [dep for dep in deps if dep not in self.tasks]
+        if len(missing) > 0:
+            raise ValueError(f"Task {name} depends on unknown task(s): {', '.join(missing)}")
+
+        self.tasks[name] = Task(name, kind, func, args, tuple(deps), pages)
+        return name
+
+    def result(self, name):
+        return self.tasks[name].result
+
+    def pending(self):
+        return [task for task in self.tasks.values() if task.finished is None]
+
+    def critical_path(self):
+        # The chain of dependent tasks that took longest, as (seconds, task names). No concurrency
+        # limit can make the plan finish sooner than this.
+        longest = {}
+        for task in self.tasks.values():
+            seconds, path = max(
+                (longest[dep] for dep in task.deps), key=lambda item: item[0], default=(0.0, [])
+            )
+            longest[task.name] = (seconds + (task.seconds or 0.0), path + [task.name])
+
+        return max(longest.values(), key=lambda item: item[0], default=(0.0, []))
+
+    def __getitem__(self, name):
+        return self.tasks[name]
+
+    def __iter__(self):
+        return iter(self.tasks.values())
+
+    def __len__(self):
+        return len(self.tasks)
+
+
+def format_plan(plan):
+    kinds = [task.kind for task in plan]
+    counts = ", ".join(f"{kinds.count(kind)} {kind}" for kind in TASK_KINDS if kind in kinds)
+    lines = [f"{len(plan)} task(s): {counts}"]
+    width = max((len(task.name) for task in plan), default=0)
+
+    for task in plan:
+        line = f"  {task.name:<{width}}  {task.kind:<10}"
+        if task.pages is not None:
+            line += f"  {task.pages:>5} pages"
+        if task.done:
+            line += f"  done in {task.seconds:.2f}s"
+        if len(task.deps) > 0:
+            line += f"  after {', '.join(task.deps)}"
+        lines.append(line)
+
+    return "\n".join(lines)
+
+
+def _run_task(func, args):
+    # Wall clock times, so tasks that ran in worker processes can be compared with the rest
+    started = time.time()
+    result = func(*args)
+    return result, started, time.time()
+
+
+def _run_traced(task):
+    with tracing.span("task", task=task.name, kind=task.kind):
+        return _run_task(task.func, task.args)
+
+
+def _finish(task, future, errors):
+    try:
+        task.result, task.started, task.finished = future.result()
+    except Exception as e:
+        task.error = e
+        task.finished = time.time()
+        errors[task.name] = e
+
+
+# Runs the tasks of plan that haven't run yet. A task starts once the tasks it depends on are done:
+# cpu tasks in a pool of up to max_workers processes, or in this thread when max_workers is 1 or
+# less, and subprocess tasks in a pool of up to max_subprocesses threads, while ready main tasks
+# run here in plan order. A failed task only stops the tasks that depend on it, so independent
+# tasks like the cover sheets of other weeks still run and report their own errors. Then the error
+# is raised, or a TaskError if more than one task failed.
+@tracing.traced()
+def run_plan(plan, max_workers=None, max_subprocesses=None):
+    limits = {"cpu": max_workers or 1, "subprocess": max(1, max_subprocesses or 1)}
+    waiting = plan.pending()
+    running = {}
+    errors = {}
+
+    with ExitStack() as stack:
+        pools = {}
+        if limits["cpu"] > 1 and any(task.kind == "cpu" for task in waiting):
+            # Workers are started before the subprocess threads. Forking once those run could
+            # leave locks they hold, like the logging and tracing ones, locked in the workers.
+            pools["cpu"] = stack.enter_context(ProcessPoolExecutor(max_workers=limits["cpu"]))
+            pools["cpu"].submit(os.getpid).result()
+        if any(task.kind == "subprocess" for task in waiting):
+            pools["subprocess"] = stack.enter_context(
+                ThreadPoolExecutor(max_workers=limits["subprocess"])
+            )
+
+        while len(waiting) > 0 or len(running) > 0:
+            ready = [task for task in waiting if all(plan[dep].done for dep in task.deps)]
+
+            inline = None
+            for task in ready:
+                pool = pools.get(task.kind)
+                if pool is None:
+                    inline = inline or task
+                elif sum(other.kind == task.kind for other in running.values()) < limits[task.kind]:
+                    if task.kind == "cpu":
+                        future = pool.submit(_run_task, task.func, task.args)
+                    else:
+                        future = pool.submit(_run_traced, task)
+                    running[future] = task
+                    waiting.remove(task)
+
+            if inline is not None:
+                waiting.remove(inline)
+                started = time.time()
+                try:
+                    with tracing.span("task", task=inline.name, kind=inline.kind):
+                        inline.result = inline.func(*inline.args)
+                except Exception as e:
+                    inline.error = e
+                    errors[inline.name] = e
+                inline.started, inline.finished = started, time.time()
+                continue
+
+            if len(running) == 0:
+                # Only tasks that wait on a failed task are left
+                break
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                _finish(running.pop(future), future, errors)
+
+    if len(errors) == 1:
+        raise next(iter(errors.values()))
+    if len(errors) > 1:
+        raise TaskError(errors)
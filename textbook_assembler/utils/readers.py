@@ -0,0 +1,120 @@
+import logging
+import os
+from collections import OrderedDict
+
+from pypdf import PdfReader
+
+from textbook_assembler.utils import tracing
+
+try:
+    import mmap
+except ImportError:  # pragma: nocover
+    mmap = None
+
+_log = logging.getLogger("textbook_assembler")
+
+DEFAULT_MAX_OPEN = 8
+
+
+# A read-only view of a PDF to hand to PdfReader. Given a path, pypdf copies the whole file into
+# memory; given a file, it reads through Python's buffers. Where the platform allows, the file is
+# memory-mapped instead, so reads are served from the OS page cache and processes reading the same
+# source share its pages. Files that can't be mapped, like empty files or files on some special
+# file systems, are read through the open file. A mapped file must not be truncated in place while
+# it is open, so builds over sources that are rewritten that way can pass use_mmap=False.
+class SourceFile:
+    def __init__(self, path, use_mmap=True):
+        self.path = path
+        self.file = open(path, "rb")
+        self.size = os.fstat(self.file.fileno()).st_size
+        self.mapped = None
+        if use_mmap and mmap is not None and self.size > 0:
+            try:
+                self.mapped = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            except (OSError, ValueError) as e:
+                _log.debug(f"Reading {path} without mmap: {e}")
+
+    @property
+    def stream(self):
+        return self.mapped if self.mapped is not None else self.file
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        if self.mapped is not None:
+            self.mapped.close()
+        self.file.close()
+
+
+# Shares one parsed PdfReader per source file across a build. At most max_open sources are kept
+# open, and the least recently used one is closed when another source is needed, which bounds
+# open files and maps. It bounds parsed readers only where nothing else holds on to them: a
+# PdfWriter keeps every reader it cloned pages from alive until it is written, so with the
+# in-memory writer evicted readers stay in memory, while StreamingPdfWriter lets go of them at each
+# flush. A source opened again after eviction is a new reader, and pypdf clones its objects again
+# rather than sharing the earlier copies, so max_open should cover the sources of a week. Page
+# counts are remembered after eviction so they never require a second parse. Sources are opened
+# as SourceFiles, memory-mapped unless use_mmap is False.
+class ReaderPool:
+    def __init__(self, pdf_path, max_open=DEFAULT_MAX_OPEN, use_mmap=True):
+        self.pdf_path = pdf_path
+        self.max_open = max(1, max_open)
+        self.use_mmap = use_mmap
+        self.parse_count = 0
+        self._readers = OrderedDict()
+        self._page_counts = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _open(self, fname):
+        with tracing.span("parse_pdf", filename=fname) as span:
+            source = SourceFile(os.path.join(self.pdf_path, fname), self.use_mmap)
+            span.add(bytes_read=source.size)
+            self.parse_count += 1
+            try:
+                return source, PdfReader(source.stream)
+            except Exception:
+                source.close()
+                raise
+
+    def get(self, fname):
+        if fname in self._readers:
+            self._readers.move_to_end(fname)
+            return self._readers[fname][1]
+
+        while len(self._readers) >= self.max_open:
+            evicted, (source, _) = self._readers.popitem(last=False)
+            source.close()
+            _log.debug(f"Closed {evicted} to stay within {self.max_open} open source PDFs")
+
+        source, reader = self._open(fname)
+        self._readers[fname] = (source, reader)
+        self._page_counts[fname] = len(reader.pages)
+
+        return reader
+
+    def page_count(self, fname):
+        if fname not in self._page_counts:
+            self.get(fname)
+
+        return self._page_counts[fname]
+
+    def discard(self, fname):
+        # Forgets a source that changed on disk, so the next get() parses it again
+        if fname in self._readers:
+            source, _ = self._readers.pop(fname)
+            source.close()
+        self._page_counts.pop(fname, None)
+
+    def close(self):
+        for source, _ in self._readers.values():
+            source.close()
+        self._readers.clear()
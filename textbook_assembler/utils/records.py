@@ -0,0 +1,123 @@
+import math
+from collections.abc import Mapping
+
+from textbook_assembler.utils.constants import EXPECTED_KEYS
+
+_LESSON_COLUMNS = frozenset(EXPECTED_KEYS)
+
+
+def is_missing(value):
+    return value is None or (isinstance(value, float) and math.isnan(value))
+
+
+# One row of the lesson plan. The lesson plan columns are slots and everything merged in later
+# (the matched source file and the reference's bibtex fields) is kept in fields. Lessons read like
+# the dicts the cover sheet code used to build from each DataFrame row, missing values stay NaN.
+class Lesson(Mapping):
+    __slots__ = (
+        "week",
+        "date",
+        "topic",
+        "reference",
+        "chapter",
+        "page_start",
+        "page_end",
+        "fields",
+    )
+
+    def __init__(self, record):
+        for key in EXPECTED_KEYS:
+            setattr(self, key, record.get(key))
+        self.fields = {k: v for k, v in record.items() if k not in _LESSON_COLUMNS}
+
+    @property
+    def filename(self):
+        return self.fields.get("filename")
+
+    def __getitem__(self, key):
+        if key in _LESSON_COLUMNS:
+            return getattr(self, key)
+        return self.fields[key]
+
+    def __iter__(self):
+        yield from EXPECTED_KEYS
+        yield from self.fields
+
+    def __len__(self):
+        return len(EXPECTED_KEYS) + len(self.fields)
+
+    def __repr__(self):
+        return f"Lesson(week={self.week!r}, reference={self.reference!r})"
+
+
+# The lessons of one week, in lesson plan order. The date and topic are the week's first, which is
+# what the cover sheet shows.
+class Week:
+    __slots__ = ("number", "date", "topic", "lessons")
+
+    def __init__(self, number, lessons):
+        self.number = number
+        self.lessons = lessons
+        self.date = lessons[0].date
+        self.topic = lessons[0].topic
+
+    def filenames(self):
+        return [lesson.filename for lesson in self.lessons if not is_missing(lesson.filename)]
+
+    def __iter__(self):
+        return iter(self.lessons)
+
+    def __len__(self):
+        return len(self.lessons)
+
+
+# The processed lesson plan as a list of Lesson records, grouped by week once up front. The
+# pipeline passes this between stages instead of a DataFrame; from_frame and to_frame convert at
+# the edges. Weeks are kept in ascending order, like DataFrame.groupby("week").
+class LessonPlan:
+    def __init__(self, lessons, columns=None):
+        self.lessons = list(lessons)
+        self.columns = list(columns) if columns is not None else None
+
+        by_week = {}
+        for lesson in self.lessons:
+            by_week.setdefault(lesson.week, []).append(lesson)
+        self.weeks = {number: Week(number, by_week[number]) for number in sorted(by_week)}
+
+    @classmethod
+    def from_frame(cls, data):
+        return cls(map(Lesson, data.to_dict("records")), columns=data.columns)
+
+    def to_frame(self):
+        import pandas as pd
+
+        return pd.DataFrame([dict(lesson) for lesson in self.lessons], columns=self.columns)
+
+    def select(self, week_numbers):
+        week_numbers = set(week_numbers)
+        lessons = [lesson for lesson in self.lessons if lesson.week in week_numbers]
+        return LessonPlan(lessons, self.columns)
+
+    def filenames(self):
+        # Each source file once, in order of first use
+        return list(dict.fromkeys(f for week in self.weeks.values() for f in week.filenames()))
+
+    def __len__(self):
+        return len(self.lessons)
+
+
+def as_lesson_plan(data):
+    if isinstance(data, LessonPlan):
+        return data
+    return LessonPlan.from_frame(data)
+
+
+# The single week held by data, which may be a Week, a LessonPlan or a DataFrame
+def as_week(data):
+    if isinstance(data, Week):
+        return data
+
+    weeks = list(as_lesson_plan(data).weeks.values())
+    if len(weeks) != 1:
+        raise ValueError(f"Expected the lessons of a single week, found {len(weeks)} weeks")
+    return weeks[0]
@@ -1,13 +1,37 @@
 import logging
 import os
+import re
+from bisect import bisect_left
+from itertools import islice, takewhile
 
 import bibtexparser
 import yaml
+from bibtexparser.bibdatabase import STANDARD_TYPES
+
+from textbook_assembler.utils import tracing
+from textbook_assembler.utils.cache import (
+    DEFAULT_CACHE_SIZE,
+    BibtexEntryCache,
+    hash_file,
+    hash_payload,
+)
 
 _log = logging.getLogger("textbook_assembler")
 
+# The start of an entry: its type, the opening delimiter and the citation key. Entries are assumed
+# to start on their own line, which is how every bibtex file we've seen is laid out.
+BIBTEX_ENTRY_START = re.compile(
+    r"^[ \t]*@[ \t]*(?P<type>\w+)[ \t]*(?P<open>[{(])[ \t]*(?P<id>[^,\s{}()=]*)", re.MULTILINE
+)
+BIBTEX_DELIMITERS = re.compile(r'[{}()"]')
+# Part of the key of parsed entries kept on disk, with the bibtexparser version, and bumped when
+# the scanner changes which entries it finds, so entries it got wrong before are parsed again
+BIBTEX_SCANNER_VERSION = 2
+
 
+@tracing.traced()
 def load_reference_list(path):
+    tracing.count(bytes_read=os.path.getsize(path))
     with open(path) as file:
         refs = yaml.safe_load(file)
 
@@ -51,18 +75,219 @@ def find_by_partial_name(file_name, all_files):
         return all_files[idx]
 
 
+# Case-insensitive lookup over a directory listing, built once and shared by every reference. Exact
+# names are a dict lookup and "..." prefixes are a bisect into the sorted lowercase names, so
+# resolving a reference list costs O(refs * log(files)) instead of O(refs * files).
+class FilenameIndex:
+    def __init__(self, all_files):
+        self._exact = {}
+        for fname in all_files:
+            self._exact.setdefault(fname.lower(), fname)
+
+        self._sorted = sorted((fname.lower(), fname) for fname in all_files)
+        self._keys = [lower for lower, _ in self._sorted]
+
+    def __len__(self):
+        return len(self._keys)
+
+    def find_by_full_name(self, file_name):
+        return self._exact.get(file_name.lower())
+
+    def find_by_partial_name(self, file_name):
+        assert file_name.endswith("...")
+
+        prefix = file_name.lower().replace("...", "")
+        start = bisect_left(self._keys, prefix)
+        # Names sharing the prefix sit together from start, so the scan stops at the first one
+        # without it rather than copying the rest of the listing
+        candidates = takewhile(
+            lambda item: item[0].startswith(prefix), islice(self._sorted, start, None)
+        )
+        matches = list(islice(candidates, 2))
+
+        if len(matches) > 1:
+            # Collect every candidate only once we know the error is going to be raised
+            matches += candidates
+            match_names = [lower for lower, _ in matches]
+            raise ValueError(
+                f'Ambiguous partial file name, found two possible matches: {", ".join(match_names)}'
+            )
+        elif len(matches) == 0:
+            return
+
+        return matches[0][1]
+
+    def find(self, file_name):
+        if file_name.endswith("..."):
+            return self.find_by_partial_name(file_name)
+        return self.find_by_full_name(file_name)
+
+
+@tracing.traced()
 def load_bibtex_data(bibtex_path):
+    tracing.count(bytes_read=os.path.getsize(bibtex_path))
     with open(bibtex_path) as file:
         bibtex_data = bibtexparser.load(file)
 
     return bibtex_data
 
 
+# Entries of a bibtex file that were parsed for a set of IDs. ids lists every entry in the file,
+# so references that are missing can still be told apart from entries that are just unused.
+class BibtexEntries:
+    def __init__(self, entries, ids):
+        self.entries = entries
+        self.ids = ids
+
+
+def _entry_end(text, open_at):
+    # Braces nest everywhere. Entries opened with "(" can also hold parentheses in quoted values,
+    # which are only delimited by quotes outside of braces.
+    closing = "}" if text[open_at] == "{" else ")"
+    depth = 0
+    quoted = False
+    for match in BIBTEX_DELIMITERS.finditer(text, open_at + 1):
+        char = match.group()
+        if char == '"':
+            if closing == ")" and depth == 0:
+                quoted = not quoted
+        elif depth == 0 and char == closing and not quoted:
+            return match.end()
+        elif char == "{":
+            depth += 1
+        elif char == "}":
+            depth -= 1
+
+    return len(text)
+
+
+# Finds where each entry starts without parsing any of them. Returns the starts of the entries
+# bibtexparser would keep, by ID in file order, and of the @string macros they may refer to.
+def scan_bibtex(text):
+    entries = {}
+    macros = []
+    for match in BIBTEX_ENTRY_START.finditer(text):
+        kind = match["type"].lower()
+        if kind == "string":
+            macros.append(match)
+        elif kind in STANDARD_TYPES:
+            entries.setdefault(match["id"], []).append(match)
+
+    return entries, macros
+
+
+def _parse_entries(text, starts, macros):
+    blocks = [text[m.start() : _entry_end(text, m.start("open"))] for m in macros + starts]
+    return bibtexparser.loads("\n\n".join(blocks)).entries
+
+
+# Parses only the entries whose ID is in ids, so loading a large shared bibliography costs about
+# as much as the entries a course cites rather than the whole file
+@tracing.traced()
+def load_bibtex_entries(bibtex_path, ids):
+    tracing.count(bytes_read=os.path.getsize(bibtex_path))
+    with open(bibtex_path) as file:
+        text = file.read()
+
+    entries, macros = scan_bibtex(text)
+    starts = sorted(
+        (m for entry_id in set(ids) for m in entries.get(entry_id, [])), key=lambda m: m.start()
+    )
+    return BibtexEntries(_parse_entries(text, starts, macros), list(entries))
+
+
+# Parsed bibtex keyed by path and file stat, so builds in one process that share a bibtex file
+# only parse it once. Callers only read the parsed entries, so the same object is handed to each
+# of them. Loading with ids only parses those entries, on top of the ones parsed before, and with a
+# cache_dir the parsed entries are also kept on disk by the file's hash for later builds.
+class BibtexCache:
+    def __init__(self, cache_dir=None, max_bytes=DEFAULT_CACHE_SIZE):
+        self.parse_count = 0
+        self.entry_cache = BibtexEntryCache(cache_dir, max_bytes) if cache_dir else None
+        self._entries = {}
+        self._scanned = {}
+
+    def _stamp(self, bibtex_path):
+        stat = os.stat(bibtex_path)
+        return os.path.abspath(bibtex_path), (stat.st_size, stat.st_mtime_ns)
+
+    def load(self, bibtex_path, ids=None):
+        if ids is not None:
+            return self.load_entries(bibtex_path, ids)
+
+        key, stamp = self._stamp(bibtex_path)
+        cached = self._entries.get(key)
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+
+        bibtex_data = load_bibtex_data(bibtex_path)
+        self.parse_count += 1
+        self._entries[key] = (stamp, bibtex_data)
+
+        return bibtex_data
+
+    def _scanned_state(self, bibtex_path):
+        key, stamp = self._stamp(bibtex_path)
+        cached = self._scanned.get(key)
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+
+        state = None
+        digest = None
+        if self.entry_cache is not None:
+            digest = hash_payload(
+                {
+                    "bibtex": hash_file(bibtex_path),
+                    "bibtexparser": bibtexparser.__version__,
+                    "scanner": BIBTEX_SCANNER_VERSION,
+                }
+            )
+            state = self.entry_cache.get(digest)
+        if state is None:
+            state = {"ids": None, "entries": {}}
+        state["digest"] = digest
+        self._scanned[key] = (stamp, state)
+
+        return state
+
+    @tracing.traced("bibtex_cache.load_entries")
+    def load_entries(self, bibtex_path, ids):
+        state = self._scanned_state(bibtex_path)
+        ids = set(ids)
+        known = set(state["ids"]) if state["ids"] is not None else None
+        needed = {i for i in ids - set(state["entries"]) if known is None or i in known}
+
+        if known is None or len(needed) > 0:
+            loaded = load_bibtex_entries(bibtex_path, needed)
+            self.parse_count += 1
+            state["ids"] = loaded.ids
+            # IDs bibtexparser rejected are recorded too, so they aren't parsed again every build
+            for entry_id in needed:
+                state["entries"].setdefault(entry_id, [])
+            for entry in loaded.entries:
+                state["entries"].setdefault(entry["ID"], []).append(entry)
+            if self.entry_cache is not None:
+                self.entry_cache.put(
+                    state["digest"], {"ids": state["ids"], "entries": state["entries"]}
+                )
+
+        rejected = [i for i in state["ids"] if i in ids and state["entries"].get(i) == []]
+        if len(rejected) > 0:
+            _log.warning(
+                f"Could not parse the bibtex entries {', '.join(rejected)} in {bibtex_path}"
+            )
+
+        entries = [entry for i in state["ids"] if i in ids for entry in state["entries"].get(i, [])]
+        return BibtexEntries(entries, state["ids"])
+
+
+@tracing.traced()
 def match_references_to_pdf_filenames(refs, all_files):
+    index = all_files if isinstance(all_files, FilenameIndex) else FilenameIndex(all_files)
+
     out = {}
     for ref, maybe_path in refs.items():
-        f = find_by_partial_name if maybe_path.endswith("...") else find_by_full_name
-        full_name = f(maybe_path, all_files)
+        full_name = index.find(maybe_path)
         if full_name is None:
             raise ValueError(
                 f"{maybe_path} not found among PDF files in source directory. Check for typos?"
@@ -74,7 +299,8 @@ def match_references_to_pdf_filenames(refs, all_files):
 
 def get_referenced_bibtex_data(bibtex_data, ref_dict):
     bibtex_dict = bibtex_data.entries
-    bibtex_ids = [item.get("ID", None) for item in bibtex_dict]
+    # Scanned files list every ID without having parsed every entry
+    bibtex_ids = getattr(bibtex_data, "ids", None) or [item.get("ID", None) for item in bibtex_dict]
     ref_set = set(ref_dict.keys())
     id_set = set(bibtex_ids)
     missing = ref_set - id_set
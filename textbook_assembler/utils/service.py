@@ -0,0 +1,263 @@
+import asyncio
+import json
+import logging
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from textbook_assembler.utils.cache import OutputStore, hash_file, hash_payload
+from textbook_assembler.utils.constants import DEFAULT_HOST, DEFAULT_PORT
+
+_log = logging.getLogger("textbook_assembler")
+
+DEFAULT_OUTPUT_CACHE_SIZE = 2 * 1024 * 1024 * 1024
+MAX_BODY_SIZE = 1024 * 1024
+OUTPUT_CHUNK_SIZE = 1024 * 1024
+
+STATUS_REASONS = {
+    200: "OK",
+    304: "Not Modified",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    413: "Payload Too Large",
+    500: "Internal Server Error",
+}
+OUTPUT_ROUTE = re.compile(r"^/outputs/([0-9a-f]{64})\.pdf$")
+
+
+class HttpError(Exception):
+    def __init__(self, status, message):
+        self.status = status
+        super().__init__(message)
+
+
+def _json_body(payload):
+    return json.dumps(payload).encode(), "application/json"
+
+
+async def read_request(reader):
+    request_line = await reader.readline()
+    if not request_line:
+        return None
+    try:
+        method, target, _ = request_line.decode("latin-1").split()
+    except ValueError:
+        raise HttpError(400, "Malformed request line")
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        key, _, value = line.decode("latin-1").partition(":")
+        headers[key.strip().lower()] = value.strip()
+
+    length = int(headers.get("content-length", 0) or 0)
+    if length > MAX_BODY_SIZE:
+        raise HttpError(413, "Request body too large")
+    body = await reader.readexactly(length) if length > 0 else b""
+
+    return method.upper(), target.split("?")[0], headers, body
+
+
+async def _write_file(writer, file):
+    # Chunks are read in a thread, so sending a large book neither blocks the event loop nor holds
+    # the whole file in memory
+    loop = asyncio.get_running_loop()
+    while True:
+        chunk = await loop.run_in_executor(None, file.read, OUTPUT_CHUNK_SIZE)
+        if not chunk:
+            break
+        writer.write(chunk)
+        await writer.drain()
+
+
+# Writes a response whose body is either bytes or an open file, which is sent in chunks and closed
+async def write_response(writer, status, body=b"", content_type=None, headers=None):
+    try:
+        lines = [f"HTTP/1.1 {status} {STATUS_REASONS.get(status, '')}"]
+        if content_type is not None:
+            lines.append(f"Content-Type: {content_type}")
+        for key, value in (headers or {}).items():
+            lines.append(f"{key}: {value}")
+        if isinstance(body, bytes):
+            lines.append(f"Content-Length: {len(body)}")
+        else:
+            lines.append(f"Content-Length: {os.fstat(body.fileno()).st_size}")
+        lines.append("Connection: close")
+
+        head = ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+        if isinstance(body, bytes):
+            writer.write(head + body)
+            await writer.drain()
+        else:
+            writer.write(head)
+            await _write_file(writer, body)
+    finally:
+        if not isinstance(body, bytes):
+            body.close()
+
+
+# Serves builds over HTTP on a local port. POST /build takes a JSON build config, which
+# config_to_kwargs turns into keyword arguments for assemble_textbook, and answers once the
+# textbook is built. Finished PDFs are stored under their sha256 and served from
+# GET /outputs/<sha256>.pdf with that hash as the ETag.
+#
+# Builds run in a pool of max_workers processes. Requests that resolve to the same build while it
+# is running wait for that build instead of starting another one, and every distinct build keeps a
+# working directory so repeated requests only rebuild what changed.
+class BuildService:
+    def __init__(
+        self,
+        config_to_kwargs,
+        work_dir,
+        max_workers=1,
+        cache_size=DEFAULT_OUTPUT_CACHE_SIZE,
+    ):
+        self.config_to_kwargs = config_to_kwargs
+        self.work_dir = work_dir
+        self.max_workers = max(1, max_workers)
+        self.outputs = OutputStore(os.path.join(work_dir, "outputs"), cache_size)
+        self.builds_started = 0
+        self.port = None
+        self._in_flight = {}
+        self._pool = None
+        self._server = None
+
+    def build_key(self, kwargs):
+        # The output path is chosen by the service, so it is not part of what makes builds equal
+        return hash_payload({k: v for k, v in kwargs.items() if k != "out_path"})
+
+    async def build(self, config):
+        try:
+            kwargs = self.config_to_kwargs(config)
+        except (ValueError, TypeError, SystemExit) as e:
+            raise HttpError(400, f"Invalid build config: {e}")
+
+        key = self.build_key(kwargs)
+        task = self._in_flight.get(key)
+        coalesced = task is not None
+        if task is None:
+            task = asyncio.ensure_future(self._run_build(key, kwargs))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+
+        result = await asyncio.shield(task)
+        return {**result, "coalesced": coalesced}
+
+    async def _run_build(self, key, kwargs):
+        from textbook_assembler.utils.batch import build_in_worker
+
+        self.builds_started += 1
+        build_dir = os.path.join(self.work_dir, "builds", key)
+        os.makedirs(build_dir, exist_ok=True)
+        kwargs = {
+            **kwargs,
+            "out_path": os.path.join(build_dir, "textbook.pdf"),
+            "incremental": True,
+        }
+
+        start = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(self._pool, build_in_worker, key, kwargs)
+        if "error" in result:
+            raise HttpError(500, f"Build failed: {result['error']}")
+
+        digest = await loop.run_in_executor(None, hash_file, kwargs["out_path"])
+        if not os.path.isfile(self.outputs.path_for(digest)):
+            await loop.run_in_executor(None, self.outputs.store, digest, kwargs["out_path"])
+
+        report = result["report"]
+        return {
+            "id": digest,
+            "url": f"/outputs/{digest}.pdf",
+            "up_to_date": report["up_to_date"],
+            "pages": report.get("pages"),
+            "seconds": time.perf_counter() - start,
+        }
+
+    async def handle(self, reader, writer):
+        try:
+            request = await read_request(reader)
+            if request is not None:
+                status, body, content_type, headers = await self.route(*request)
+                await write_response(writer, status, body, content_type, headers)
+        except HttpError as e:
+            await write_response(writer, e.status, *_json_body({"error": str(e)}))
+        except Exception as e:
+            _log.exception("Unexpected error while handling request")
+            await write_response(writer, 500, *_json_body({"error": str(e)}))
+        finally:
+            writer.close()
+
+    async def route(self, method, path, headers, body):
+        if path == "/health":
+            return (200, *_json_body({"status": "ok", "builds": len(self._in_flight)}), None)
+
+        if path == "/build":
+            if method != "POST":
+                raise HttpError(405, "Use POST to request a build")
+            try:
+                config = json.loads(body or b"{}")
+            except ValueError:
+                raise HttpError(400, "Build config is not valid JSON")
+            if not isinstance(config, dict):
+                raise HttpError(400, "Build config must be a JSON object")
+            return (200, *_json_body(await self.build(config)), None)
+
+        match = OUTPUT_ROUTE.match(path)
+        if match is not None:
+            if method != "GET":
+                raise HttpError(405, "Outputs can only be read")
+            return await self.serve_output(match.group(1), headers)
+
+        raise HttpError(404, f"No route for {path}")
+
+    async def serve_output(self, digest, headers):
+        etag = f'"{digest}"'
+        # Outputs are content addressed, so an entry never changes once it exists
+        response_headers = {"ETag": etag, "Cache-Control": "public, max-age=31536000, immutable"}
+        if etag in [tag.strip() for tag in headers.get("if-none-match", "").split(",")]:
+            if os.path.isfile(self.outputs.path_for(digest)):
+                return 304, b"", None, response_headers
+
+        file = await asyncio.get_running_loop().run_in_executor(None, self.outputs.open, digest)
+        if file is None:
+            raise HttpError(404, f"No output with id {digest}")
+        return 200, file, "application/pdf", response_headers
+
+    async def start(self, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        # Workers are started before the server opens any sockets. Forked workers would otherwise
+        # inherit client connections and keep them open after the service has answered.
+        self._pool = ProcessPoolExecutor(max_workers=self.max_workers)
+        await asyncio.get_running_loop().run_in_executor(self._pool, os.getpid)
+
+        self._server = await asyncio.start_server(self.handle, host, port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        _log.info(f"Build service listening on http://{host}:{self.port}")
+        return self._server
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+
+
+def serve(config_to_kwargs, work_dir, host=DEFAULT_HOST, port=DEFAULT_PORT, max_workers=1):
+    async def main():
+        service = BuildService(config_to_kwargs, work_dir, max_workers=max_workers)
+        server = await service.start(host, port)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            await service.close()
+
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        _log.info("Build service stopped")
@@ -0,0 +1,134 @@
+import logging
+
+from pypdf import PdfWriter
+from pypdf.generic import ArrayObject, DictionaryObject, IndirectObject, StreamObject
+
+from textbook_assembler.utils.dedup import (
+    find_duplicates,
+    is_mergeable,
+    merge_duplicates,
+)
+
+_log = logging.getLogger("textbook_assembler")
+
+
+# A PdfWriter that writes finished objects to its output stream as soon as flush() is called and
+# then drops them, so memory holds at most the objects added since the last flush. The catalog,
+# the page tree root, the document info and everything reachable from the catalog other than the
+# pages themselves (outlines, name trees, forms) are still mutable after a flush, so they stay in
+# memory and are written by close().
+#
+# With dedupe=True each flush also shares objects that are identical to one written earlier. Only
+# the digests of written objects are kept, so this costs a few dozen bytes per object. An
+# OutputOptimizer passed as optimizer shrinks the streams of each batch of pages before they are
+# written.
+class StreamingPdfWriter(PdfWriter):
+    def __init__(self, stream, dedupe=False, optimizer=None):
+        super().__init__()
+        self._stream = stream
+        self._offsets = {}
+        self._released_pages = 0
+        self._digests = {}
+        self.dedupe = dedupe
+        self.optimizer = optimizer
+        self.dedupe_stats = {"objects": 0, "bytes_saved": 0}
+        self.flushed_objects = 0
+
+        self._stream.write(self.pdf_header.encode() + b"\n")
+        self._stream.write(b"%\xE2\xE3\xCF\xD3\n")
+
+    def _pinned_idnums(self):
+        pinned = {self._root_object.indirect_reference.idnum, self._pages.idnum}
+        if self._info_obj is not None:
+            pinned.add(self._info_obj.indirect_reference.idnum)
+
+        stack = [value for key, value in self._root_object.items() if key != "/Pages"]
+        while stack:
+            obj = stack.pop()
+            if isinstance(obj, IndirectObject):
+                if obj.idnum in pinned or self._objects[obj.idnum - 1] is None:
+                    continue
+                target = self._objects[obj.idnum - 1]
+                if isinstance(target, StreamObject) or (
+                    isinstance(target, DictionaryObject) and target.get("/Type") == "/Page"
+                ):
+                    continue
+                pinned.add(obj.idnum)
+                obj = target
+
+            if isinstance(obj, DictionaryObject):
+                stack.extend(obj.values())
+            elif isinstance(obj, ArrayObject):
+                stack.extend(obj)
+
+        return pinned
+
+    def _write_object(self, idnum, obj):
+        self._offsets[idnum] = self._stream.tell()
+        self._stream.write(f"{idnum} 0 obj\n".encode())
+        obj.write_to_stream(self._stream)
+        self._stream.write(b"\nendobj\n")
+
+    def _resolve_pending_links(self):
+        self._resolve_links()
+        # These, and the original_page pypdf keeps on every cloned page, hold references into the
+        # source readers, which would otherwise stay alive for the rest of the build
+        self._unresolved_links.clear()
+        self._merged_in_pages.clear()
+        for page in self.flattened_pages[self._released_pages :]:
+            page.__dict__.pop("original_page", None)
+        self._released_pages = len(self.flattened_pages)
+
+    def _deduplicate(self, pinned):
+        candidates = [
+            idnum
+            for idnum, obj in enumerate(self._objects, start=1)
+            if idnum not in pinned and is_mergeable(obj)
+        ]
+        canon, self._digests = find_duplicates(self._objects, candidates, known=self._digests)
+        self.dedupe_stats["objects"] += len(canon)
+        self.dedupe_stats["bytes_saved"] += merge_duplicates(self, canon)
+
+    def _prepare(self, pinned):
+        if self.dedupe:
+            self._deduplicate(pinned)
+        if self.optimizer is not None:
+            unpinned = [idnum for idnum in range(1, len(self._objects) + 1) if idnum not in pinned]
+            self.optimizer.optimize(self, unpinned)
+
+    def flush(self):
+        self._resolve_pending_links()
+        pinned = self._pinned_idnums()
+        self._prepare(pinned)
+
+        for idnum, obj in enumerate(self._objects, start=1):
+            if obj is None or idnum in pinned:
+                continue
+            self._write_object(idnum, obj)
+            self._objects[idnum - 1] = None
+            self.flushed_objects += 1
+
+        # Translations map source objects onto writer objects that are no longer in memory, so
+        # anything appended after a flush is cloned afresh.
+        self._id_translated = {}
+        self._stream.flush()
+
+    def close(self):
+        self._resolve_pending_links()
+        self._prepare(self._pinned_idnums())
+        for idnum, obj in enumerate(self._objects, start=1):
+            if obj is not None:
+                self._write_object(idnum, obj)
+
+        xref_location = self._stream.tell()
+        self._stream.write(b"xref\n")
+        self._stream.write(f"0 {len(self._objects) + 1}\n".encode())
+        self._stream.write(f"{0:0>10} {65535:0>5} f \n".encode())
+        for idnum in range(1, len(self._objects) + 1):
+            if idnum in self._offsets:
+                self._stream.write(f"{self._offsets[idnum]:0>10} {0:0>5} n \n".encode())
+            else:
+                self._stream.write(f"{0:0>10} {1:0>5} f \n".encode())
+
+        self._write_trailer(self._stream, xref_location)
+        self._stream.flush()
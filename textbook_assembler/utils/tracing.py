@@ -0,0 +1,252 @@
+import functools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # pragma: nocover
+    resource = None
+
+_log = logging.getLogger("textbook_assembler")
+
+COUNTERS = ("bytes_read", "bytes_written", "pages")
+
+# The tracer that span() and count() report to. It is None unless a build runs inside tracing(),
+# in which case instrumented code pays for a single global lookup per span and nothing else.
+_tracer = None
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+    def add(self, **counters):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def span(span_name, **attrs):
+    if _tracer is None:
+        return _NULL_SPAN
+
+    return _tracer.span(span_name, **attrs)
+
+
+def count(**counters):
+    if _tracer is not None:
+        _tracer.count(**counters)
+
+
+def traced(name=None):
+    def decorator(f):
+        span_name = name or f.__name__
+
+        @functools.wraps(f)
+        def wrapper(*args, **kwargs):
+            if _tracer is None:
+                return f(*args, **kwargs)
+            with _tracer.span(span_name):
+                return f(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def get_tracer():
+    return _tracer
+
+
+@contextmanager
+def tracing(tracer=None):
+    global _tracer
+
+    previous = _tracer
+    _tracer = tracer if tracer is not None else Tracer()
+    try:
+        yield _tracer
+    finally:
+        _tracer = previous
+
+
+def _children_cpu():
+    times = os.times()
+    return times.children_user + times.children_system
+
+
+# One timed region of a build. CPU time is split between this process and the child processes
+# (pdflatex, cover sheet workers) that were reaped while the span was open.
+class Span:
+    def __init__(self, tracer, name, attrs):
+        self.tracer = tracer
+        self.name = name
+        self.attrs = attrs
+        self.counters = {}
+        self.depth = 0
+        self.thread_id = threading.get_ident()
+        self.start = self.wall = self.cpu = self.children_cpu = None
+
+    def __enter__(self):
+        self.depth = self.tracer._push(self)
+        self.start = time.perf_counter()
+        self._cpu_start = time.process_time()
+        self._children_start = _children_cpu()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.wall = time.perf_counter() - self.start
+        self.cpu = time.process_time() - self._cpu_start
+        self.children_cpu = _children_cpu() - self._children_start
+        if exc_type is not None:
+            self.attrs["error"] = exc_type.__name__
+        self.tracer._pop(self)
+        return False
+
+    def add(self, **counters):
+        for key, value in counters.items():
+            self.counters[key] = self.counters.get(key, 0) + value
+
+
+# Collects finished spans for a build. Spans nest per thread, and count() adds to the innermost
+# open span. Subclasses can override finish() to forward spans somewhere else as they complete.
+class Tracer:
+    def __init__(self):
+        self.spans = []
+        self.origin = time.perf_counter()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def _stack(self):
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    def _push(self, span):
+        stack = self._stack()
+        stack.append(span)
+        return len(stack) - 1
+
+    def _pop(self, span):
+        stack = self._stack()
+        if stack and stack[-1] is span:
+            stack.pop()
+        self.finish(span)
+
+    def finish(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    def span(self, span_name, **attrs):
+        return Span(self, span_name, attrs)
+
+    def count(self, **counters):
+        stack = self._stack()
+        if stack:
+            stack[-1].add(**counters)
+
+    def to_chrome_trace(self):
+        pid = os.getpid()
+        events = []
+        for s in sorted(self.spans, key=lambda s: s.start):
+            args = {**s.attrs, **s.counters}
+            args["cpu_ms"] = round(s.cpu * 1000, 3)
+            if s.children_cpu > 0:
+                args["children_cpu_ms"] = round(s.children_cpu * 1000, 3)
+            events.append(
+                {
+                    "name": s.name,
+                    "cat": "textbook_assembler",
+                    "ph": "X",
+                    "ts": round((s.start - self.origin) * 1e6, 3),
+                    "dur": round(s.wall * 1e6, 3),
+                    "pid": pid,
+                    "tid": s.thread_id,
+                    "args": {key: _jsonable(value) for key, value in args.items()},
+                }
+            )
+
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def write(self, path):
+        with open(path, "w") as file:
+            json.dump(self.to_chrome_trace(), file, indent=1)
+
+    def summarize(self):
+        # Spans with the same name are aggregated, in the order the first of them started
+        rows = {}
+        for s in sorted(self.spans, key=lambda s: s.start):
+            row = rows.setdefault(
+                s.name,
+                {"name": s.name, "depth": s.depth, "calls": 0, "wall": 0.0, "cpu": 0.0},
+            )
+            row["depth"] = min(row["depth"], s.depth)
+            row["calls"] += 1
+            row["wall"] += s.wall
+            row["cpu"] += s.cpu + s.children_cpu
+            for key in COUNTERS:
+                if key in s.counters:
+                    row[key] = row.get(key, 0) + s.counters[key]
+
+        return list(rows.values())
+
+    def format_summary(self):
+        header = (
+            f"{'stage':<44} {'calls':>6} {'wall (s)':>10} {'cpu (s)':>10} "
+            f"{'read':>10} {'written':>10} {'pages':>7}"
+        )
+        lines = [header, "-" * len(header)]
+        for row in self.summarize():
+            name = "  " * row["depth"] + row["name"]
+            lines.append(
+                f"{name:<44} {row['calls']:>6} {row['wall']:>10.3f} {row['cpu']:>10.3f} "
+                f"{_format_count(row.get('bytes_read'), True):>10} "
+                f"{_format_count(row.get('bytes_written'), True):>10} "
+                f"{_format_count(row.get('pages')):>7}"
+            )
+
+        return "\n".join(lines)
+
+
+def peak_rss_bytes():
+    if resource is None:
+        return None
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and in kilobytes everywhere else
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def format_bytes(n_bytes):
+    if n_bytes is None:
+        return "unknown"
+    for unit in ["B", "KB", "MB", "GB"]:
+        if abs(n_bytes) < 1024 or unit == "GB":
+            return f"{n_bytes:.1f} {unit}" if unit != "B" else f"{n_bytes} B"
+        n_bytes /= 1024
+
+
+def _jsonable(value):
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    try:
+        return value.item()
+    except AttributeError:
+        return str(value)
+
+
+def _format_count(value, as_bytes=False):
+    if value is None:
+        return ""
+    if as_bytes:
+        return format_bytes(value)
+    return str(value)
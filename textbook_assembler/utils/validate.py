@@ -0,0 +1,103 @@
+import logging
+
+from textbook_assembler.utils import tracing
+from textbook_assembler.utils.data import (
+    clean_string_data,
+    fill_page_numbers,
+    load_input_data,
+    page_range_errors,
+    validate_column_names,
+    validate_datatypes,
+)
+from textbook_assembler.utils.pdf_index import PdfIndex
+from textbook_assembler.utils.references import (
+    FilenameIndex,
+    get_pdf_names,
+    load_bibtex_entries,
+    load_reference_list,
+)
+
+_log = logging.getLogger("textbook_assembler")
+
+
+def _match_files(refs, pdf_path):
+    files = FilenameIndex(get_pdf_names(pdf_path))
+    matched = {}
+    errors = []
+    for ref, name in refs.items():
+        try:
+            fname = files.find(name)
+        except ValueError as e:
+            errors.append(f"{ref}: {e}")
+            continue
+        if fname is None:
+            errors.append(f"{ref}: {name} not found among PDF files in {pdf_path}")
+        else:
+            matched[ref] = fname
+
+    return matched, errors
+
+
+# Checks the inputs of a build the way assembling it would: the lesson plan's columns and types,
+# that every reference resolves to a source PDF and a bibtex entry, and that page ranges fit the
+# sources. Page counts come from the PDF index, so sources are only parsed, and pypdf only
+# imported, when they are new or changed since the index was written. No PDF is written or cover
+# sheet compiled. Returns every problem found rather than stopping at the first one.
+@tracing.traced()
+def validate_inputs(data_path, pdf_path, ref_path, bibtex_path, index_path=None):
+    try:
+        data = load_input_data(data_path)
+        validate_column_names(data)
+        validate_datatypes(data)
+    except (KeyError, ValueError) as e:
+        return [f"{data_path}: {e.args[0]}"]
+    data = clean_string_data(data)
+    references = set(data.reference.dropna())
+
+    refs = load_reference_list(ref_path) or {}
+    matched, errors = _match_files(refs, pdf_path)
+    unlisted = references - set(refs)
+    if len(unlisted) > 0:
+        # These rows still get a cover sheet entry, they just have no pages to add
+        _log.warning(
+            f"References without a source PDF in {ref_path}: {', '.join(sorted(unlisted))}"
+        )
+
+    # Only the IDs are needed, which scanning finds without parsing any entry
+    bibtex_ids = set(load_bibtex_entries(bibtex_path, []).ids)
+    missing = references - bibtex_ids
+    if len(missing) > 0:
+        errors.append(f"References without a bibtex entry: {', '.join(sorted(missing))}")
+
+    data["filename"] = data["reference"].apply(matched.get)
+    data = data[data.filename.notna()]
+    index = PdfIndex(pdf_path, index_path=index_path)
+    index.refresh(data.filename.unique())
+    data = fill_page_numbers(data, pdf_path, index=index)
+    errors.extend(page_range_errors(data, index))
+
+    return errors
+
+
+# Validates each (name, assemble_textbook kwargs) pair in courses, logs every problem found and
+# returns them
+def validate_courses(courses):
+    errors = []
+    for name, kwargs in courses:
+        course_errors = validate_inputs(
+            kwargs["data_path"],
+            kwargs["pdf_path"],
+            kwargs["ref_path"],
+            kwargs["bibtex_path"],
+            index_path=kwargs.get("index_path"),
+        )
+        if len(courses) > 1:
+            course_errors = [f"{name}: {error}" for error in course_errors]
+        errors.extend(course_errors)
+
+    for error in errors:
+        _log.error(error)
+    if len(errors) == 0:
+        _log.info(f"Inputs of {len(courses)} course(s) are valid")
+
+    return errors
@@ -0,0 +1,129 @@
+import logging
+import os
+import tempfile
+import time
+
+_log = logging.getLogger("textbook_assembler")
+
+DEFAULT_INTERVAL = 0.5
+DEFAULT_DEBOUNCE = 0.5
+
+
+def _stat(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+# Polls the size and mtime of the build inputs and every file in the source directory. Polling
+# needs no extra dependencies and behaves the same on network shares, where file system events
+# are often missing.
+class Watcher:
+    def __init__(self, paths, pdf_path, interval=DEFAULT_INTERVAL, debounce=DEFAULT_DEBOUNCE):
+        self.paths = [path for path in paths if path]
+        self.pdf_path = pdf_path
+        self.interval = interval
+        self.debounce = debounce
+        self._state = self.snapshot()
+
+    def snapshot(self):
+        state = {path: _stat(path) for path in self.paths}
+        if os.path.isdir(self.pdf_path):
+            for fname in os.listdir(self.pdf_path):
+                # Editors leave hidden swap files next to the sources
+                if fname.startswith("."):
+                    continue
+                path = os.path.join(self.pdf_path, fname)
+                state[path] = _stat(path)
+
+        return state
+
+    def poll(self):
+        state = self.snapshot()
+        changed = {
+            path
+            for path in state.keys() | self._state.keys()
+            if state.get(path) != self._state.get(path)
+        }
+        self._state = state
+
+        return changed
+
+    def wait_for_changes(self):
+        changed = set()
+        while not changed:
+            time.sleep(self.interval)
+            changed = self.poll()
+
+        # Editors and sync tools often write a file several times in a row, so the build waits
+        # until the inputs have been quiet for the debounce period
+        quiet_since = time.monotonic()
+        while time.monotonic() - quiet_since < self.debounce:
+            time.sleep(min(self.interval, self.debounce))
+            more = self.poll()
+            if more:
+                changed |= more
+                quiet_since = time.monotonic()
+
+        return changed
+
+
+def _rebuild(resources, kwargs):
+    start = time.perf_counter()
+    try:
+        report = resources.build(kwargs)
+    except Exception as e:
+        _log.error(f"Build failed: {e}")
+        return None
+
+    seconds = time.perf_counter() - start
+    if report["up_to_date"]:
+        _log.info(f"Nothing to rebuild ({seconds:.2f}s)")
+    else:
+        _log.info(
+            f"Rebuilt {report['weeks_rebuilt']} week(s), reused {report['weeks_reused']}, "
+            f"wrote {report['out_path']} in {seconds:.2f}s"
+        )
+    return report
+
+
+# Builds the textbook, then rebuilds it whenever one of its inputs changes. Rebuilds are incremental
+# and reuse the readers, PDF index, parsed bibtex and cover sheet cache of earlier builds, so only
+# the weeks affected by a change are assembled again. Runs until interrupted, or for max_rebuilds
+# rebuilds if given.
+def watch(kwargs, interval=DEFAULT_INTERVAL, debounce=DEFAULT_DEBOUNCE, max_rebuilds=None):
+    from textbook_assembler.utils.batch import SharedResources
+
+    kwargs = {**kwargs, "incremental": True}
+    pdf_path = kwargs["pdf_path"]
+    watcher = Watcher(
+        [kwargs["data_path"], kwargs["ref_path"], kwargs["bibtex_path"]],
+        pdf_path,
+        interval=interval,
+        debounce=debounce,
+    )
+    resources = SharedResources()
+
+    with tempfile.TemporaryDirectory() as session_cache_dir:
+        kwargs["cache_dir"] = kwargs.get("cache_dir") or session_cache_dir
+        rebuilds = 0
+        try:
+            _rebuild(resources, kwargs)
+            while max_rebuilds is None or rebuilds < max_rebuilds:
+                _log.info(f"Watching for changes to the inputs of {kwargs['out_path']}")
+                changed = watcher.wait_for_changes()
+                _log.info(f"Changed: {', '.join(sorted(changed))}")
+
+                readers = resources.readers(pdf_path)
+                for path in changed:
+                    if os.path.abspath(os.path.dirname(path)) == os.path.abspath(pdf_path):
+                        readers.discard(os.path.basename(path))
+
+                _rebuild(resources, kwargs)
+                rebuilds += 1
+        except KeyboardInterrupt:
+            _log.info("Stopped watching")
+        finally:
+            resources.close()